@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+用 test_app.generate_tree 生成不同规模的测试文件夹，分别测量复制文件夹并清理、
+清理文件名和批量重命名的耗时、每秒处理文件数、os 模块文件函数的调用次数和内存峰值，
+结果保存为JSON，可以与其他版本的结果比较
+
+用法示例：
+    python benchmark.py --sizes 10k,100k --output bench.json
+    python benchmark.py --sizes 10k --compare 上个版本.json
+
+每项操作在单独的子进程中执行，内存峰值互不影响。调用次数在 os 模块层统计
+（scandir、stat、rename、open 等），不等于系统调用次数：os.DirEntry.stat() 等方法
+和 shutil 内部的调用不经过替换后的 os 函数，不计入；一次调用也可能对应多个系统调用。
+Linux上另外从 /proc/self/io 读取内核统计的读写系统调用次数和字节数。
+"""
+
+import argparse
+import builtins
+import functools
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from test_app import generate_tree
+
+
+# 默认的测试规模
+DEFAULT_SIZES = "10k,100k,1m"
+
+# 依次测量的操作；sync 在 copy_and_clean 之后对同一目标文件夹增量同步，测量没有变化时的耗时；
+# 清理文件名在重命名之前执行，此时文件名中还有"副图_1"
+OPERATIONS = ("copy_and_clean", "sync", "clean_filenames", "batch_rename")
+
+# 在 os 模块层统计的函数，open 同时统计内置的 open
+COUNTED_CALLS = ("scandir", "listdir", "stat", "lstat", "fstat", "open", "rename", "replace",
+                 "remove", "unlink", "rmdir", "mkdir", "utime", "chmod", "copy_file_range",
+                 "sendfile")
+
+# 与基准结果相比每秒处理文件数下降超过此比例时标记为性能退化
+REGRESSION_THRESHOLD = 0.10
+
+
+def parse_count(text):
+    """把 10k、1m 等文件数转换为整数"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000 * 1000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _install_call_counter():
+    """
+    把 os 模块中的文件函数替换为计数的包装函数，返回 {名称: itertools.count}
+
+    原函数在 os.supports_dir_fd 等集合中时，包装函数也加入这些集合，
+    按这些集合选择实现方式的代码在测量时与平时走相同的路径。
+    """
+    counters = {name: itertools.count() for name in COUNTED_CALLS}
+    capabilities = (os.supports_dir_fd, os.supports_fd, os.supports_follow_symlinks,
+                    os.supports_effective_ids)
+
+    def counting(func, counter):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # next() 在多个线程中调用也不会丢失计数
+            next(counter)
+            return func(*args, **kwargs)
+        return wrapper
+
+    for name in COUNTED_CALLS:
+        func = getattr(os, name, None)
+        if func is not None:
+            wrapper = counting(func, counters[name])
+            for supported in capabilities:
+                if func in supported:
+                    supported.add(wrapper)
+            setattr(os, name, wrapper)
+    builtins.open = counting(builtins.open, counters["open"])
+    return counters
+
+
+def _proc_io():
+    """读取 /proc/self/io 中的读写系统调用次数和字节数，不支持时返回空字典"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    return {key: int(fields[key]) for key in ("syscr", "syscw", "rchar", "wchar")
+            if key in fields}
+
+
+def _peak_rss():
+    """返回本进程的内存峰值（字节），不支持时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_operation(spec):
+    """
+    在当前进程中执行一项操作并返回测量结果，由子进程调用
+
+    spec 为 {"operation", "folder", "target", "workers", "low_memory"}。
+    """
+    import file_engine
+
+    io_before = _proc_io()
+    counters = _install_call_counter()
+    started = time.perf_counter()
+    operation = spec["operation"]
+    if operation == "copy_and_clean":
+        result = file_engine.copy_and_clean(spec["folder"], spec["target"], True, spec["workers"])
+    elif operation == "sync":
+        result = file_engine.sync_copy_and_clean(spec["folder"], spec["target"], spec["workers"])
+    elif operation == "clean_filenames":
+        result = file_engine.clean_filenames(spec["folder"], "副图_1")
+    else:
+        result = file_engine.batch_rename(spec["folder"], "品牌", "2024年01月15日", spec["workers"],
+                                          low_memory=spec["low_memory"])
+    seconds = time.perf_counter() - started
+    calls = {name: next(counter) for name, counter in counters.items()}
+    calls = {name: count for name, count in calls.items() if count}
+    io_after = _proc_io()
+    return {
+        "operation": operation,
+        "seconds": round(seconds, 4),
+        "processed": result.processed,
+        "skipped": result.skipped,
+        "failed": result.failed,
+        "bytes_copied": result.bytes_done,
+        "calls": calls,
+        "calls_total": sum(calls.values()),
+        "kernel_io": {key: io_after[key] - io_before[key] for key in io_after},
+        "peak_rss_bytes": _peak_rss(),
+    }
+
+
+def _run_child(spec):
+    """在子进程中执行一项操作，返回测量结果"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+        check=True, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout)
+
+
+def benchmark_size(count, workdir, args):
+    """生成 count 个文件的测试文件夹，依次测量每项操作，返回结果列表"""
+    source = os.path.join(workdir, f"source_{count}")
+    target = os.path.join(workdir, f"target_{count}")
+    # 保持每个文件夹的文件数随规模增长，子文件夹数固定为 depth 和 fanout 决定的数量
+    print(f"生成 {count} 个文件...", file=sys.stderr)
+    started = time.perf_counter()
+    tree = generate_tree(source, args.depth, args.fanout, total=count, sizes=args.file_size,
+                         marker_ratio=args.marker, seed=args.seed)
+    print(f"  生成耗时 {time.perf_counter() - started:.1f} 秒", file=sys.stderr)
+
+    results = []
+    try:
+        for operation in args.operations:
+            spec = {"operation": operation, "folder": source, "target": target,
+                    "workers": args.workers, "low_memory": args.low_memory}
+            measured = _run_child(spec)
+            measured["files"] = tree["files"]
+            measured["folders"] = tree["folders"]
+            measured["files_per_sec"] = round(tree["files"] / measured["seconds"], 1) \
+                if measured["seconds"] else None
+            print(f"  {operation}: {measured['seconds']:.2f} 秒，"
+                  f"{measured['files_per_sec']} 文件/秒，{measured['calls_total']} 次调用，"
+                  f"内存峰值 {_format_rss(measured['peak_rss_bytes'])}", file=sys.stderr)
+            results.append(measured)
+    finally:
+        if not args.keep:
+            shutil.rmtree(source, ignore_errors=True)
+            shutil.rmtree(target, ignore_errors=True)
+    return results
+
+
+def _format_rss(value):
+    """格式化内存峰值"""
+    return "未知" if value is None else f"{value / 1024 / 1024:.0f} MB"
+
+
+def _git_revision():
+    """返回当前代码的git版本，不是git仓库时返回 None"""
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def compare_reports(baseline, report):
+    """与基准结果比较每秒处理文件数，返回 (说明行列表, 是否有性能退化)"""
+    old = {(item["files"], item["operation"]): item for item in baseline.get("results", ())}
+    lines = []
+    regressed = False
+    for item in report["results"]:
+        before = old.get((item["files"], item["operation"]))
+        if not before or not before.get("files_per_sec") or not item["files_per_sec"]:
+            continue
+        change = item["files_per_sec"] / before["files_per_sec"] - 1
+        flag = ""
+        if change < -REGRESSION_THRESHOLD:
+            flag = "  <-- 性能退化"
+            regressed = True
+        lines.append(f"{item['operation']} {item['files']} 个文件: "
+                     f"{before['files_per_sec']} -> {item['files_per_sec']} 文件/秒"
+                     f"（{change:+.1%}）{flag}")
+    return lines, regressed
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="python benchmark.py",
+                                     description="文件批量重命名工具性能基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"测试的文件数，逗号分隔（默认 {DEFAULT_SIZES}）")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help=f"测量的操作，逗号分隔（默认 {','.join(OPERATIONS)}）")
+    parser.add_argument("--depth", type=int, default=3, help="子文件夹层数（默认 3）")
+    parser.add_argument("--fanout", type=int, default=10,
+                        help="每个文件夹的子文件夹数（默认 10）")
+    parser.add_argument("--file-size", default="0",
+                        help="文件大小分布，格式同 test_app.py generate --sizes（默认 0）")
+    parser.add_argument("--marker", type=float, default=0.5,
+                        help="文件名包含\"副图_1\"的比例（默认 0.5）")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子（默认 0）")
+    parser.add_argument("--workers", type=int, default=4, help="线程数（默认 4）")
+    parser.add_argument("--low-memory", action="store_true", help="批量重命名使用低内存模式")
+    parser.add_argument("--workdir", help="生成测试文件夹的位置（默认系统临时文件夹）")
+    parser.add_argument("--keep", action="store_true", help="测试后保留生成的文件夹")
+    parser.add_argument("--output", help="结果JSON的保存路径（默认打印到标准输出）")
+    parser.add_argument("--compare", metavar="JSON", help="与之前保存的结果比较")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    """命令行主函数，返回退出码；有性能退化时返回 2"""
+    args = build_parser().parse_args(argv)
+    if args.child:
+        print(json.dumps(run_operation(json.loads(args.child))))
+        return 0
+
+    args.operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    unknown = set(args.operations) - set(OPERATIONS)
+    if unknown:
+        print(f"错误: 未知的操作: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="file_renamer_bench_", dir=args.workdir)
+    results = []
+    try:
+        for count in (parse_count(size) for size in args.sizes.split(",")):
+            results.extend(benchmark_size(count, workdir, args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "revision": _git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"depth": args.depth, "fanout": args.fanout, "file_size": args.file_size,
+                   "marker": args.marker, "seed": args.seed, "workers": args.workers,
+                   "low_memory": args.low_memory},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"结果已保存: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            lines, regressed = compare_reports(json.load(f), report)
+        for line in lines:
+            print(line, file=sys.stderr)
+        return 2 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件批量重命名工具命令行入口
+不导入tkinter，可在无图形界面的服务器和定时任务中运行
+
+用法示例：
+    python -m cli copy-clean 源文件夹 目标文件夹 --overwrite --workers 8
+    python -m cli copy-clean 源文件夹 目标文件夹 --overwrite --background-clear
+    python -m cli copy-clean 源文件夹 目标文件夹 --sync
+    python -m cli rename 文件夹 --brand 品牌 --date 2024年01月15日
+    python -m cli rename 文件夹 --template "{brand}_{parent}_{exif_date:%Y%m%d}_{counter:3}{ext:lower}"
+    python -m cli clean 文件夹 --replace 副图_1 --replace 副图_2 --regex "_\\d+$"
+    python -m cli watch 文件夹 --brand 品牌
+    python -m cli rename 文件夹 --brand 品牌 --save-preset 每日重命名
+    python -m cli preset 每日重命名
+    python -m cli undo
+"""
+
+import argparse
+import os
+import signal
+import sys
+from datetime import datetime
+
+import file_engine
+import file_watch
+import name_replace
+import operation_stats
+import presets
+import rename_journal
+import rename_template
+
+
+def _print_plan(plan):
+    """打印计划中的所有操作，返回操作数"""
+    count = 0
+    for action in plan:
+        print(file_engine.format_action(action))
+        count += 1
+    print(f"共 {count} 项操作（预览模式，未修改任何文件）")
+    return count
+
+
+def _print_result(title, result, report=None):
+    """打印操作结果摘要和失败的文件，指定 report 时把结果和耗时统计写入JSON报告"""
+    print(title)
+    for line in file_engine.summarize_result(result):
+        print(line)
+    for path, error in result.errors:
+        print(f"处理失败: {path}, 错误: {error}", file=sys.stderr)
+    if report:
+        operation_stats.write_report(result, report)
+        print(f"统计报告: {report}")
+    if result.cancelled:
+        return 130
+    return 1 if result.failed else 0
+
+
+def _install_interrupt_handler(token):
+    """第一次 Ctrl+C 安全取消操作（处理完当前文件后停止），第二次立即中断"""
+    def handler(signum, frame):
+        print("\n正在取消，再次按 Ctrl+C 立即中断...", file=sys.stderr)
+        token.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGINT, handler)
+
+
+def _save_preset(args, operation, **fields):
+    """指定了 --save-preset 时把本次的参数保存为预设"""
+    if not args.save_preset:
+        return
+    presets.PresetStore().save(args.save_preset, presets.make_preset(operation, **fields))
+    print(f"已保存预设: {args.save_preset}")
+
+
+def run_copy_clean(args):
+    """复制文件夹并清理"""
+    args.sync = args.sync or args.checksum
+    _save_preset(args, "copy_and_clean", source=os.path.abspath(args.source),
+                 target=os.path.abspath(args.target), overwrite=args.overwrite,
+                 workers=args.workers, background_clear=args.background_clear,
+                 sync=args.sync, checksum=args.checksum)
+    if args.dry_run:
+        _print_plan(file_engine.plan_copy_and_clean(args.source, args.target, args.sync,
+                                                    args.checksum))
+        return 0
+
+    # 目标文件夹不为空时，必须显式指定 --overwrite 才会清空；同步模式只删除多余的项目
+    try:
+        result = file_engine.copy_and_clean(args.source, args.target, args.overwrite,
+                                            args.workers, token=args.token,
+                                            background_clear=args.background_clear,
+                                            sync=args.sync, checksum=args.checksum)
+    except file_engine.TargetNotEmptyError as e:
+        print(f"错误: {e}，使用 --overwrite 清空并覆盖，或使用 --sync 增量同步", file=sys.stderr)
+        return 1
+    title = "文件夹同步完成" if args.sync else "文件夹复制完成"
+    code = _print_result(f"{title}: {args.target}", result, args.report)
+    _wait_background_deletes()
+    return code
+
+
+def _wait_background_deletes():
+    """等待后台删除目标文件夹的旧内容，中断时留下的回收文件夹下次运行时继续删除"""
+    if file_engine.background_deletes_pending():
+        print("正在后台删除目标文件夹的旧内容...")
+        file_engine.wait_background_deletes()
+
+
+def run_rename(args):
+    """批量重命名文件"""
+    template = rename_template.RenameTemplate(args.template)
+    # 预设中没有指定日期时，每次运行使用当天日期
+    _save_preset(args, "batch_rename", folder=os.path.abspath(args.folder), brand=args.brand,
+                 date=args.date or "", template=args.template, workers=args.workers,
+                 incremental=args.incremental, low_memory=args.low_memory)
+    args.date = args.date or datetime.now().strftime("%Y年%m月%d日")
+    if args.incremental:
+        if args.dry_run:
+            _print_plan(file_engine.plan_incremental_rename(
+                args.folder, args.brand, args.date, args.index, template=template))
+            return 0
+        result = file_engine.incremental_rename(
+            args.folder, args.brand, args.date, args.index, args.workers, token=args.token,
+            journal=_journal_path(args, "incremental_rename"), template=template)
+        return _print_result("增量重命名完成", result, args.report)
+
+    if args.dry_run:
+        _print_plan(file_engine.plan_batch_rename(args.folder, args.brand, args.date,
+                                                  low_memory=args.low_memory, template=template))
+        return 0
+
+    result = file_engine.batch_rename(args.folder, args.brand, args.date, args.workers,
+                                      token=args.token, journal=_journal_path(args, "batch_rename"),
+                                      low_memory=args.low_memory, template=template)
+    return _print_result("批量重命名完成", result, args.report)
+
+
+def run_watch(args):
+    """监视文件夹，自动重命名新文件，按 Ctrl+C 停止"""
+    def on_batch(batch):
+        now = datetime.now().strftime("%H:%M:%S")
+        print(f"{now} 已重命名 {batch.processed} 个新文件" +
+              (f"，失败 {batch.failed} 个" if batch.failed else ""))
+        for path, error in batch.errors:
+            print(f"处理失败: {path}, 错误: {error}", file=sys.stderr)
+
+    template = rename_template.RenameTemplate(args.template)
+    print(f"正在监视 {args.folder}，按 Ctrl+C 停止")
+    result = file_watch.watch_folder(
+        args.folder, args.brand, args.date, args.index, args.settle,
+        max_workers=args.workers, on_batch=on_batch, token=args.token,
+        journal=_journal_path(args, "watch"), use_inotify=not args.poll, template=template)
+    print(f"监视已停止，共重命名 {result.processed} 个文件")
+    if args.report:
+        operation_stats.write_report(result, args.report)
+        print(f"统计报告: {args.report}")
+    return 1 if result.failed else 0
+
+
+def _clean_rules(args):
+    """汇总 --replace、--regex 和 --rules 指定的替换规则，都没有指定时删除 副图_1"""
+    rules = [name_replace.ReplaceRule(text) for text in args.replace or ()]
+    rules += [name_replace.ReplaceRule(pattern, regex=True) for pattern in args.regex or ()]
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            rules += name_replace.parse_rules(f.read())
+    return rules or [name_replace.ReplaceRule("副图_1")]
+
+
+def run_clean(args):
+    """清理文件名"""
+    replacer = name_replace.NameReplacer(_clean_rules(args))
+    _save_preset(args, "clean_filenames", folder=os.path.abspath(args.folder),
+                 rules=replacer.to_json())
+    if args.dry_run:
+        _print_plan(file_engine.plan_clean_filenames(args.folder, replacer))
+        return 0
+
+    result = file_engine.clean_filenames(args.folder, replacer, token=args.token,
+                                         journal=_journal_path(args, "clean_filenames"))
+    return _print_result("文件名清理完成", result, args.report)
+
+
+def run_preset(args):
+    """执行保存的预设"""
+    preset = presets.PresetStore().load(args.name)
+    if args.dry_run:
+        _print_plan(presets.plan_preset(preset))
+        return 0
+
+    operation = presets.journal_operation(preset)
+    journal = _journal_path(args, operation) if operation else None
+    try:
+        result = presets.run_preset(preset, token=args.token, journal=journal)
+    except file_engine.TargetNotEmptyError as e:
+        print(f"错误: {e}，预设没有设置覆盖目标文件夹", file=sys.stderr)
+        return 1
+    code = _print_result(f"预设 {args.name} 执行完成", result, args.report)
+    _wait_background_deletes()
+    return code
+
+
+def run_presets(args):
+    """列出或删除预设"""
+    store = presets.PresetStore()
+    if args.delete:
+        store.delete(args.delete)
+        print(f"已删除预设: {args.delete}")
+        return 0
+    for name in store.names():
+        if not args.verbose:
+            print(name)
+            continue
+        try:
+            preset = store.load(name)
+        except presets.PresetError as e:
+            print(f"{name}\t{e}")
+            continue
+        folders = preset.get("folder") or f"{preset['source']} -> {preset['target']}"
+        print(f"{name}\t{preset['operation']}\t{folders}")
+    return 0
+
+
+def _journal_path(args, operation):
+    """返回本次操作的日志路径，--no-journal 时返回 None"""
+    if args.no_journal:
+        return None
+    path = args.journal or rename_journal.new_journal_path(operation)
+    print(f"重命名日志: {path}")
+    return path
+
+
+def _find_journal(statuses, operations=None):
+    """返回最近一份状态在 statuses 中的日志，没有时返回 None；operations 限定操作名称"""
+    for path in rename_journal.list_journals(operations=operations):
+        try:
+            if rename_journal.journal_status(path) in statuses:
+                return path
+        except OSError:
+            continue
+    return None
+
+
+def run_undo(args):
+    """根据日志撤销批量重命名或文件名清理"""
+    path = args.journal or _find_journal({"finished", "cancelled", "interrupted"})
+    if path is None:
+        print("错误: 没有可以撤销的操作", file=sys.stderr)
+        return 1
+    print(f"撤销: {path}")
+    result = file_engine.undo_journal(path, token=args.token)
+    return _print_result("撤销完成", result, args.report)
+
+
+def run_resume(args):
+    """继续执行被中断或取消的操作"""
+    path = args.journal or _find_journal({"interrupted", "cancelled"},
+                                         rename_journal.RESUMABLE_OPERATIONS)
+    if path is None:
+        print("错误: 没有需要继续的操作", file=sys.stderr)
+        return 1
+    print(f"继续: {path}")
+    result = file_engine.resume_journal(path, token=args.token)
+    return _print_result("操作完成", result, args.report)
+
+
+def run_journals(args):
+    """列出日志文件夹中的日志和状态"""
+    labels = {"finished": "已完成", "cancelled": "已取消", "undone": "已撤销",
+              "interrupted": "未完成"}
+    for path in rename_journal.list_journals():
+        try:
+            status = labels[rename_journal.journal_status(path)]
+        except OSError as e:
+            status = f"无法读取: {e}"
+        print(f"{status}\t{path}")
+    return 0
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="文件批量重命名工具（命令行版）")
+    subparsers = parser.add_subparsers(dest="command", metavar="命令")
+    subparsers.required = True
+
+    copy_parser = subparsers.add_parser(
+        "copy-clean", help="复制文件夹结构和根目录文件，不复制子文件夹中的文件")
+    copy_parser.add_argument("source", help="源文件夹")
+    copy_parser.add_argument("target", help="目标文件夹")
+    copy_parser.add_argument("--overwrite", action="store_true",
+                             help="目标文件夹不为空时清空并覆盖")
+    copy_parser.add_argument("--background-clear", action="store_true",
+                             help="覆盖时把旧内容移入回收文件夹后立即开始复制，在后台删除旧内容")
+    copy_parser.add_argument("--sync", action="store_true",
+                             help="增量同步：只复制新增或修改的文件，删除目标文件夹中多余的项目")
+    copy_parser.add_argument("--checksum", action="store_true",
+                             help="同步时比较文件内容的校验值，而不是修改时间（同时启用 --sync）")
+    copy_parser.add_argument("--workers", type=int, default=file_engine.DEFAULT_COPY_WORKERS,
+                             help=f"并行复制线程数（默认 {file_engine.DEFAULT_COPY_WORKERS}）")
+    copy_parser.set_defaults(func=run_copy_clean)
+
+    rename_parser = subparsers.add_parser(
+        "rename", help="批量重命名为 品牌_文件夹名称_日期_四位编号 或自定义模板的格式")
+    rename_parser.add_argument("folder", help="目标文件夹")
+    rename_parser.add_argument("--brand", default="品牌", help="品牌名称（默认 品牌）")
+    rename_parser.add_argument("--date", help="日期字符串（默认今天，格式 yyyy年MM月dd日）")
+    rename_parser.add_argument("--workers", type=int, default=file_engine.DEFAULT_RENAME_WORKERS,
+                               help=f"并行重命名线程数（默认 {file_engine.DEFAULT_RENAME_WORKERS}）")
+    rename_parser.add_argument("--incremental", action="store_true",
+                               help="只为上次运行之后新加入的文件编号，跳过没有变化的文件夹")
+    rename_parser.add_argument("--index", default=file_engine.DEFAULT_INDEX_PATH,
+                               help=f"增量模式的索引文件（默认 {file_engine.DEFAULT_INDEX_PATH}）")
+    rename_parser.add_argument("--low-memory", action="store_true",
+                               help="分段排序并写入临时文件，适合单个文件夹有数百万文件的情况")
+    rename_parser.set_defaults(func=run_rename)
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="持续监视文件夹，新文件写入完成后自动重命名")
+    watch_parser.add_argument("folder", help="要监视的文件夹")
+    watch_parser.add_argument("--brand", default="品牌", help="品牌名称（默认 品牌）")
+    watch_parser.add_argument("--date", help="日期字符串（默认每批使用当天日期）")
+    watch_parser.add_argument("--settle", type=float, default=file_watch.DEFAULT_SETTLE_SECONDS,
+                              help=f"文件夹没有变化多少秒后开始处理（默认 {file_watch.DEFAULT_SETTLE_SECONDS}）")
+    watch_parser.add_argument("--index", default=file_engine.DEFAULT_INDEX_PATH,
+                              help=f"索引文件（默认 {file_engine.DEFAULT_INDEX_PATH}）")
+    watch_parser.add_argument("--workers", type=int, default=file_engine.DEFAULT_RENAME_WORKERS,
+                              help=f"并行重命名线程数（默认 {file_engine.DEFAULT_RENAME_WORKERS}）")
+    watch_parser.add_argument("--poll", action="store_true",
+                              help="不使用inotify，定期检查文件夹的修改时间")
+    watch_parser.set_defaults(func=run_watch)
+
+    clean_parser = subparsers.add_parser("clean", help="删除或替换文件名中的字符串")
+    clean_parser.add_argument("folder", help="目标文件夹")
+    clean_parser.add_argument("--replace", action="append",
+                              help="要删除的字符串，可以多次指定（都没有指定时为 副图_1）")
+    clean_parser.add_argument("--regex", action="append",
+                              help="要删除的内容的正则表达式，可以多次指定")
+    clean_parser.add_argument("--rules",
+                              help="规则文件：每行一条，re: 开头为正则表达式，用 \" => \" 指定替换内容")
+    clean_parser.set_defaults(func=run_clean)
+
+    for sub in (copy_parser, rename_parser, clean_parser):
+        sub.add_argument("--dry-run", action="store_true", help="只打印计划，不修改任何文件")
+        sub.add_argument("--save-preset", metavar="名称",
+                         help=f"把本次的参数保存为预设（保存在 {presets.DEFAULT_PRESET_DIR}）")
+
+    for sub in (rename_parser, watch_parser):
+        sub.add_argument("--template", default=rename_template.DEFAULT_TEMPLATE,
+                         help="文件名模板，可用 {brand} {folder} {parent} {parent:2} {date} "
+                              "{exif_date} {counter:4} {size:kb} {ext:lower} 等字段"
+                              f"（默认 {rename_template.DEFAULT_TEMPLATE}）")
+
+    preset_parser = subparsers.add_parser("preset", help="执行保存的预设")
+    preset_parser.add_argument("name", help="预设名称")
+    preset_parser.add_argument("--dry-run", action="store_true", help="只打印计划，不修改任何文件")
+    preset_parser.set_defaults(func=run_preset)
+
+    presets_parser = subparsers.add_parser("presets", help="列出或删除预设")
+    presets_parser.add_argument("-v", "--verbose", action="store_true",
+                                help="同时显示操作类型和文件夹")
+    presets_parser.add_argument("--delete", metavar="名称", help="删除预设")
+    presets_parser.set_defaults(func=run_presets)
+
+    for sub in (rename_parser, watch_parser, clean_parser, preset_parser):
+        sub.add_argument("--journal", help=f"重命名日志路径（默认保存在 {rename_journal.DEFAULT_JOURNAL_DIR}）")
+        sub.add_argument("--no-journal", action="store_true", help="不记录重命名日志，无法撤销")
+
+    undo_parser = subparsers.add_parser("undo", help="根据日志撤销一次批量重命名或文件名清理")
+    undo_parser.add_argument("journal", nargs="?", help="日志路径（默认最近一次操作）")
+    undo_parser.set_defaults(func=run_undo)
+
+    resume_parser = subparsers.add_parser("resume", help="继续执行被中断或取消的操作")
+    resume_parser.add_argument("journal", nargs="?", help="日志路径（默认最近一次未完成的操作）")
+    resume_parser.set_defaults(func=run_resume)
+
+    for sub in (copy_parser, rename_parser, watch_parser, clean_parser, preset_parser,
+                undo_parser, resume_parser):
+        sub.add_argument("--report", metavar="JSON",
+                         help="把各阶段耗时、系统调用次数和最慢的文件写入JSON报告")
+
+    journals_parser = subparsers.add_parser("journals", help="列出重命名日志")
+    journals_parser.set_defaults(func=run_journals)
+
+    return parser
+
+
+def main(argv=None):
+    """命令行主函数，返回退出码"""
+    args = build_parser().parse_args(argv)
+    if getattr(args, "workers", 1) < 1:
+        print("错误: 线程数必须是正整数", file=sys.stderr)
+        return 1
+    folder = getattr(args, "source", None) or getattr(args, "folder", None)
+    if folder is not None and not os.path.isdir(folder):
+        print(f"错误: 文件夹不存在: {folder}", file=sys.stderr)
+        return 1
+    if "" in (getattr(args, "replace", None) or ()):
+        print("错误: 要替换的字符串不能为空", file=sys.stderr)
+        return 1
+    args.token = file_engine.CancelToken()
+    _install_interrupt_handler(args.token)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        print("\n操作已被用户中断", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"操作失败: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件操作引擎
+不依赖tkinter的文件处理函数，供界面、命令行和其他脚本调用
+
+三个主要操作 copy_and_clean、batch_rename、clean_filenames 都返回
+OperationResult，并可通过 progress 回调报告进度。回调会被频繁调用
+（复制时每个文件、重命名时每个文件），需要时用 ThrottledProgress 限制频率。
+OperationResult.stats 记录各阶段耗时、系统调用次数和最慢的文件（见 operation_stats）。
+"""
+
+import contextlib
+import errno
+import hashlib
+import heapq
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from file_table import FileTable
+from name_replace import compile_rules
+from operation_stats import OperationStats
+from rename_index import DEFAULT_INDEX_PATH, RenameIndex
+from rename_journal import RESUMABLE_OPERATIONS, JournalError, RenameJournal
+from rename_template import compile_template
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl
+    fcntl = None
+
+
+# 默认并行复制线程数
+DEFAULT_COPY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# 默认重命名线程数，1表示逐个文件夹顺序处理
+DEFAULT_RENAME_WORKERS = 1
+
+# 复制时每次在内核中传输或读写的最大字节数，两次之间检查取消和暂停
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+# 没有内核复制方式时用户态读写的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 同步时比较文件内容使用的哈希算法
+SYNC_HASH = "blake2b"
+
+# 默认并行删除线程数；删除主要受每次调用的延迟限制（尤其是NFS等网络文件系统），
+# 线程数可以远多于CPU核数
+DEFAULT_DELETE_WORKERS = 16
+
+# 并行删除时每删除多少个文件更新一次计数和进度
+DELETE_BATCH_SIZE = 256
+
+# 后台删除旧内容的线程数，少于前台删除，尽量不与正在进行的复制争抢
+BACKGROUND_DELETE_WORKERS = 4
+
+# 目标文件夹的旧内容移入的回收文件夹名称：与目标文件夹同级的 .<目标名称>.trash_<进程号>_<时间>
+TRASH_SUFFIX = ".trash_"
+
+# 正在后台删除的回收文件夹 {路径: 线程}
+_background_deletes = {}
+_background_lock = threading.Lock()
+
+# 批量重命名扫描时每个 FileTable 最多容纳的文件数，文件少的文件夹合并到同一个表中处理
+TABLE_BATCH_FILES = 1000
+
+# 低内存模式下每段在内存中排序的文件数，超过的部分写入临时文件后归并
+STREAM_RUN_SIZE = 100_000
+
+# 默认模式下文件数超过此值的文件夹自动改用外部排序（与 low_memory 相同），
+# 完整的重命名计划每个文件约需要数百字节，超过后内存占用不再随文件数增长
+STREAM_DIR_FILES = 100_000
+
+# 低内存模式下每次读写临时文件和写入日志的条数
+STREAM_BATCH_SIZE = 1000
+
+# OperationResult 中最多保留的错误和跳过信息条数，计数不受此限制
+MAX_RECORDED_MESSAGES = 1000
+
+# 进度信息：已处理文件数和字节数、总数（未知时为0）、每秒文件数和字节数、预计剩余秒数（未知时为None）
+ProgressInfo = namedtuple("ProgressInfo", [
+    "files_done", "bytes_done", "total_files", "total_bytes",
+    "files_per_sec", "bytes_per_sec", "eta",
+])
+
+# 计划中的单个操作：action 为 "mkdir"、"copy"、"delete" 或 "rename"，
+# 复制和重命名时 source/target 分别为源路径和目标路径，新建和删除时只有 target
+PlanAction = namedtuple("PlanAction", ["action", "source", "target"])
+
+# 各类操作在预览中显示的名称
+ACTION_LABELS = {
+    "mkdir": "新建文件夹",
+    "copy": "复制",
+    "delete": "删除",
+    "rename": "重命名",
+}
+
+# Linux ioctl: 在btrfs/XFS等文件系统上创建共享数据块的reflink克隆
+FICLONE = 0x40049409
+
+# 这些错误表示当前文件系统或内核不支持该复制方式，可以换下一种方式
+_UNSUPPORTED_ERRNOS = {
+    errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+    errno.EOPNOTSUPP, errno.EBADF, errno.EPERM,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+# 内核复制方式是否可用，遇到ENOSYS后关闭，避免每个文件都重试
+_KERNEL_COPY_ENABLED = {
+    "reflink": fcntl is not None and sys.platform.startswith("linux"),
+    "copy_file_range": hasattr(os, "copy_file_range"),
+    "sendfile": hasattr(os, "sendfile") and sys.platform.startswith("linux"),
+}
+
+
+class TargetNotEmptyError(Exception):
+    """目标文件夹不为空且未允许覆盖"""
+
+
+class OperationCancelled(Exception):
+    """操作已被用户取消"""
+
+
+class CancelToken:
+    """
+    协作式的取消和暂停控制
+
+    界面或其他线程调用 cancel()/pause()/resume()，工作线程在文件之间和
+    复制数据块之间调用 check()：暂停时阻塞等待，取消后抛出 OperationCancelled。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        """取消操作，同时唤醒暂停中的线程"""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        """暂停操作"""
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        """继续执行"""
+        self._running.set()
+
+    def check(self):
+        """暂停时等待继续，已取消时抛出 OperationCancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise OperationCancelled("操作已取消")
+
+
+def _check(token):
+    """检查取消和暂停状态"""
+    if token is not None:
+        token.check()
+
+
+class OperationResult:
+    """
+    一次文件操作的结构化结果
+
+    processed/skipped/failed 分别为成功处理、跳过和失败的文件数，deleted 为同步时删除的多余项目数，
+    errors 和 skipped_items 保存 (路径, 原因) 列表（最多 MAX_RECORDED_MESSAGES 条），
+    stats 为分阶段耗时和调用次数的 OperationStats。计数方法是线程安全的，可以在线程池中并发更新；对象可以被pickle，
+    便于在进程池中使用。
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.deleted = 0
+        self.bytes_done = 0
+        self.strategies = Counter()
+        self.errors = []
+        self.skipped_items = []
+        self.total_files = 0
+        self.total_bytes = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.cancelled = False
+        self.stats = OperationStats()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f"OperationResult({self.operation!r}, processed={self.processed}, "
+                f"skipped={self.skipped}, failed={self.failed}, bytes_done={self.bytes_done})")
+
+    def add_processed(self, count=1, nbytes=0, strategy=None):
+        """记录成功处理的文件"""
+        with self._lock:
+            self.processed += count
+            self.bytes_done += nbytes
+            if strategy is not None:
+                self.strategies[strategy] += count
+
+    def add_skipped(self, path, reason, count=1):
+        """记录跳过的文件"""
+        with self._lock:
+            self.skipped += count
+            if len(self.skipped_items) < MAX_RECORDED_MESSAGES:
+                self.skipped_items.append((path, reason))
+
+    def add_deleted(self, count=1):
+        """记录删除的项目"""
+        with self._lock:
+            self.deleted += count
+
+    def add_error(self, path, error):
+        """记录处理失败的文件"""
+        with self._lock:
+            self.failed += 1
+            if len(self.errors) < MAX_RECORDED_MESSAGES:
+                self.errors.append((path, str(error)))
+
+    def merge(self, other):
+        """把另一个结果的计数和错误、跳过信息累加到当前结果中"""
+        with self._lock:
+            self.processed += other.processed
+            self.skipped += other.skipped
+            self.failed += other.failed
+            self.deleted += other.deleted
+            self.bytes_done += other.bytes_done
+            self.strategies.update(other.strategies)
+            self.errors.extend(other.errors[:MAX_RECORDED_MESSAGES - len(self.errors)])
+            self.skipped_items.extend(
+                other.skipped_items[:MAX_RECORDED_MESSAGES - len(self.skipped_items)])
+        self.stats.merge(other.stats)
+
+    @property
+    def speed(self):
+        """平均速度（字节/秒）"""
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def finish(self):
+        """记录总耗时"""
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def progress_info(self):
+        """
+        返回当前的进度信息，包括速度和预计剩余时间
+
+        总数未知时没有预计剩余时间：重命名和清理文件名边扫描边处理，不预先统计文件数，
+        只显示已处理的文件数和速度。
+        """
+        elapsed = time.perf_counter() - self.started
+        files_done = self.processed + self.failed
+        bytes_done = self.bytes_done
+        files_per_sec = files_done / elapsed if elapsed > 0 else 0.0
+        bytes_per_sec = bytes_done / elapsed if elapsed > 0 else 0.0
+
+        eta = None
+        if self.total_bytes and bytes_per_sec > 0:
+            eta = max(0.0, (self.total_bytes - bytes_done) / bytes_per_sec)
+        elif self.total_files and files_per_sec > 0:
+            eta = max(0.0, (self.total_files - files_done) / files_per_sec)
+        return ProgressInfo(files_done, bytes_done, self.total_files, self.total_bytes,
+                            files_per_sec, bytes_per_sec, eta)
+
+
+class ThrottledProgress:
+    """
+    限制进度回调频率的包装器
+
+    在 interval 秒内的多次调用只转发第一次，可以在多个线程中同时调用。
+    """
+
+    def __init__(self, callback, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return
+        with self._lock:
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        self.callback(result)
+
+
+def _report(progress, result):
+    """调用进度回调"""
+    if progress is not None:
+        progress(result)
+
+
+def format_size(num_bytes):
+    """把字节数格式化为易读的字符串"""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def summarize_result(result):
+    """把操作结果整理为多行中文摘要"""
+    if result.operation == "copy_and_clean":
+        strategy_text = "，".join(
+            f"{name} {count}" for name, count in result.strategies.most_common()) or "无"
+        lines = [
+            f"已复制 {result.processed} 个根目录文件，共 {format_size(result.bytes_done)}",
+            f"平均速度: {format_size(result.speed)}/s",
+            f"复制方式: {strategy_text}",
+            f"已跳过 {result.skipped} 个子文件夹中的文件",
+        ]
+    elif result.operation == "sync":
+        strategy_text = "，".join(
+            f"{name} {count}" for name, count in result.strategies.most_common()) or "无"
+        lines = [
+            f"已复制 {result.processed} 个新增或修改的根目录文件，共 {format_size(result.bytes_done)}",
+            f"未修改 {result.skipped} 个文件，删除 {result.deleted} 个多余的项目",
+            f"复制方式: {strategy_text}",
+        ]
+    else:
+        verb = {"clean_filenames": "清理", "undo": "恢复"}.get(result.operation, "重命名")
+        lines = [f"共{verb} {result.processed} 个文件"]
+        if result.skipped:
+            lines.append(f"跳过 {result.skipped} 个文件")
+    if result.failed:
+        lines.append(f"失败 {result.failed} 个，详见错误列表")
+    if result.cancelled:
+        lines.append("操作已取消，以上为取消前完成的部分")
+    lines.append(f"耗时 {result.elapsed:.1f} 秒")
+    lines.extend(result.stats.summary_lines())
+    return lines
+
+
+def format_duration(seconds):
+    """把秒数格式化为 时:分:秒"""
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_progress(label, info):
+    """把进度信息格式化为一行状态文本"""
+    if info.total_files:
+        text = f"{label}: {info.files_done}/{info.total_files} 个文件"
+    else:
+        text = f"{label}: 已处理 {info.files_done} 个文件"
+    text += f"，{info.files_per_sec:.0f} 个/秒"
+    if info.bytes_done:
+        text += f"，{format_size(info.bytes_done)}（{format_size(info.bytes_per_sec)}/s）"
+    if info.eta is not None:
+        text += f"，剩余约 {format_duration(info.eta)}"
+    return text
+
+
+def format_action(action):
+    """把计划中的操作格式化为一行预览文本"""
+    label = ACTION_LABELS.get(action.action, action.action)
+    if action.source is None:
+        return f"{label}: {action.target}"
+    return f"{label}: {action.source} → {action.target}"
+
+
+def name_key(name):
+    """
+    返回用于判断文件名冲突的键
+
+    Windows和macOS默认文件系统不区分大小写，macOS还会对文件名做Unicode规范化，
+    在这些平台上按规范化后的小写形式比较，避免误把同名文件当成不冲突。
+    """
+    if sys.platform == "darwin":
+        return unicodedata.normalize("NFC", name).casefold()
+    if sys.platform == "win32":
+        return name.casefold()
+    return name
+
+
+def bounded_map(func, iterable, max_workers):
+    """
+    在线程池中对iterable的每一项执行func，按完成顺序逐个返回结果
+
+    同时排队的任务数有上限，遍历大目录树时不会一次提交所有任务。
+    max_workers 为1时直接在当前线程中顺序执行。
+    """
+    max_workers = max(1, int(max_workers))
+    if max_workers == 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    max_pending = max_workers * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for item in iterable:
+            pending.add(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def scan_tree(folder, result=None):
+    """
+    用os.scandir自顶向下遍历文件夹
+
+    每个文件夹返回 (路径, 子文件夹名列表, 文件DirEntry列表)，遍历顺序与
+    os.walk相同。文件的修改时间和大小直接通过 DirEntry.stat() 获取，
+    Windows上无需额外的系统调用，其他平台也不再重复拼接路径和查找文件。
+    无法访问的文件夹会被跳过，并记录到 result 中。
+    """
+    stack = [folder]
+    while stack:
+        root = stack.pop()
+        started = time.perf_counter()
+        try:
+            dirs, files, walk_into = _scan_directory(root)
+        except OSError as e:
+            if result is not None:
+                result.add_error(root, e)
+            continue
+        if result is not None:
+            result.stats.add("scan", time.perf_counter() - started, "scandir", 1)
+
+        yield root, dirs, files
+        stack.extend(os.path.join(root, name) for name in reversed(walk_into))
+
+
+def _scan_directory(root):
+    """
+    列出单个文件夹，返回 (子文件夹名列表, 文件DirEntry列表, 需要进入的子文件夹名列表)
+
+    与os.walk一致，指向文件夹的符号链接算作子文件夹，但不进入。
+    """
+    dirs = []
+    files = []
+    walk_into = []
+    with os.scandir(root) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+                if not entry.is_symlink():
+                    walk_into.append(entry.name)
+            else:
+                files.append(entry)
+    return dirs, files, walk_into
+
+
+def scan_tables(folder, result=None, batch_files=TABLE_BATCH_FILES, stream_files=None):
+    """
+    与 scan_tree 顺序相同地遍历文件夹，把文件信息保存到紧凑的 FileTable 中
+
+    每个表包含一个或多个有文件的文件夹，文件数达到 batch_files 后返回当前的表，
+    文件很多的文件夹单独占用一个表。文件的修改时间和大小在遍历时读取，
+    无法读取的文件记录到 result 中，并作为不参与编号的名称保留在表里。
+    文件数超过 stream_files 的文件夹不放入表中，改为重新扫描并外部排序，
+    返回与 _scan_sorted_runs 相同的 (路径, 各段列表, 不参与编号的名称)。
+    """
+    table = FileTable()
+    stack = [folder]
+    while stack:
+        root = stack.pop()
+        dir_id = table.add_dir(root)
+        try:
+            walk_into = _scan_into_table(root, table, dir_id, result, stream_files)
+            if walk_into is None:
+                table.pop_dir()
+                runs, occupied, walk_into, count = _sorted_runs(root, result)
+                if count:
+                    yield root, runs, occupied
+                stack.extend(os.path.join(root, name) for name in reversed(walk_into))
+                continue
+        except OSError as e:
+            table.pop_dir()
+            if result is not None:
+                result.add_error(root, e)
+            continue
+
+        if not table.dir_range(dir_id):
+            table.pop_dir()
+        elif len(table) >= batch_files:
+            yield table
+            table = FileTable()
+        stack.extend(os.path.join(root, name) for name in reversed(walk_into))
+    if table.dirs:
+        yield table
+
+
+def _scan_into_table(root, table, dir_id, result, max_files=None):
+    """
+    列出单个文件夹，把文件加入 table，返回需要进入的子文件夹名列表
+
+    文件数超过 max_files 时停止并返回 None，已加入的文件由调用者删除。
+    """
+    others = table.others[dir_id]
+    start = len(table)
+    walk_into = []
+    # 读取文件信息的时间从扫描时间中扣除，整个文件夹汇总后记录一次
+    started = time.perf_counter()
+    stat_time = 0.0
+    stat_count = 0
+    with os.scandir(root) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                others.append(entry.name)
+                if not entry.is_symlink():
+                    walk_into.append(entry.name)
+                continue
+            if max_files is not None and len(table) - start >= max_files:
+                return None
+            stat_started = time.perf_counter()
+            try:
+                stat = entry.stat()
+            except Exception as e:
+                if result is not None:
+                    result.add_error(entry.path, e)
+                others.append(entry.name)
+                continue
+            finally:
+                stat_time += time.perf_counter() - stat_started
+                stat_count += 1
+            table.append(entry.name, stat.st_mtime, stat.st_size)
+    if result is not None:
+        result.stats.add("scan", time.perf_counter() - started - stat_time, "scandir", 1)
+        result.stats.add("stat", stat_time, "stat", stat_count)
+    return walk_into
+
+
+def _kernel_copy_stream(method, fd_in, fd_out, size, token=None):
+    """用copy_file_range或sendfile在内核中分块复制数据，返回是否成功"""
+    offset = 0
+    while offset < size:
+        if offset:
+            _check(token)
+        count = min(COPY_CHUNK_SIZE, size - offset)
+        try:
+            if method == "copy_file_range":
+                sent = os.copy_file_range(fd_in, fd_out, count)
+            else:
+                sent = os.sendfile(fd_out, fd_in, offset, count)
+        except OSError as e:
+            # 尚未写入任何数据时才允许回退，中途失败说明是真正的错误
+            if offset == 0 and e.errno in _UNSUPPORTED_ERRNOS:
+                if e.errno == errno.ENOSYS:
+                    _KERNEL_COPY_ENABLED[method] = False
+                return False
+            raise
+        if sent == 0:
+            # 一个字节都没有复制时（例如文件系统不支持）回退到其他方式；
+            # 中途提前结束说明源文件在复制过程中变短了，不能当作复制成功
+            if offset == 0:
+                return False
+            raise OSError(errno.EIO, f"复制不完整: 只复制了 {offset}/{size} 字节")
+        offset += sent
+    return True
+
+
+def _kernel_copy(src, dst, token=None):
+    """
+    尝试内核侧零拷贝复制文件内容
+
+    依次尝试 reflink克隆、copy_file_range、sendfile，
+    返回使用的方式名称，都不可用时返回None。
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fd_in = fsrc.fileno()
+        fd_out = fdst.fileno()
+        size = os.fstat(fd_in).st_size
+
+        if _KERNEL_COPY_ENABLED["reflink"]:
+            try:
+                fcntl.ioctl(fd_out, FICLONE, fd_in)
+                return "reflink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+
+        for method in ("copy_file_range", "sendfile"):
+            if (_KERNEL_COPY_ENABLED[method]
+                    and _kernel_copy_stream(method, fd_in, fd_out, size, token)):
+                return method
+    return None
+
+
+def _chunked_copy(src, dst, token):
+    """在用户态分块复制文件内容，每块之间检查取消和暂停"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            _check(token)
+            buf = fsrc.read(COPY_BUFFER_SIZE)
+            if not buf:
+                break
+            fdst.write(buf)
+
+
+def fast_copy_file(src, dst, token=None):
+    """
+    复制文件内容和元数据（同shutil.copy2），优先使用内核侧零拷贝
+
+    传入 token 时在数据块之间检查取消和暂停；取消时删除未复制完的目标文件
+    并抛出 OperationCancelled。返回 (复制的字节数, 使用的复制方式)
+    """
+    _check(token)
+    try:
+        strategy = None
+        if any(_KERNEL_COPY_ENABLED.values()):
+            strategy = _kernel_copy(src, dst, token)
+        if strategy is None:
+            if token is None:
+                shutil.copyfile(src, dst)
+            else:
+                _chunked_copy(src, dst, token)
+            strategy = "copyfile"
+    except OperationCancelled:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        raise
+    shutil.copystat(src, dst)
+    return os.path.getsize(dst), strategy
+
+
+def copy_files(pairs, result, max_workers=DEFAULT_COPY_WORKERS, progress=None, token=None):
+    """
+    使用有界线程池并行复制文件
+
+    pairs 为 (源路径, 目标路径) 列表，复制的文件数、字节数和各复制方式的
+    文件数记录在 result 中。单个文件复制失败会记录错误并继续；
+    取消时抛出 OperationCancelled，已复制完的文件保留。
+    """
+    if not pairs:
+        return result
+
+    def copy_task(pair):
+        src, dst = pair
+        started = time.perf_counter()
+        try:
+            size, strategy = fast_copy_file(src, dst, token)
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            result.stats.add("copy", time.perf_counter() - started, "copy", 1)
+            result.add_error(src, e)
+            return
+        seconds = time.perf_counter() - started
+        result.stats.add("copy", seconds, "copy", 1, nbytes=size)
+        result.stats.record_file(src, seconds, "copy")
+        result.add_processed(nbytes=size, strategy=strategy)
+
+    max_workers = min(max(1, int(max_workers)), len(pairs))
+    for _ in bounded_map(copy_task, pairs, max_workers):
+        _report(progress, result)
+    return result
+
+
+def plan_clear_target(target):
+    """逐个返回清空目标文件夹需要删除的顶层项目"""
+    if not os.path.isdir(target):
+        return
+    for item in os.listdir(target):
+        yield PlanAction("delete", None, os.path.join(target, item))
+
+
+# 支持时 bulk_delete 相对于已打开的上级文件夹打开子文件夹并删除其中的项目，
+# 删除过程中路径上的文件夹被换成符号链接也不会删除到其他位置；不支持时改用 shutil.rmtree
+_DELETE_WITH_DIR_FD = (os.open in os.supports_dir_fd and os.unlink in os.supports_dir_fd
+                       and os.scandir in os.supports_fd
+                       and hasattr(os, "O_DIRECTORY") and hasattr(os, "O_NOFOLLOW"))
+
+
+class _DirHandle:
+    """bulk_delete 中已打开的文件夹，所有子文件夹都打开后才关闭"""
+
+    __slots__ = ("fd", "_refs", "_lock")
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    def acquire(self, count):
+        """为 count 个还要相对于它打开的子文件夹保留文件描述符"""
+        with self._lock:
+            self._refs += count
+
+    def release(self):
+        """释放一次引用，最后一次释放时关闭文件描述符"""
+        with self._lock:
+            self._refs -= 1
+            last = self._refs == 0
+        if last:
+            os.close(self.fd)
+
+
+def _delete_directory_files(path, depth, result, progress, token, parent=None):
+    """
+    删除单个文件夹中的文件和符号链接，返回 [(子文件夹路径, 深度, _DirHandle)]
+
+    parent 为上级文件夹的 _DirHandle，文件夹相对于它用 O_NOFOLLOW 打开并释放一次引用；
+    为 None 时按完整路径打开。文件用相对于文件夹的名称删除，内核不需要为每个文件
+    重新解析完整路径。返回的每个子文件夹各占用一次本文件夹的引用。
+    """
+    started = time.perf_counter()
+    try:
+        flags = os.O_RDONLY | os.O_DIRECTORY
+        if parent is None:
+            fd = os.open(path, flags)
+        else:
+            try:
+                fd = os.open(os.path.basename(path), flags | os.O_NOFOLLOW, dir_fd=parent.fd)
+            finally:
+                parent.release()
+        handle = _DirHandle(fd)
+        try:
+            with os.scandir(fd) as it:
+                entries = list(it)
+        except BaseException:
+            handle.release()
+            raise
+    except FileNotFoundError:
+        # 已经被其他程序删除，或要清空的文件夹不存在
+        return []
+    except OSError as e:
+        result.add_error(path, e)
+        return []
+    result.stats.add("scan", time.perf_counter() - started, "scandir", 1)
+
+    subdirs = []
+    deleted = 0
+    unlink_time = 0.0
+    unlink_count = 0
+    try:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if is_dir:
+                subdirs.append((os.path.join(path, entry.name), depth + 1, handle))
+                continue
+
+            _check(token)
+            unlink_started = time.perf_counter()
+            try:
+                os.unlink(entry.name, dir_fd=fd)
+            except FileNotFoundError:
+                # 已经被其他程序删除
+                pass
+            except OSError as e:
+                result.add_error(os.path.join(path, entry.name), e)
+                continue
+            finally:
+                seconds = time.perf_counter() - unlink_started
+                unlink_time += seconds
+                unlink_count += 1
+            result.stats.record_file(os.path.join(path, entry.name), seconds, "delete")
+            deleted += 1
+            if deleted >= DELETE_BATCH_SIZE:
+                result.add_processed(deleted)
+                deleted = 0
+                _report(progress, result)
+        handle.acquire(len(subdirs))
+    finally:
+        handle.release()
+        result.add_processed(deleted)
+        result.stats.add("delete", unlink_time, "unlink", unlink_count)
+    _report(progress, result)
+    return subdirs
+
+
+def _abandon_delete_tasks(tasks):
+    """删除中途出错或取消时，取消还没开始的任务并释放它们不会再使用的文件夹引用"""
+    for future, parent in tasks.items():
+        if future.cancel():
+            if parent is not None:
+                parent.release()
+            continue
+        try:
+            subdirs = future.result()
+        except BaseException:
+            continue
+        for path, depth, handle in subdirs:
+            handle.release()
+
+
+def _rmtree_items(target, result, max_workers, progress, token):
+    """不支持 dir_fd 的平台上用 shutil.rmtree 并行删除 target 中的顶层项目"""
+    try:
+        names = os.listdir(target)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        result.add_error(target, e)
+        return
+
+    def remove(name):
+        path = os.path.join(target, name)
+        started = time.perf_counter()
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            result.add_error(path, e)
+            return
+        finally:
+            result.stats.add("delete", time.perf_counter() - started, "rmtree", 1)
+        result.add_processed()
+
+    for _ in bounded_map(remove, names, max_workers):
+        _check(token)
+        _report(progress, result)
+
+
+def bulk_delete(target, max_workers=DEFAULT_DELETE_WORKERS, progress=None, token=None):
+    """
+    并行删除文件夹 target 中的所有内容，target 本身保留
+
+    先由线程池按文件夹并行删除文件（每个文件夹一个任务，发现的子文件夹继续提交），
+    再从最深的一层开始逐层并行删除空文件夹。符号链接只删除链接本身。
+    返回 OperationResult，processed 为删除的文件数；删除失败的文件记录在 errors 中，
+    其所在的文件夹也无法删除。通过 token 取消时 result.cancelled 为 True。
+    不支持 dir_fd 的平台上改用 shutil.rmtree 逐个删除顶层项目，processed 为删除的顶层项目数。
+    """
+    result = OperationResult("delete")
+    max_workers = max(1, int(max_workers))
+    if not _DELETE_WITH_DIR_FD:
+        try:
+            _rmtree_items(target, result, max_workers, progress, token)
+        except OperationCancelled:
+            result.cancelled = True
+        return result.finish()
+
+    directories = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 还没有取出结果的任务 -> 它相对于打开的上级文件夹
+            tasks = {executor.submit(_delete_directory_files, target, 0, result, progress,
+                                     token): None}
+            try:
+                while tasks:
+                    done, _ = wait(tasks, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del tasks[future]
+                        for path, depth, handle in future.result():
+                            directories.append((path, depth))
+                            tasks[executor.submit(_delete_directory_files, path, depth,
+                                                  result, progress, token, handle)] = handle
+            except BaseException:
+                _abandon_delete_tasks(tasks)
+                raise
+
+        # 子文件夹中的文件都已删除，从最深的一层开始删除文件夹
+        def remove_directory(path):
+            started = time.perf_counter()
+            try:
+                os.rmdir(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                result.add_error(path, e)
+            result.stats.add("delete", time.perf_counter() - started, "rmdir", 1)
+
+        by_depth = {}
+        for path, depth in directories:
+            by_depth.setdefault(depth, []).append(path)
+        for depth in sorted(by_depth, reverse=True):
+            _check(token)
+            for _ in bounded_map(remove_directory, by_depth[depth], max_workers):
+                pass
+    except OperationCancelled:
+        result.cancelled = True
+    return result.finish()
+
+
+def clear_folder(target, token=None, result=None, max_workers=DEFAULT_DELETE_WORKERS,
+                 progress=None):
+    """
+    用 bulk_delete 清空文件夹中的所有内容，返回删除的文件数
+
+    传入 result 时把删除的耗时统计合并到其中；progress 接收删除操作的 OperationResult。
+    取消时抛出 OperationCancelled，有文件无法删除时抛出 OSError。
+    """
+    deleted = bulk_delete(target, max_workers, progress, token)
+    if result is not None:
+        result.stats.merge(deleted.stats)
+    if deleted.cancelled:
+        raise OperationCancelled("操作已取消")
+    if deleted.failed:
+        path, error = deleted.errors[0]
+        raise OSError(f"无法清空目标文件夹，{deleted.failed} 项删除失败，例如 {path}: {error}")
+    return deleted.processed
+
+
+def _trash_prefix(target):
+    """返回目标文件夹的回收文件夹名称前缀"""
+    return "." + os.path.basename(os.path.normpath(os.path.abspath(target))) + TRASH_SUFFIX
+
+
+def move_to_trash(target, result=None):
+    """
+    把文件夹 target 中的所有内容移入同级的回收文件夹，target 本身保留
+
+    每一项只需要一次重命名，耗时与内容多少无关。返回回收文件夹路径；
+    回收文件夹无法创建或与 target 不在同一文件系统（例如 target 是挂载点）时返回 None。
+    中途有项目无法移动时停止移动，剩余的项目留在 target 中，由调用者处理。
+    传入 result 时在其中记录重命名的耗时。
+    """
+    target = os.path.normpath(os.path.abspath(target))
+    trash = os.path.join(os.path.dirname(target),
+                         f"{_trash_prefix(target)}{os.getpid()}_{time.time_ns()}")
+    try:
+        os.mkdir(trash)
+    except OSError:
+        return None
+    stats = result.stats if result is not None else OperationStats()
+    moved = 0
+    try:
+        for name in os.listdir(target):
+            _timed_rename(os.path.join(target, name), os.path.join(trash, name), stats)
+            moved += 1
+    except OSError:
+        if not moved:
+            os.rmdir(trash)
+            return None
+    return trash
+
+
+def _lower_thread_priority():
+    """降低当前线程的调度优先级；只有Linux可以单独设置线程的优先级，其他平台不做处理"""
+    if not sys.platform.startswith("linux") or not hasattr(os, "setpriority"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except OSError:
+        pass
+
+
+def delete_in_background(path):
+    """
+    在低优先级的后台线程中删除文件夹 path 及其所有内容
+
+    Linux上删除线程的优先级最低，它启动的删除线程也继承这个优先级。
+    程序退出时未删除完的回收文件夹，会在下次清空同一目标文件夹时继续删除。
+    """
+    def worker():
+        try:
+            _lower_thread_priority()
+            if not bulk_delete(path, BACKGROUND_DELETE_WORKERS).failed:
+                os.rmdir(path)
+        except OSError:
+            pass
+        finally:
+            with _background_lock:
+                _background_deletes.pop(path, None)
+
+    with _background_lock:
+        if path in _background_deletes:
+            return
+        thread = threading.Thread(target=worker, name="background-delete", daemon=True)
+        _background_deletes[path] = thread
+    thread.start()
+
+
+def _sweep_trash(target):
+    """在后台删除之前留下的、没有删除完的回收文件夹"""
+    parent = os.path.dirname(os.path.normpath(os.path.abspath(target)))
+    prefix = _trash_prefix(target)
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(parent, name)
+        if name.startswith(prefix) and os.path.isdir(path) and not os.path.islink(path):
+            delete_in_background(path)
+
+
+def background_deletes_pending():
+    """返回正在后台删除的回收文件夹数"""
+    with _background_lock:
+        return len(_background_deletes)
+
+
+def wait_background_deletes(timeout=None):
+    """等待后台删除完成，返回是否全部完成"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _background_lock:
+            threads = list(_background_deletes.values())
+        if not threads:
+            return True
+        for thread in threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+            if thread.is_alive():
+                return False
+
+
+def clear_folder_in_background(target, token=None, result=None, progress=None):
+    """
+    清空文件夹：把旧内容移入回收文件夹后在后台删除，立即返回
+
+    无法移入回收文件夹的内容（例如 target 是挂载点）改为用 clear_folder 直接删除。
+    """
+    _sweep_trash(target)
+    trash = move_to_trash(target, result)
+    if trash is not None:
+        delete_in_background(trash)
+    if is_nonempty_dir(target):
+        clear_folder(target, token, result, progress=progress)
+
+
+def is_nonempty_dir(path):
+    """判断路径是否为非空文件夹"""
+    if not os.path.isdir(path):
+        return False
+    with os.scandir(path) as it:
+        return any(True for _ in it)
+
+
+def plan_copy_structure(source, target, result=None):
+    """
+    逐个返回只复制文件夹结构和根目录文件所需的操作
+
+    子文件夹中的文件不会被复制，也不会出现在计划中；
+    传入 result 时会在其中累计跳过的文件数。
+    """
+    for root, dirs, files in scan_tree(source, result):
+        rel_root = os.path.relpath(root, source)
+        target_root = target if rel_root == os.curdir else os.path.join(target, rel_root)
+
+        # 重建子文件夹结构
+        for dir_name in dirs:
+            yield PlanAction("mkdir", None, os.path.join(target_root, dir_name))
+
+        if root == source:
+            # 只有根目录下的文件需要复制
+            for entry in files:
+                yield PlanAction("copy", entry.path, os.path.join(target_root, entry.name))
+        elif result is not None and files:
+            result.add_skipped(root, "子文件夹中的文件不复制", count=len(files))
+
+
+def plan_copy_and_clean(source, target, sync=False, checksum=False):
+    """
+    逐个返回复制文件夹并清理的完整计划：先清空目标文件夹，再复制结构和根目录文件
+
+    sync 为 True 时返回增量同步的计划（见 plan_sync）。
+    """
+    if sync:
+        yield from plan_sync(source, target, checksum=checksum)
+        return
+    yield from plan_clear_target(target)
+    yield from plan_copy_structure(source, target)
+
+
+def _file_digest(path, stats):
+    """计算文件内容的校验值，在 stats 中记录耗时和读取的字节数"""
+    started = time.perf_counter()
+    digest = hashlib.new(SYNC_HASH)
+    nbytes = 0
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(COPY_BUFFER_SIZE)
+            if not buf:
+                break
+            digest.update(buf)
+            nbytes += len(buf)
+    stats.add("hash", time.perf_counter() - started, "hash", 1, nbytes=nbytes)
+    return digest.digest()
+
+
+def _scan_target_directory(path, result):
+    """列出目标文件夹中的项目，不存在时返回空列表，无法读取时返回 None"""
+    started = time.perf_counter()
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    except OSError as e:
+        if result is not None:
+            result.add_error(path, e)
+        return None
+    if result is not None:
+        result.stats.add("scan", time.perf_counter() - started, "scandir", 1)
+    return entries
+
+
+def _file_changed(src, dst, checksum, stats):
+    """
+    判断根目录文件是否需要重新复制
+
+    src、dst 为 DirEntry。默认比较大小和精确到秒的修改时间（与rsync相同，
+    不受文件系统时间精度差异的影响）；checksum 为 True 时比较大小和内容的校验值。
+    """
+    try:
+        src_stat = src.stat()
+        dst_stat = dst.stat(follow_symlinks=False)
+        if src_stat.st_size != dst_stat.st_size:
+            return True
+        if checksum:
+            return _file_digest(src.path, stats) != _file_digest(dst.path, stats)
+    except OSError:
+        return True
+    return int(src_stat.st_mtime) != int(dst_stat.st_mtime)
+
+
+def plan_sync(source, target, result=None, checksum=False, max_workers=DEFAULT_COPY_WORKERS):
+    """
+    逐个返回把目标文件夹同步为源文件夹结构和根目录文件所需的操作，不修改任何文件
+
+    结果与清空后重新复制相同：目标文件夹中源文件夹没有的项目、子文件夹中的文件、
+    以及类型或名称大小写不同的同名项目被删除，缺少的子文件夹被新建，新增或有变化的
+    根目录文件被复制，其余保持不变。每个文件夹内先返回删除，再返回新建和复制。
+    checksum 为 True 时由线程池并行计算校验值；传入 result 时在其中记录未修改的文件数。
+    """
+    stats = result.stats if result is not None else OperationStats()
+    for root, dirs, files in scan_tree(source, result):
+        rel_root = os.path.relpath(root, source)
+        target_root = target if rel_root == os.curdir else os.path.join(target, rel_root)
+        existing = _scan_target_directory(target_root, result)
+        if existing is None:
+            continue
+
+        wanted_dirs = {name_key(name): name for name in dirs}
+        wanted_files = {name_key(entry.name): entry for entry in files} if root == source else {}
+        present = set()
+        compare = []
+        for entry in existing:
+            key = name_key(entry.name)
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = entry.is_file(follow_symlinks=False)
+            except OSError:
+                is_dir = is_file = False
+            if is_dir and wanted_dirs.get(key) == entry.name:
+                present.add(key)
+            elif is_file and key in wanted_files and wanted_files[key].name == entry.name:
+                compare.append((wanted_files[key], entry))
+            else:
+                yield PlanAction("delete", None, entry.path)
+
+        for key, name in wanted_dirs.items():
+            if key not in present:
+                yield PlanAction("mkdir", None, os.path.join(target_root, name))
+
+        def changed(pair):
+            return pair, _file_changed(pair[0], pair[1], checksum, stats)
+
+        unchanged = 0
+        started = time.perf_counter()
+        for (src, dst), is_changed in bounded_map(changed, compare,
+                                                  max_workers if checksum else 1):
+            present.add(name_key(src.name))
+            if is_changed:
+                yield PlanAction("copy", src.path, dst.path)
+            else:
+                unchanged += 1
+        if compare and not checksum:
+            # 计算校验值的耗时已经记录在 hash 阶段
+            stats.add("plan", time.perf_counter() - started, "stat", len(compare) * 2)
+        if result is not None and unchanged:
+            result.add_skipped(root, "根目录文件未修改", count=unchanged)
+
+        for key, entry in wanted_files.items():
+            if key not in present:
+                yield PlanAction("copy", entry.path, os.path.join(target_root, entry.name))
+
+
+def _delete_stale(paths, result, max_workers, progress, token):
+    """删除同步时多余的项目：文件由线程池并行删除，文件夹用 bulk_delete 删除"""
+    files = []
+    for path in paths:
+        _check(token)
+        if not os.path.isdir(path) or os.path.islink(path):
+            files.append(path)
+            continue
+        deleted = bulk_delete(path, progress=None, token=token)
+        result.stats.merge(deleted.stats)
+        for error_path, error in deleted.errors:
+            result.add_error(error_path, error)
+        if deleted.cancelled:
+            raise OperationCancelled("操作已取消")
+        if not deleted.failed:
+            started = time.perf_counter()
+            try:
+                os.rmdir(path)
+            except OSError as e:
+                result.add_error(path, e)
+            else:
+                result.add_deleted()
+            result.stats.add("delete", time.perf_counter() - started, "rmdir", 1)
+        _report(progress, result)
+
+    def remove(path):
+        started = time.perf_counter()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            result.add_error(path, e)
+            return
+        finally:
+            result.stats.add("delete", time.perf_counter() - started, "unlink", 1)
+        result.add_deleted()
+
+    for _ in bounded_map(remove, files, max_workers):
+        _report(progress, result)
+
+
+def copy_structure(source, target, result, max_workers=DEFAULT_COPY_WORKERS, progress=None,
+                   token=None):
+    """
+    只复制文件夹结构和根目录下的文件
+
+    等价于先完整复制再删除子文件夹中的所有文件，但子文件夹里的文件
+    不会被读取或写入，只需遍历一次源文件夹。根目录文件由线程池并行复制。
+    """
+    copy_pairs = []
+
+    for action in plan_copy_structure(source, target, result):
+        _check(token)
+        if action.action == "mkdir":
+            _timed_makedirs(action.target, result.stats)
+        else:
+            copy_pairs.append((action.source, action.target))
+    return _copy_planned(copy_pairs, result, max_workers, progress, token)
+
+
+def _timed_makedirs(path, stats):
+    """新建文件夹，在 stats 中记录耗时"""
+    started = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    stats.add("mkdir", time.perf_counter() - started, "mkdir", 1)
+
+
+def _copy_planned(copy_pairs, result, max_workers, progress, token):
+    """记录要复制的文件总数和总大小，再并行复制"""
+    # 记录总量，用于计算剩余时间
+    result.total_files = len(copy_pairs)
+    started = time.perf_counter()
+    for src, dst in copy_pairs:
+        try:
+            result.total_bytes += os.path.getsize(src)
+        except OSError:
+            pass
+    result.stats.add("stat", time.perf_counter() - started, "stat", len(copy_pairs))
+
+    return copy_files(copy_pairs, result, max_workers, progress, token)
+
+
+def sync_copy_and_clean(source, target, max_workers=DEFAULT_COPY_WORKERS, progress=None,
+                        token=None, checksum=False):
+    """
+    增量同步：只复制新增或有变化的根目录文件，新建缺少的子文件夹，删除多余的项目
+
+    结果与清空目标文件夹后调用 copy_and_clean 相同，但未修改的文件不会重新复制。
+    返回 OperationResult("sync")，processed 为复制的文件数，skipped 为未修改的文件数，
+    deleted 为删除的多余项目数；通过 token 取消时 result.cancelled 为 True。
+    """
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f"源文件夹不存在: {source}")
+
+    result = OperationResult("sync")
+    copy_pairs = []
+    stale = []
+    try:
+        os.makedirs(target, exist_ok=True)
+        for action in plan_sync(source, target, result, checksum, max_workers):
+            _check(token)
+            if action.action == "delete":
+                stale.append(action.target)
+                continue
+            if action.action == "mkdir":
+                # 同名的多余项目必须先删除
+                _delete_stale(stale, result, DEFAULT_DELETE_WORKERS, progress, token)
+                stale = []
+                _timed_makedirs(action.target, result.stats)
+            else:
+                copy_pairs.append((action.source, action.target))
+        _delete_stale(stale, result, DEFAULT_DELETE_WORKERS, progress, token)
+        _copy_planned(copy_pairs, result, max_workers, progress, token)
+    except OperationCancelled:
+        result.cancelled = True
+    return result.finish()
+
+
+def copy_and_clean(source, target, overwrite=False, max_workers=DEFAULT_COPY_WORKERS,
+                   progress=None, token=None, background_clear=False, sync=False,
+                   checksum=False):
+    """
+    把源文件夹的内容复制到目标文件夹，只保留子文件夹结构和根目录文件
+
+    目标文件夹不为空时，overwrite 为 False 会抛出 TargetNotEmptyError，
+    为 True 时先清空目标文件夹；background_clear 为 True 时旧内容移入回收文件夹后
+    立即开始复制，由后台线程删除（见 clear_folder_in_background 和
+    wait_background_deletes）。返回 OperationResult，其中 skipped
+    为未复制的子文件夹文件数；通过 token 取消时 result.cancelled 为 True，
+    计数为取消前已完成的部分。
+
+    sync 为 True 时改为增量同步（见 sync_copy_and_clean），不需要 overwrite。
+    """
+    if sync:
+        return sync_copy_and_clean(source, target, max_workers, progress, token, checksum)
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f"源文件夹不存在: {source}")
+
+    result = OperationResult("copy_and_clean")
+
+    if is_nonempty_dir(target) and not overwrite:
+        raise TargetNotEmptyError(f"目标文件夹 {target} 已存在且不为空")
+
+    try:
+        if overwrite and background_clear:
+            clear_folder_in_background(target, token, result, progress)
+        elif overwrite:
+            clear_folder(target, token, result, progress=progress)
+
+        # 确保目标文件夹存在
+        os.makedirs(target, exist_ok=True)
+
+        copy_structure(source, target, result, max_workers, progress, token)
+    except OperationCancelled:
+        result.cancelled = True
+    return result.finish()
+
+
+def resolve_renames(root, renames, names, result=None):
+    """
+    检查文件夹 root 内的一组重命名 [(旧文件名, 新文件名)]
+
+    names 为该文件夹中现有名称的 name_key 集合。新名称被本批次以外的文件或
+    文件夹占用、或与本批次中靠前的新名称重复时跳过该项；新旧名称相同的项直接忽略。
+    新名称被本批次中其他文件的旧名称占用不算冲突，执行时会先改为临时名称。
+    返回有效的重命名列表。
+    """
+    sources = {name_key(old) for old, new in renames}
+    targets = set()
+    resolved = []
+    for old, new in renames:
+        if old == new:
+            continue
+        new_key = name_key(new)
+        if new_key in targets or (new_key in names and new_key not in sources):
+            if result is not None:
+                result.add_skipped(os.path.join(root, old), f"文件已存在: {new}")
+            continue
+        targets.add(new_key)
+        resolved.append((old, new))
+    return resolved
+
+
+def _temp_name(names, index):
+    """生成当前文件夹中未被占用的临时文件名"""
+    while True:
+        temp = f".renaming_{os.getpid()}_{index}.tmp"
+        if name_key(temp) not in names:
+            return temp
+        index += 1
+
+
+def _timed_rename(src, dst, stats):
+    """重命名文件，在 stats 中记录耗时；失败的调用也计入"""
+    started = time.perf_counter()
+    try:
+        os.rename(src, dst)
+    finally:
+        seconds = time.perf_counter() - started
+        stats.add("rename", seconds, "rename", 1)
+        stats.record_file(src, seconds, "rename")
+
+
+def _timed_lexists(path, stats, phase="plan"):
+    """判断路径是否存在，在 stats 的 phase 阶段中记录一次 stat"""
+    started = time.perf_counter()
+    exists = os.path.lexists(path)
+    stats.add(phase, time.perf_counter() - started, "stat", 1)
+    return exists
+
+
+def apply_renames(root, renames, names, result, progress=None, token=None, journal=None,
+                  applied=None):
+    """
+    分两步执行已检查过的重命名计划
+
+    第一步把新名称正被本批次其他文件占用的文件改为临时名称，
+    这样链式改名（A→B、B→C）和循环改名（A→B、B→A）都不需要反复重试；
+    第二步先执行可以直接完成的改名，再把临时文件改为最终名称。
+    每个文件最多改名两次。names 会随改名同步更新，结果记录在 result 中，
+    每完成一个文件调用一次 progress(result)。
+    通过 token 取消时，已移到临时名称的文件会恢复原名，然后抛出 OperationCancelled。
+
+    提供 journal（RenameJournal）时，全部改名步骤在执行前写入日志，
+    失败、改回原名和取消等偏差也在发生时写入，用于中断后继续和撤销。
+    提供 applied 列表时，成功完成的 (旧文件名, 新文件名) 会追加到其中。
+    """
+    sources = {name_key(old) for old, new in renames}
+
+    def do_rename(old, new):
+        _timed_rename(os.path.join(root, old), os.path.join(root, new), result.stats)
+        names.discard(name_key(old))
+        names.add(name_key(new))
+
+    # 先确定所有步骤：新名称被占用的文件需要临时名称，临时名称提前预留
+    direct = []
+    staged = []
+    reserved = set(names)
+    for old, new in renames:
+        new_key = name_key(new)
+        if new_key in sources and new_key != name_key(old):
+            temp = _temp_name(reserved, len(staged))
+            reserved.add(name_key(temp))
+            staged.append((old, temp, new))
+        else:
+            direct.append((old, new))
+    if not staged and not direct:
+        return result
+
+    # 步骤序号：临时改名 0..S-1，直接改名 S..S+D-1，改为最终名称 S+D..
+    direct_base = len(staged)
+    final_base = direct_base + len(direct)
+    plan_id = None
+    if journal is not None:
+        ops = ([(old, temp) for old, temp, new in staged] + direct
+               + [(temp, new) for old, temp, new in staged])
+        plan_id = journal.log_plan(root, ops, [temp for old, temp, new in staged])
+
+    def note(index, ops=(), cut=False):
+        if journal is not None:
+            journal.log_replace(plan_id, index, ops, cut)
+
+    started = []
+
+    def note_started():
+        if journal is not None and not started:
+            started.append(True)
+            journal.log_started(plan_id)
+
+    moved = []
+    index = 0
+    try:
+        # 第一步：新名称被占用的文件先移到临时名称
+        for index, (old, temp, new) in enumerate(staged):
+            _check(token)
+            try:
+                do_rename(old, temp)
+            except Exception as e:
+                note(index)
+                note(final_base + index)
+                result.add_error(os.path.join(root, old), e)
+                continue
+            moved.append((old, temp, new))
+            note_started()
+
+        # 第二步：直接改名
+        for offset, (old, new) in enumerate(direct):
+            index = direct_base + offset
+            _check(token)
+            try:
+                do_rename(old, new)
+                result.add_processed()
+            except Exception as e:
+                note(index)
+                result.add_error(os.path.join(root, old), e)
+            else:
+                note_started()
+                if applied is not None:
+                    applied.append((old, new))
+            _report(progress, result)
+    except OperationCancelled:
+        # 临时文件的原名称不会被直接改名占用，可以安全恢复
+        note(index, [(temp, old) for old, temp, new in moved], cut=True)
+        for old, temp, new in moved:
+            try:
+                do_rename(temp, old)
+            except Exception as e:
+                result.add_error(os.path.join(root, old), e)
+        raise
+
+    # 把临时文件改为最终名称，这一步不检查取消，避免文件夹中残留临时文件
+    positions = {temp: final_base + i for i, (old, temp, new) in enumerate(staged)}
+    for old, temp, new in moved:
+        try:
+            # 占用新名称的文件改名失败时，恢复原来的名称
+            if name_key(new) in names:
+                note(positions[temp], [(temp, old)])
+                result.add_skipped(os.path.join(root, old), f"文件已存在: {new}")
+                do_rename(temp, old)
+                continue
+            do_rename(temp, new)
+            result.add_processed()
+            if applied is not None:
+                applied.append((old, new))
+        except Exception as e:
+            note(positions[temp])
+            result.add_error(os.path.join(root, old), e)
+        _report(progress, result)
+
+    if journal is not None:
+        journal.log_done(plan_id)
+    return result
+
+
+def rename_in_directory(root, renames, names, result, progress=None, token=None, journal=None,
+                        applied=None):
+    """
+    执行同一文件夹内的一组重命名
+
+    renames 为 [(旧文件名, 新文件名)]，names 为该文件夹中现有名称的 name_key 集合，
+    执行过程中会同步更新，冲突检测不需要额外的系统调用。
+    """
+    started = time.perf_counter()
+    resolved = resolve_renames(root, renames, names, result)
+    result.stats.add("plan", time.perf_counter() - started)
+    return apply_renames(root, resolved, names, result, progress, token, journal, applied)
+
+
+def plan_directory_renames(table, dir_id, brand, date_str, template=None, result=None):
+    """
+    计算单个文件夹中所有文件的编号重命名计划
+
+    table 和 dir_id 为 scan_tables 返回的 FileTable 和其中的文件夹编号，
+    template 为重命名模板（文本或 RenameTemplate，None 为默认模板）。
+    编号在每个文件夹内独立，从0001开始；修改时间相同时按文件名排序，
+    保证多次运行和并行运行时顺序一致。已经按此格式命名的文件也会重新参与编号，
+    因此对部分改名的文件夹再次运行时编号仍然连续。传入 result 时记录排序和计划的耗时。
+    返回 (重命名列表, 当前文件夹已占用名称的 name_key 集合)
+    """
+    started = time.perf_counter()
+    order = table.sorted_files(dir_id)
+    sorted_at = time.perf_counter()
+
+    # 绑定当前文件夹的名称、品牌和日期
+    bound = compile_template(template).bind(table.dirs[dir_id], brand, date_str)
+
+    # 被子文件夹或未参与编号的文件占用的名称，这些编号只能跳过
+    occupied = {name_key(name) for name in table.others[dir_id]}
+
+    # 按修改时间为当前文件夹中的文件编号，最早的在前面
+    renames = []
+    counter = 1
+    for index in order:
+        file = table.name(index)
+        new_name, counter = _numbered_name(bound, file, table.mtimes[index], table.sizes[index],
+                                           occupied, counter)
+        renames.append((file, new_name))
+        counter += 1
+
+    # 当前文件夹中所有已占用的名称
+    names = set(occupied)
+    names.update(name_key(old) for old, new in renames)
+    if result is not None:
+        result.stats.add("sort", sorted_at - started)
+        result.stats.add("plan", time.perf_counter() - sorted_at)
+    return renames, names
+
+
+def _number_files(file_info_list, occupied, bound, counter):
+    """
+    从编号 counter 开始为排好序的 [(文件名, 修改时间, 大小)] 生成新文件名
+
+    bound 为绑定到当前文件夹的 BoundTemplate，名称被 occupied 中的名称占用时跳过该编号。
+    返回 (重命名列表, 最后使用的编号)。
+    """
+    renames = []
+    for file, mtime, size in file_info_list:
+        new_name, counter = _numbered_name(bound, file, mtime, size, occupied, counter)
+        renames.append((file, new_name))
+        counter += 1
+
+    return renames, counter - 1
+
+
+def _numbered_name(bound, file, mtime, size, occupied, counter):
+    """为文件 file 生成编号不小于 counter 的新文件名，返回 (新文件名, 使用的编号)"""
+    # 扩展名、大小等与编号无关的部分只计算一次
+    values = bound.values(file, mtime, size)
+
+    # 生成新文件名，被占用时使用下一个编号
+    while True:
+        new_name = bound.format(counter, values)
+        if name_key(new_name) not in occupied:
+            return new_name, counter
+        counter += 1
+
+
+def rename_directory(table, dir_id, brand, date_str, result, progress=None, token=None,
+                     journal=None, template=None):
+    """
+    按修改时间为单个文件夹中的文件编号并重命名
+
+    先用 plan_directory_renames 计算完整的新旧名称对应关系，再分两步执行。
+    """
+    _check(token)
+    renames, names = plan_directory_renames(table, dir_id, brand, date_str, template, result)
+    return rename_in_directory(table.dirs[dir_id], renames, names, result, progress, token,
+                               journal)
+
+
+def batch_rename(folder, brand, date_str, max_workers=DEFAULT_RENAME_WORKERS, progress=None,
+                 token=None, journal=None, low_memory=False, template=None):
+    """
+    递归批量重命名文件夹中的文件
+
+    每个文件夹的编号互不影响，max_workers 大于1时各文件夹由线程池并行处理，
+    单个文件夹内部仍按顺序重命名。每重命名一个文件调用一次 progress(result)。
+    返回 OperationResult；通过 token 取消时 result.cancelled 为 True，
+    已改名的文件保持新名称，正在处理的文件夹中不会残留临时文件。
+    journal 为日志文件路径，提供时记录每一次改名，可用 resume_journal 继续、
+    用 undo_journal 撤销。
+    low_memory 为 True 时使用外部排序，文件列表分段排序后写入临时文件再合并，
+    内存占用与单个文件夹的文件数无关，编号结果与默认方式相同，适合有数百万文件的文件夹。
+    默认方式下文件数超过 STREAM_DIR_FILES 的文件夹也自动使用外部排序。
+    template 为重命名模板（见 rename_template），None 为默认的 品牌_文件夹名称_日期_编号 格式，
+    模板不正确时抛出 ValueError。
+    """
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"目标文件夹不存在: {folder}")
+    template = compile_template(template)
+
+    args = {"brand": brand, "date_str": date_str, "max_workers": max_workers,
+            "low_memory": low_memory, "template": template.text}
+    with _open_journal(journal, "batch_rename", folder, args) as log:
+        return _batch_rename(folder, brand, date_str, max_workers, progress, token, log,
+                             low_memory, template)
+
+
+def _batch_rename(folder, brand, date_str, max_workers, progress, token, journal,
+                  low_memory=False, template=None):
+    """执行批量重命名，跳过日志中已完成的文件夹"""
+    result = OperationResult("batch_rename")
+    template = compile_template(template)
+
+    def rename_task(table):
+        if not isinstance(table, FileTable):
+            return stream_task(table)
+        for dir_id, root in enumerate(table.dirs):
+            if journal is not None and journal.is_done(root):
+                continue
+            rename_directory(table, dir_id, brand, date_str, result, progress, token, journal,
+                             template)
+
+    def stream_task(item):
+        root, runs, occupied = item
+        if journal is not None and journal.is_done(root):
+            _close_runs(runs)
+            return
+        rename_directory_streaming(root, runs, occupied, brand, date_str, result, progress,
+                                   token, journal, template)
+
+    # 遍历文件夹和子文件夹，跳过没有文件的文件夹
+    if low_memory:
+        directories = _scan_sorted_runs(folder, result)
+        rename_task = stream_task
+    else:
+        directories = scan_tables(folder, result, stream_files=STREAM_DIR_FILES)
+    try:
+        for _ in bounded_map(rename_task, directories, max_workers):
+            pass
+    except OperationCancelled:
+        result.cancelled = True
+
+    if journal is not None:
+        journal.finish(result.cancelled)
+    return result.finish()
+
+
+def plan_batch_rename(folder, brand, date_str, result=None, low_memory=False, template=None):
+    """
+    逐个返回批量重命名的计划，不修改任何文件
+
+    按 scan_tables 返回的表依次计算，内存中只保留当前表的文件信息；low_memory 为 True 时
+    使用与 batch_rename 相同的外部排序，不保留文件列表。
+    """
+    template = compile_template(template)
+    if low_memory:
+        directories = _scan_sorted_runs(folder, result)
+    else:
+        directories = scan_tables(folder, result, stream_files=STREAM_DIR_FILES)
+    for table in directories:
+        if not isinstance(table, FileTable):
+            root, runs, occupied = table
+            for old, new in _merge_numbered(root, runs, occupied, brand, date_str, template):
+                if old != new:
+                    yield PlanAction("rename", os.path.join(root, old), os.path.join(root, new))
+            continue
+        for dir_id, root in enumerate(table.dirs):
+            renames, names = plan_directory_renames(table, dir_id, brand, date_str, template,
+                                                    result)
+            for old, new in resolve_renames(root, renames, names, result):
+                yield PlanAction("rename", os.path.join(root, old), os.path.join(root, new))
+
+
+def _spill_run(items):
+    """把一段 (修改时间, 文件名, 大小) 排序后写入临时文件，返回已回到开头的文件对象"""
+    items.sort()
+    run = tempfile.TemporaryFile()
+    for start in range(0, len(items), STREAM_BATCH_SIZE):
+        marshal.dump(items[start:start + STREAM_BATCH_SIZE], run)
+    run.seek(0)
+    return run
+
+
+def _iter_run(run):
+    """按顺序读出 _spill_run 写入的内容，读完后关闭临时文件；内存中的列表直接返回"""
+    if isinstance(run, list):
+        yield from run
+        return
+    with run:
+        while True:
+            try:
+                batch = marshal.load(run)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _close_runs(runs):
+    """关闭未读取的临时文件"""
+    for run in runs:
+        if not isinstance(run, list):
+            run.close()
+
+
+def _sorted_runs(root, result, run_size=STREAM_RUN_SIZE):
+    """
+    只遍历一次文件夹，把文件的 (修改时间, 文件名, 大小) 按 run_size 分段排序
+
+    超过 run_size 的部分写入临时文件，最后不足一段的部分保留在内存中。
+    返回 (各段列表, 不参与编号的名称的 name_key 集合, 需要进入的子文件夹名列表, 文件数)；
+    不参与编号的名称为子文件夹和无法读取修改时间的文件，新文件名不能使用这些名称。
+    """
+    runs = []
+    buffer = []
+    occupied = set()
+    walk_into = []
+    count = 0
+    # 读取文件信息和排序的时间从扫描时间中扣除
+    started = time.perf_counter()
+    stat_time = 0.0
+    sort_time = 0.0
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    occupied.add(name_key(entry.name))
+                    if not entry.is_symlink():
+                        walk_into.append(entry.name)
+                    continue
+                stat_started = time.perf_counter()
+                try:
+                    stat = entry.stat()
+                    buffer.append((stat.st_mtime, entry.name, stat.st_size))
+                except Exception as e:
+                    if result is not None:
+                        result.add_error(entry.path, e)
+                    occupied.add(name_key(entry.name))
+                    continue
+                finally:
+                    stat_time += time.perf_counter() - stat_started
+                count += 1
+                if len(buffer) >= run_size:
+                    sort_started = time.perf_counter()
+                    runs.append(_spill_run(buffer))
+                    sort_time += time.perf_counter() - sort_started
+                    buffer = []
+    except BaseException:
+        _close_runs(runs)
+        raise
+    sort_started = time.perf_counter()
+    buffer.sort()
+    runs.append(buffer)
+    sort_time += time.perf_counter() - sort_started
+    if result is not None:
+        scan_time = time.perf_counter() - started - stat_time - sort_time
+        result.stats.add("scan", scan_time, "scandir", 1)
+        result.stats.add("stat", stat_time, "stat", count)
+        result.stats.add("sort", sort_time)
+    return runs, occupied, walk_into, count
+
+
+def _scan_sorted_runs(folder, result, run_size=STREAM_RUN_SIZE):
+    """
+    与 scan_tree 顺序相同地遍历文件夹，对有文件的文件夹返回 (路径, 各段列表, 不参与编号的名称)
+    """
+    stack = [folder]
+    while stack:
+        root = stack.pop()
+        try:
+            runs, occupied, walk_into, count = _sorted_runs(root, result, run_size)
+        except OSError as e:
+            if result is not None:
+                result.add_error(root, e)
+            continue
+        if count:
+            yield root, runs, occupied
+        stack.extend(os.path.join(root, name) for name in reversed(walk_into))
+
+
+def _merge_numbered(root, runs, occupied, brand, date_str, template=None):
+    """合并各段，按修改时间顺序逐个返回 (旧文件名, 新文件名)"""
+    bound = compile_template(template).bind(root, brand, date_str)
+    counter = 1
+    for mtime, file, size in heapq.merge(*(_iter_run(run) for run in runs)):
+        new_name, counter = _numbered_name(bound, file, mtime, size, occupied, counter)
+        yield file, new_name
+        counter += 1
+
+
+def rename_directory_streaming(root, runs, occupied, brand, date_str, result, progress=None,
+                               token=None, journal=None, template=None):
+    """
+    用外部排序的结果为单个文件夹中的文件编号并重命名，内存占用与文件数无关
+
+    第一遍按修改时间顺序合并各段：新名称空闲的文件直接改名，新名称仍被其他文件占用的
+    先改为临时名称，并把 (临时名称, 原名称, 新名称) 写入临时文件；第二遍再把临时文件
+    改为最终名称。每 STREAM_BATCH_SIZE 个文件为一段写入日志，日志也不会出现超长的记录。
+    取消时不再开始新的改名，已移到临时名称的文件仍会改为最终名称，
+    已完成的部分与完整运行的结果一致，再次运行会从中断处继续。
+    """
+    staged = tempfile.TemporaryFile()
+    temp_index = [0]
+    last_plan = [None]
+
+    def next_temp():
+        while True:
+            temp = f".renaming_{os.getpid()}_{temp_index[0]}.tmp"
+            temp_index[0] += 1
+            if not _timed_lexists(os.path.join(root, temp), result.stats):
+                return temp
+
+    def run_steps(steps):
+        """执行一段 (原名称, 目标名称, 类型) 步骤：direct/stage/final 为直接改名、改为临时名称、
+        从临时名称改为最终名称，restore 为最终名称被占用时改回原名"""
+        plan_id = None
+        if journal is not None:
+            plan_id = journal.log_plan(
+                root, [(old, new) for old, new, kind, extra in steps],
+                [new if kind == "stage" else old for old, new, kind, extra in steps
+                 if kind in ("stage", "final", "restore")])
+            last_plan[0] = plan_id
+        started = False
+        batch = []
+        for index, (old, new, kind, extra) in enumerate(steps):
+            try:
+                _timed_rename(os.path.join(root, old), os.path.join(root, new), result.stats)
+            except Exception as e:
+                if journal is not None:
+                    journal.log_replace(plan_id, index)
+                result.add_error(os.path.join(root, extra if kind == "final" else old), e)
+                continue
+            if journal is not None and not started:
+                started = True
+                journal.log_started(plan_id)
+            if kind == "stage":
+                batch.append((new, old, extra))
+                continue
+            if kind == "restore":
+                result.add_skipped(os.path.join(root, new), f"文件已存在: {extra}")
+            else:
+                result.add_processed()
+            _report(progress, result)
+        if batch:
+            marshal.dump(batch, staged)
+
+    try:
+        # 第一遍：直接改名，或先移到临时名称
+        steps = []
+        cancelled = False
+        try:
+            for old, new in _merge_numbered(root, runs, occupied, brand, date_str, template):
+                if old == new:
+                    continue
+                _check(token)
+                if _timed_lexists(os.path.join(root, new), result.stats):
+                    steps.append((old, next_temp(), "stage", new))
+                else:
+                    steps.append((old, new, "direct", None))
+                if len(steps) >= STREAM_BATCH_SIZE:
+                    run_steps(steps)
+                    steps = []
+            run_steps(steps)
+        except OperationCancelled:
+            cancelled = True
+            _close_runs(runs)
+
+        # 第二遍：临时文件改为最终名称，这一步不检查取消，避免文件夹中残留临时文件
+        staged.seek(0)
+        while True:
+            try:
+                batch = marshal.load(staged)
+            except EOFError:
+                break
+            steps = []
+            for temp, old, new in batch:
+                if _timed_lexists(os.path.join(root, new), result.stats):
+                    # 原名称期间又被其他文件占用时不能改回，保留临时名称，避免覆盖
+                    if _timed_lexists(os.path.join(root, old), result.stats):
+                        result.add_error(os.path.join(root, old),
+                                         f"文件已存在: {new}，原名称也已被占用，文件保留为 {temp}")
+                        continue
+                    steps.append((temp, old, "restore", new))
+                else:
+                    steps.append((temp, new, "final", old))
+            run_steps(steps)
+    finally:
+        staged.close()
+
+    if journal is not None and last_plan[0] is not None and not cancelled:
+        journal.log_done(last_plan[0])
+    if cancelled:
+        raise OperationCancelled("操作已取消")
+    return result
+
+
+def plan_incremental_directory(root, dirs, entries, known, last_number, brand, date_str,
+                               result=None, cutoff=None, template=None):
+    """
+    计算增量模式下单个文件夹的重命名计划
+
+    known 为索引中已经编号的文件名，这些文件保持不变；只读取其他新加入文件的修改时间，
+    按修改时间排序后从 last_number + 1 开始编号。提供 cutoff 时，修改时间不早于 cutoff
+    的新文件可能仍在写入，本次不编号。
+    返回 (重命名列表, 当前文件夹已占用名称的 name_key 集合, 最后使用的编号, 暂不编号的文件数)
+    """
+    bound = compile_template(template).bind(root, brand, date_str)
+
+    names = {name_key(name) for name in dirs}
+    names.update(name_key(entry.name) for entry in entries)
+
+    file_info_list = []
+    deferred = 0
+    stat_count = 0
+    started = time.perf_counter()
+    for entry in entries:
+        if entry.name in known:
+            continue
+        stat_count += 1
+        try:
+            stat = entry.stat()
+        except Exception as e:
+            if result is not None:
+                result.add_error(entry.path, e)
+            continue
+        if cutoff is not None and stat.st_mtime >= cutoff:
+            deferred += 1
+            continue
+        file_info_list.append((entry.name, stat.st_mtime, stat.st_size))
+    stat_done = time.perf_counter()
+    file_info_list.sort(key=lambda x: (x[1], x[0]))
+    sort_done = time.perf_counter()
+
+    occupied = names - {name_key(file) for file, mtime, size in file_info_list}
+    renames, last_number = _number_files(file_info_list, occupied, bound, last_number + 1)
+    if result is not None:
+        result.stats.add("stat", stat_done - started, "stat", stat_count)
+        result.stats.add("sort", sort_done - stat_done)
+        result.stats.add("plan", time.perf_counter() - sort_done)
+    return renames, names, last_number, deferred
+
+
+def _scan_changed(folders, index, result=None, recursive=True):
+    """
+    遍历文件夹，只列出修改时间与索引记录不同的文件夹
+
+    修改时间没有变化说明文件夹中没有增删或改名，直接按索引中的子文件夹继续向下遍历，
+    每个文件夹只需要一次stat；recursive 为 False 时只检查 folders 本身。对变化的文件夹返回
+    (路径, 修改时间, 子文件夹名列表, 文件DirEntry列表, 需要进入的子文件夹名列表,
+     已编号的文件名集合, 已分配的最大编号, 索引中原来的子文件夹名列表)
+    """
+    stack = list(reversed(folders))
+    while stack:
+        root = stack.pop()
+        started = time.perf_counter()
+        try:
+            # 在列出文件夹之前读取修改时间，列出期间新加入的文件下次仍会被发现
+            mtime_ns = os.stat(root).st_mtime_ns
+            if result is not None:
+                result.stats.add("stat", time.perf_counter() - started, "stat", 1)
+            record = index.get(root)
+            if record is not None and record.mtime_ns == mtime_ns:
+                if recursive:
+                    stack.extend(os.path.join(root, name) for name in reversed(record.subdirs))
+                continue
+            started = time.perf_counter()
+            dirs, files, walk_into = _scan_directory(root)
+        except OSError as e:
+            if result is not None:
+                result.add_error(root, e)
+            continue
+        if result is not None:
+            result.stats.add("scan", time.perf_counter() - started, "scandir", 1)
+
+        if record is None:
+            yield root, mtime_ns, dirs, files, walk_into, set(), 0, []
+        else:
+            yield (root, mtime_ns, dirs, files, walk_into, index.known_files(root),
+                   record.last_number, record.subdirs)
+        if recursive:
+            stack.extend(os.path.join(root, name) for name in reversed(walk_into))
+
+
+def incremental_rename(folder, brand, date_str, index_path=DEFAULT_INDEX_PATH,
+                       max_workers=DEFAULT_RENAME_WORKERS, progress=None, token=None,
+                       journal=None, template=None):
+    """
+    增量批量重命名：只为上次运行之后新加入的文件编号
+
+    index_path 为SQLite索引文件，记录每个文件夹的修改时间、已分配的最大编号和已编号的文件。
+    修改时间没有变化的文件夹直接跳过，变化的文件夹中只有新文件会被读取修改时间，
+    并从上次的最大编号之后继续编号；第一次运行时与 batch_rename 的结果相同。
+    其他参数和返回值与 batch_rename 相同；同一文件夹应始终使用同一个模板，
+    更换模板后已编号的文件不会按新模板重新命名。
+    """
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"目标文件夹不存在: {folder}")
+    template = compile_template(template)
+
+    args = {"brand": brand, "date_str": date_str, "max_workers": max_workers,
+            "index_path": os.path.abspath(index_path), "template": template.text}
+    with _open_journal(journal, "incremental_rename", folder, args) as log:
+        with RenameIndex(index_path) as index:
+            result = rename_new_files([folder], brand, date_str, index, max_workers, progress,
+                                      token, log, template=template)
+        if log is not None:
+            log.finish(result.cancelled)
+        return result
+
+
+def rename_new_files(folders, brand, date_str, index, max_workers=DEFAULT_RENAME_WORKERS,
+                     progress=None, token=None, journal=None, recursive=True, settle=None,
+                     deferred=None, template=None):
+    """
+    为 folders 中新加入的文件编号，是增量重命名和监视模式共用的实现
+
+    index 为打开的 RenameIndex，只在当前线程中读写，每处理完一个文件夹立即提交。
+    中途退出时未提交的文件夹下次会重新计算：已改名的文件按相同的顺序得到相同的编号，
+    不会重复改名。recursive 为 False 时只处理 folders 本身。提供 settle 时，
+    最近 settle 秒内修改过的新文件暂不编号，所在文件夹会加入 deferred 集合，
+    并且不记录修改时间，下次一定会重新检查。journal 为打开的 RenameJournal。
+    """
+    result = OperationResult("batch_rename")
+    template = compile_template(template)
+    cutoff = time.time() - settle if settle is not None else None
+
+    def rename_task(item):
+        root, mtime_ns, dirs, entries, walk_into, known, last_number, old_subdirs = item
+        renames, names, last_number, waiting = plan_incremental_directory(
+            root, dirs, entries, known, last_number, brand, date_str, result, cutoff, template)
+        if waiting:
+            mtime_ns = -1
+        applied = []
+        rename_in_directory(root, renames, names, result, progress, token, journal, applied)
+
+        # 已编号的文件：原有的仍然存在的文件，加上本次成功改名和名称已经正确的文件
+        present = {entry.name for entry in entries}
+        present.difference_update(old for old, new in applied)
+        added = [new for old, new in applied]
+        added.extend(old for old, new in renames if old == new)
+        removed = known - present
+        gone = set(old_subdirs) - set(walk_into)
+        return root, mtime_ns, walk_into, last_number, added, removed, gone
+
+    try:
+        for root, mtime_ns, walk_into, last_number, added, removed, gone in bounded_map(
+                rename_task, _scan_changed(folders, index, result, recursive), max_workers):
+            for name in gone:
+                index.forget(os.path.join(root, name))
+            index.update(root, mtime_ns, last_number, walk_into, added, removed)
+            if mtime_ns == -1 and deferred is not None:
+                deferred.add(root)
+    except OperationCancelled:
+        result.cancelled = True
+
+    return result.finish()
+
+
+def plan_incremental_rename(folder, brand, date_str, index_path=DEFAULT_INDEX_PATH, result=None,
+                            template=None):
+    """逐个返回增量重命名的计划，不修改任何文件和索引"""
+    template = compile_template(template)
+    with RenameIndex(index_path) as index:
+        for root, mtime_ns, dirs, entries, walk_into, known, last_number, old_subdirs in (
+                _scan_changed([folder], index, result)):
+            renames, names, last_number, waiting = plan_incremental_directory(
+                root, dirs, entries, known, last_number, brand, date_str, result,
+                template=template)
+            for old, new in resolve_renames(root, renames, names, result):
+                yield PlanAction("rename", os.path.join(root, old), os.path.join(root, new))
+
+
+def _valid_file_name(name):
+    """判断名称能否作为同一文件夹中的文件名：不能包含路径分隔符，也不能是 . 或 .."""
+    if name in (os.curdir, os.pardir):
+        return False
+    return not any(sep and sep in name for sep in ("/", os.sep, os.altsep))
+
+
+def plan_clean_directory(root, dirs, files, replacer, result=None):
+    """
+    计算单个文件夹中清理文件名的重命名计划
+
+    replacer 为 name_replace.NameReplacer，每个文件名只扫描一次即可应用所有规则。
+    返回 (重命名列表, 当前文件夹已占用名称的 name_key 集合)，没有需要清理的文件时返回空列表。
+    """
+    started = time.perf_counter()
+    renames = []
+    for entry in files:
+        new_name = replacer.replace(entry.name)
+        if new_name != entry.name:
+            if not new_name:
+                if result is not None:
+                    result.add_skipped(entry.path, "清理后文件名为空")
+                continue
+            if not _valid_file_name(new_name):
+                if result is not None:
+                    result.add_skipped(entry.path, f"清理后的文件名不合法: {new_name}")
+                continue
+            renames.append((entry.name, new_name))
+    if result is not None:
+        result.stats.add("plan", time.perf_counter() - started)
+    if not renames:
+        return renames, set()
+
+    names = {name_key(name) for name in dirs}
+    names.update(name_key(entry.name) for entry in files)
+    return renames, names
+
+
+def plan_clean_filenames(folder, rules, result=None):
+    """逐个返回清理文件名的计划，不修改任何文件；rules 的形式与 clean_filenames 相同"""
+    replacer = compile_rules(rules)
+    for root, dirs, files in scan_tree(folder, result):
+        renames, names = plan_clean_directory(root, dirs, files, replacer, result)
+        for old, new in resolve_renames(root, renames, names, result):
+            yield PlanAction("rename", os.path.join(root, old), os.path.join(root, new))
+
+
+def clean_filenames(folder, rules, progress=None, token=None, journal=None):
+    """
+    按替换规则清理文件夹及子文件夹中所有文件名
+
+    rules 为要删除的字符串，或 name_replace.ReplaceRule 列表、NameReplacer：
+    多个字符串和正则表达式会编译为一个组合的匹配器，每个文件名只扫描一次。
+    规则不正确时抛出 ValueError。每清理一个文件调用一次 progress(result)。
+    返回 OperationResult；通过 token 取消时 result.cancelled 为 True。
+    journal 为日志文件路径，用法与 batch_rename 相同。
+    """
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"目标文件夹不存在: {folder}")
+    replacer = compile_rules(rules)
+
+    with _open_journal(journal, "clean_filenames", folder,
+                       {"rules": replacer.to_json()}) as log:
+        return _clean_filenames(folder, replacer, progress, token, log)
+
+
+def _clean_filenames(folder, replacer, progress, token, journal):
+    """执行文件名清理，跳过日志中已完成的文件夹"""
+    result = OperationResult("clean_filenames")
+
+    # 遍历文件夹和子文件夹
+    try:
+        for root, dirs, files in scan_tree(folder, result):
+            _check(token)
+            if journal is not None and journal.is_done(root):
+                continue
+            renames, names = plan_clean_directory(root, dirs, files, replacer, result)
+            if renames:
+                rename_in_directory(root, renames, names, result, progress, token, journal)
+    except OperationCancelled:
+        result.cancelled = True
+
+    if journal is not None:
+        journal.finish(result.cancelled)
+    return result.finish()
+
+
+def _open_journal(path, operation, folder, args):
+    """path 为 None 时不记录日志，否则新建日志"""
+    if path is None:
+        return contextlib.nullcontext()
+    return RenameJournal.create(path, operation, folder, args)
+
+
+def _executed_steps(plan):
+    """
+    根据文件当前是否存在，推断一个文件夹的改名步骤执行到了第几步
+
+    步骤按顺序执行，每一步之前新名称空闲、原名称存在，所以从初始状态依次模拟各步骤，
+    与文件夹当前状态一致的位置就是中断的位置；每个名称只检查一次，不需要列出文件夹。
+    只有"完全未执行"和"全部执行完"可能看起来相同（所有文件互换名称），
+    此时用日志中的开始记录区分。
+    """
+    ops = plan.operations()
+    if plan.done:
+        return len(ops)
+
+    # 每个名称第一次出现时作为原名称说明它原本存在，作为新名称说明它原本空闲
+    expected = {}
+    paths = {}
+    for old, new in ops:
+        for name, existed in ((old, True), (new, False)):
+            key = name_key(name)
+            if key not in expected:
+                expected[key] = existed
+                paths[key] = os.path.join(plan.root, name)
+    actual = {key: os.path.lexists(path) for key, path in paths.items()}
+
+    mismatches = sum(expected[key] != actual[key] for key in expected)
+    best = [0] if mismatches == 0 else []
+    least = mismatches
+    for step, (old, new) in enumerate(ops, 1):
+        for key, exists in ((name_key(old), False), (name_key(new), True)):
+            if expected[key] != exists:
+                mismatches += 1 if expected[key] == actual[key] else -1
+                expected[key] = exists
+        if mismatches < least:
+            least = mismatches
+            best = [step]
+        elif mismatches == least:
+            best.append(step)
+
+    if not best:
+        return 0
+    if plan.started and len(best) > 1 and best[0] == 0:
+        best.pop(0)
+    return best[0]
+
+
+def _undo_plan(plan, result, progress=None):
+    """
+    按相反顺序撤销一个文件夹中已经执行的改名步骤
+
+    中途中断的文件夹先用 _executed_steps 找到中断位置，只撤销之前的步骤。
+    """
+    root = plan.root
+    ops = plan.operations()
+    for old, new in reversed(ops[:_executed_steps(plan)]):
+        old_path = os.path.join(root, old)
+        new_path = os.path.join(root, new)
+        # 原名称已被其他文件占用时不覆盖；只改变大小写时原名称在部分文件系统上也"存在"
+        if name_key(old) != name_key(new) and _timed_lexists(old_path, result.stats):
+            result.add_skipped(new_path, f"文件已存在: {old}")
+            continue
+        try:
+            _timed_rename(new_path, old_path, result.stats)
+        except Exception as e:
+            result.add_error(new_path, e)
+            continue
+        # 从临时名称改回原名的步骤不重复计数
+        if old not in plan.temps:
+            result.add_processed()
+            _report(progress, result)
+
+
+def undo_journal(path, progress=None, token=None):
+    """
+    根据日志撤销一次批量重命名或文件名清理，不重新扫描文件夹
+
+    各文件夹按与执行相反的顺序恢复，每撤销一个文件夹写入一条记录，
+    中途取消或中断后再次调用会从未撤销的文件夹继续。
+    返回 OperationResult；日志已经撤销过时抛出 JournalError。
+    """
+    journal, state = RenameJournal.reopen(path)
+    with journal:
+        if state.undone:
+            raise JournalError(f"该操作已经撤销: {path}")
+
+        result = OperationResult("undo")
+        result.total_files = sum(1 for plan in state.plans if not plan.undone
+                                 for old, new in plan.operations() if old not in plan.temps)
+        try:
+            for plan in reversed(state.plans):
+                if plan.undone:
+                    continue
+                _check(token)
+                _undo_plan(plan, result, progress)
+                journal.log_undone(plan.plan_id)
+        except OperationCancelled:
+            result.cancelled = True
+        else:
+            journal.finish_undo()
+
+    # 增量重命名的索引中记录的是改名后的文件，撤销后这些文件夹需要重新编号
+    if "index_path" in state.args:
+        with RenameIndex(state.args["index_path"]) as index:
+            for root in {plan.root for plan in state.plans}:
+                index.forget(root, recursive=False)
+    return result.finish()
+
+
+def resume_journal(path, progress=None, token=None):
+    """
+    继续执行日志中被中断或取消的操作
+
+    先把中断时正在处理、没有完成的文件夹恢复原状，再用日志中记录的参数重新执行，
+    已完成的文件夹直接跳过。返回 OperationResult；操作已完成、已撤销或不支持继续时
+    抛出 JournalError，此时不会修改任何文件。
+    """
+    journal, state = RenameJournal.reopen(path)
+    with journal:
+        if state.operation not in RESUMABLE_OPERATIONS:
+            raise JournalError(f"不支持继续的操作: {state.operation}，只能撤销")
+        if state.undone:
+            raise JournalError(f"该操作已经撤销: {path}")
+        if state.ended and not state.cancelled:
+            raise JournalError(f"该操作已经完成: {path}")
+        if not os.path.isdir(state.folder):
+            raise FileNotFoundError(f"目标文件夹不存在: {state.folder}")
+
+        # 恢复未完成的文件夹，记录为已撤销后重新处理；
+        # 低内存模式下一个文件夹分为多段记录，文件夹完成时只有最后一段有完成记录
+        rollback = OperationResult("undo")
+        done_dirs = state.done_dirs
+        for plan in reversed(state.plans):
+            if not plan.done and not plan.undone and plan.root not in done_dirs:
+                _undo_plan(plan, rollback)
+                journal.log_undone(plan.plan_id)
+        journal.log_resume()
+
+        args = state.args
+        if state.operation == "batch_rename":
+            result = _batch_rename(state.folder, args["brand"], args["date_str"],
+                                   args.get("max_workers", DEFAULT_RENAME_WORKERS),
+                                   progress, token, journal, args.get("low_memory", False),
+                                   args.get("template"))
+        elif state.operation == "incremental_rename":
+            with RenameIndex(args["index_path"]) as index:
+                result = rename_new_files([state.folder], args["brand"], args["date_str"], index,
+                                          args.get("max_workers", DEFAULT_RENAME_WORKERS),
+                                          progress, token, journal,
+                                          template=args.get("template"))
+            journal.finish(result.cancelled)
+        else:
+            result = _clean_filenames(state.folder, compile_rules(args["rules"]), progress,
+                                      token, journal)
+
+    for item, error in rollback.errors:
+        result.add_error(item, error)
+    result.stats.merge(rollback.stats)
+    return result
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑的文件列表
+批量重命名扫描时每个文件只保存名称、修改时间和大小：名称依次写入同一块字节缓冲区，
+修改时间和大小保存在 array 中，文件按文件夹连续存放，完整路径在需要时才拼接。
+每个文件约占用 名称的字节数 + 24 字节，而DirEntry对象加上名称和路径字符串需要数百字节。
+"""
+
+import os
+from array import array
+
+
+class FileTable:
+    """
+    按文件夹连续存放的文件列表
+
+    先调用 add_dir 加入文件夹，再用 append 加入该文件夹中的文件；同一文件夹的文件
+    序号连续，文件夹编号为 dirs 中的下标。others 为每个文件夹中不参与编号的名称
+    （子文件夹和无法读取信息的文件）。
+    """
+
+    __slots__ = ("dirs", "others", "_dir_starts", "_names", "_offsets", "mtimes", "sizes")
+
+    def __init__(self):
+        self.dirs = []
+        self.others = []
+        self._dir_starts = array("q")
+        self._names = bytearray()
+        self._offsets = array("q", [0])
+        self.mtimes = array("d")
+        self.sizes = array("q")
+
+    def __len__(self):
+        return len(self.mtimes)
+
+    def add_dir(self, path):
+        """加入一个文件夹，返回文件夹编号"""
+        self.dirs.append(path)
+        self.others.append([])
+        self._dir_starts.append(len(self.mtimes))
+        return len(self.dirs) - 1
+
+    def pop_dir(self):
+        """删除最后加入的文件夹及其文件，用于列出文件夹中途失败的情况"""
+        start = self._dir_starts.pop()
+        self.dirs.pop()
+        self.others.pop()
+        del self._names[self._offsets[start]:]
+        del self._offsets[start + 1:]
+        del self.mtimes[start:]
+        del self.sizes[start:]
+
+    def append(self, name, mtime, size):
+        """在最后加入的文件夹中加入一个文件"""
+        self._names += os.fsencode(name)
+        self._offsets.append(len(self._names))
+        self.mtimes.append(mtime)
+        self.sizes.append(size)
+
+    def dir_range(self, dir_id):
+        """返回文件夹中文件的序号范围 range"""
+        start = self._dir_starts[dir_id]
+        if dir_id + 1 < len(self._dir_starts):
+            return range(start, self._dir_starts[dir_id + 1])
+        return range(start, len(self.mtimes))
+
+    def name(self, index):
+        """返回文件名"""
+        return os.fsdecode(bytes(self._names[self._offsets[index]:self._offsets[index + 1]]))
+
+    def sorted_files(self, dir_id):
+        """返回文件夹中按 (修改时间, 文件名) 排序的文件序号"""
+        mtimes = self.mtimes
+        # 只用修改时间排序，不为每个文件创建 (修改时间, 文件名) 元组
+        order = sorted(self.dir_range(dir_id), key=mtimes.__getitem__)
+        # 修改时间相同的文件再按文件名排序
+        i = 0
+        while i < len(order):
+            j = i + 1
+            mtime = mtimes[order[i]]
+            while j < len(order) and mtimes[order[j]] == mtime:
+                j += 1
+            if j - i > 1:
+                order[i:j] = sorted(order[i:j], key=self.name)
+            i = j
+        return array("q", order)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视模式
+持续监视文件夹，新文件写入完成后自动按 品牌_文件夹名称_日期_编号 格式重命名
+
+Linux上通过inotify接收文件夹变化通知，其他平台或inotify不可用时定期检查文件夹的修改时间。
+事件只用来标记哪些文件夹有变化：同一文件夹在 settle 秒内没有新事件后，
+才把所有有变化的文件夹作为一批交给 file_engine.rename_new_files 增量编号，
+每秒成千上万个文件的事件也只会触发少量批次。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime
+
+import file_engine
+from rename_index import DEFAULT_INDEX_PATH, RenameIndex
+from rename_journal import RenameJournal
+from rename_template import compile_template
+
+
+# 文件夹最后一次变化后等待多少秒再处理，期间仍在写入的文件会等到下一批
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# 文件夹持续有变化时，最多等待多少秒也要处理一次
+DEFAULT_MAX_DELAY = 30.0
+
+# 没有inotify时检查文件夹修改时间的间隔（秒）
+DEFAULT_POLL_INTERVAL = 1.0
+
+# 等待事件的最长时间，保证取消和暂停能及时响应
+_WAIT_SLICE = 0.5
+
+# inotify 事件类型，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# 文件写入完成、移入或新建时通知；写入过程中的 IN_MODIFY 不需要，避免大文件产生大量事件
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """加载libc中的inotify函数，不可用时返回 None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """
+    用inotify递归监视文件夹
+
+    read() 返回有变化的文件夹集合；事件队列溢出时返回整个监视的文件夹，
+    由调用方重新检查所有文件夹。新建的子文件夹会自动加入监视。
+    """
+
+    def __init__(self, folder, libc):
+        self.folder = folder
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._paths = {}
+        self._wds = {}
+        self.add_tree(folder)
+
+    def add_tree(self, folder):
+        """监视 folder 及其所有子文件夹，返回加入监视的文件夹列表"""
+        added = []
+        for root, dirs, files in file_engine.scan_tree(folder):
+            if root in self._wds:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(root), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if root == folder and not added:
+                    raise OSError(err, os.strerror(err), root)
+                continue
+            self._paths[wd] = root
+            self._wds[root] = wd
+            added.append(root)
+        return added
+
+    def _forget(self, folder):
+        """停止监视 folder 及其子文件夹"""
+        prefix = os.path.join(folder, "")
+        for root in [root for root in self._wds if root == folder or root.startswith(prefix)]:
+            wd = self._wds.pop(root)
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回有变化的文件夹集合"""
+        changed = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        while ready:
+            try:
+                data = os.read(self._fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                self._handle(wd, mask, name, changed)
+            ready, _, _ = select.select([self._fd], [], [], 0)
+        return changed
+
+    def _handle(self, wd, mask, name, changed):
+        """把单个事件合并到 changed 中"""
+        if mask & IN_Q_OVERFLOW:
+            # 丢失了事件，所有文件夹都要重新检查，同时补上可能漏掉的新文件夹
+            changed.update(self.add_tree(self.folder))
+            changed.update(self._wds)
+            return
+        root = self._paths.get(wd)
+        if root is None:
+            return
+        if mask & IN_IGNORED:
+            self._paths.pop(wd, None)
+            if self._wds.get(root) == wd:
+                del self._wds[root]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if root != self.folder:
+                self._forget(root)
+            return
+        if mask & IN_ISDIR:
+            path = os.path.join(root, name)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # 加入监视之前子文件夹中可能已经有文件，新的文件夹都要检查一遍
+                changed.update(self.add_tree(path))
+            elif mask & IN_MOVED_FROM:
+                self._forget(path)
+            return
+        changed.add(root)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    定期检查文件夹修改时间的监视器，用于没有inotify的平台
+
+    修改时间没有变化的文件夹按上次记录的子文件夹继续检查，每个文件夹每次只需要一次stat。
+    """
+
+    def __init__(self, folder, interval=DEFAULT_POLL_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self._state = {}
+        self._next = time.monotonic() + interval
+        self._scan()
+
+    def _scan(self):
+        """检查所有文件夹，返回修改时间变化的文件夹集合"""
+        changed = set()
+        seen = {}
+        stack = [self.folder]
+        while stack:
+            root = stack.pop()
+            try:
+                mtime_ns = os.stat(root).st_mtime_ns
+                previous = self._state.get(root)
+                if previous is not None and previous[0] == mtime_ns:
+                    subdirs = previous[1]
+                else:
+                    with os.scandir(root) as it:
+                        subdirs = [entry.name for entry in it
+                                   if entry.is_dir(follow_symlinks=False)]
+                    changed.add(root)
+            except OSError:
+                continue
+            seen[root] = (mtime_ns, subdirs)
+            stack.extend(os.path.join(root, name) for name in subdirs)
+        self._state = seen
+        return changed
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，到了检查时间时返回有变化的文件夹集合"""
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self._next = time.monotonic() + self.interval
+        return self._scan()
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL):
+    """优先使用inotify，不可用时使用定期检查"""
+    if use_inotify:
+        libc = _load_inotify()
+        if libc is not None:
+            try:
+                return InotifyWatcher(folder, libc)
+            except OSError:
+                pass
+    return PollingWatcher(folder, poll_interval)
+
+
+def _today():
+    return datetime.now().strftime("%Y年%m月%d日")
+
+
+def watch_folder(folder, brand, date_str=None, index_path=DEFAULT_INDEX_PATH,
+                 settle=DEFAULT_SETTLE_SECONDS, max_delay=DEFAULT_MAX_DELAY,
+                 max_workers=file_engine.DEFAULT_RENAME_WORKERS, on_batch=None, token=None,
+                 journal=None, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL, template=None):
+    """
+    持续监视文件夹，为新文件编号，直到通过 token 取消
+
+    启动时先对整个文件夹做一次增量重命名，之后每批处理有变化且已经安静 settle 秒
+    （或最早的变化已超过 max_delay 秒）的文件夹。date_str 为 None 时每批使用当天日期。
+    每处理完一批调用 on_batch(本批的OperationResult)。journal 为日志文件路径，
+    整个监视过程中的改名都写入同一份日志，可以用 file_engine.undo_journal 撤销。
+    template 为重命名模板，用法与 file_engine.batch_rename 相同。
+    返回累计的 OperationResult。
+    """
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"目标文件夹不存在: {folder}")
+    template = compile_template(template)
+
+    total = file_engine.OperationResult("batch_rename")
+    args = {"brand": brand, "date_str": date_str, "max_workers": max_workers,
+            "index_path": os.path.abspath(index_path), "settle": settle,
+            "template": template.text}
+    log = RenameJournal.create(journal, "watch", folder, args) if journal is not None else None
+    # 先开始监视再处理已有文件，处理期间加入的文件不会漏掉
+    watcher = create_watcher(folder, use_inotify, poll_interval)
+    try:
+        with RenameIndex(index_path) as index:
+
+            def run_batch(folders, recursive):
+                deferred = set()
+                batch = file_engine.rename_new_files(
+                    folders, brand, date_str or _today(), index, max_workers, token=token,
+                    journal=log, recursive=recursive, settle=settle, deferred=deferred,
+                    template=template)
+                total.merge(batch)
+                if on_batch is not None and (batch.processed or batch.failed):
+                    on_batch(batch)
+                if batch.cancelled:
+                    raise file_engine.OperationCancelled("操作已取消")
+                return deferred
+
+            # first_seen/last_seen: 文件夹第一次和最后一次出现变化的时间
+            first_seen = {}
+            last_seen = {}
+            try:
+                now = time.monotonic()
+                for root in run_batch([folder], True):
+                    first_seen[root] = last_seen[root] = now
+
+                while True:
+                    if token is not None:
+                        token.check()
+                    now = time.monotonic()
+                    timeout = _WAIT_SLICE
+                    if last_seen:
+                        timeout = min(timeout, max(0.0, min(
+                            min(last_seen.values()) + settle,
+                            min(first_seen.values()) + max_delay) - now))
+                    for root in watcher.read(timeout):
+                        now = time.monotonic()
+                        first_seen.setdefault(root, now)
+                        last_seen[root] = now
+
+                    now = time.monotonic()
+                    ready = [root for root in last_seen
+                             if now - last_seen[root] >= settle
+                             or now - first_seen[root] >= max_delay]
+                    if not ready:
+                        continue
+                    for root in ready:
+                        del first_seen[root], last_seen[root]
+                    # 仍在写入的文件所在的文件夹等待下一批
+                    for root in run_batch(ready, False):
+                        now = time.monotonic()
+                        first_seen.setdefault(root, now)
+                        last_seen[root] = now
+            except file_engine.OperationCancelled:
+                total.cancelled = True
+            if log is not None:
+                log.finish(total.cancelled)
+    finally:
+        watcher.close()
+        if log is not None:
+            log.close()
+    return total.finish()
+
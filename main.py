@@ -6,30 +6,67 @@
 1. 复制文件夹并删除子文件夹中的文件
 2. 批量重命名文件（品牌_文件夹名称_日期_编号格式）
 3. 清理文件名中的"副图_1"字符串
+4. 保存任务预设，一键重新执行
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import os
-import shutil
 from datetime import datetime
 from pathlib import Path
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import traceback
+import queue
+from itertools import islice
+
+import file_engine
+import file_watch
+import name_replace
+import operation_stats
+import presets
+import rename_journal
+import rename_template
+
+
+# 预览区最多显示的计划项数
+PREVIEW_LIMIT = 500
+
+# 界面刷新间隔（毫秒），工作线程的进度更新在此间隔内合并为一次
+UI_REFRESH_MS = 100
+
+# 标签页顺序对应的操作类型
+TAB_OPERATIONS = ("copy_and_clean", "batch_rename", "clean_filenames")
 
 
 class FileRenamerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("文件批量重命名工具")
-        self.root.geometry("800x600")
+        self.root.geometry("800x700")
         self.root.resizable(True, True)
         
         # 设置样式
         style = ttk.Style()
         style.theme_use('clam')
         
+        # 工作线程不能直接操作tkinter控件，界面更新都通过此队列交给主线程执行
+        self.ui_queue = queue.Queue()
+        
+        # 当前执行中的任务线程和它的取消/暂停控制
+        self.worker_thread = None
+        self.cancel_token = None
+        # 已经在等待任务和后台删除结束后关闭窗口
+        self.closing = False
+        
+        # 任务预设，只在下拉列表展开或使用某个预设时才读取预设文件夹
+        self.preset_store = presets.PresetStore()
+        
         self.setup_ui()
+        self.root.after(UI_REFRESH_MS, self.process_ui_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # 窗口显示之后再恢复上次的输入，不拖慢启动
+        self.root.after_idle(self.restore_settings)
+        self.root.after(UI_REFRESH_MS, self.check_interrupted_journal)
         
     def setup_ui(self):
         """设置用户界面"""
@@ -45,12 +82,16 @@ class FileRenamerApp:
         # 标题
         title_label = ttk.Label(main_frame, text="文件批量重命名工具", 
                                font=("Arial", 16, "bold"))
-        title_label.grid(row=0, column=0, pady=(0, 20))
+        title_label.grid(row=0, column=0, pady=(0, 10))
+        
+        # 任务预设
+        self.setup_preset_bar(main_frame)
         
         # 创建Notebook（标签页）
         notebook = ttk.Notebook(main_frame)
-        notebook.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
-        main_frame.rowconfigure(1, weight=1)
+        notebook.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        main_frame.rowconfigure(2, weight=1)
+        self.notebook = notebook
         
         # 功能1：复制文件夹并删除子文件夹中的文件
         self.setup_copy_folder_tab(notebook)
@@ -61,12 +102,62 @@ class FileRenamerApp:
         # 功能3：清理文件名
         self.setup_clean_filename_tab(notebook)
         
-        # 状态栏
+        # 计划预览区
+        self.setup_preview_pane(main_frame)
+        main_frame.rowconfigure(3, weight=1)
+        
+        # 状态栏和进度条
+        status_frame = ttk.Frame(main_frame)
+        status_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        status_frame.columnconfigure(0, weight=1)
+        
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
-        status_label = ttk.Label(main_frame, textvariable=self.status_var, 
+        status_label = ttk.Label(status_frame, textvariable=self.status_var, 
                                 relief=tk.SUNKEN, anchor=tk.W)
-        status_label.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        status_label.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        
+        self.progress_bar = ttk.Progressbar(status_frame, mode="determinate",
+                                            maximum=100, length=200)
+        self.progress_bar.grid(row=0, column=1, padx=(10, 0))
+        
+        # 暂停和取消按钮，只在任务执行时可用
+        self.pause_button = ttk.Button(status_frame, text="暂停", command=self.toggle_pause,
+                                       state=tk.DISABLED)
+        self.pause_button.grid(row=0, column=2, padx=(10, 0))
+        self.cancel_button = ttk.Button(status_frame, text="取消", command=self.cancel_task,
+                                        state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=3, padx=(5, 0))
+        
+    def setup_preset_bar(self, parent):
+        """设置任务预设栏"""
+        frame = ttk.Frame(parent)
+        frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        ttk.Label(frame, text="任务预设:").grid(row=0, column=0, sticky=tk.W)
+        self.preset_var = tk.StringVar()
+        # 展开下拉列表时才列出预设文件夹
+        self.preset_combo = ttk.Combobox(frame, textvariable=self.preset_var, state="readonly",
+                                         width=30, postcommand=self.refresh_preset_names)
+        self.preset_combo.grid(row=0, column=1, padx=(10, 5))
+        ttk.Button(frame, text="载入", command=self.load_preset).grid(row=0, column=2, padx=(0, 5))
+        ttk.Button(frame, text="运行", command=self.run_preset).grid(row=0, column=3, padx=(0, 5))
+        ttk.Button(frame, text="将当前页保存为预设", command=self.save_preset).grid(
+            row=0, column=4, padx=(0, 5))
+        ttk.Button(frame, text="删除", command=self.delete_preset).grid(row=0, column=5)
+        
+    def setup_preview_pane(self, parent):
+        """设置计划预览区"""
+        frame = ttk.LabelFrame(parent, text="计划预览（不会修改任何文件）", padding="5")
+        frame.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        
+        self.preview_text = tk.Text(frame, height=8, wrap=tk.NONE, state=tk.DISABLED)
+        self.preview_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.preview_text.yview)
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.preview_text.configure(yscrollcommand=scrollbar.set)
         
     def setup_copy_folder_tab(self, notebook):
         """设置复制文件夹功能标签页"""
@@ -94,9 +185,34 @@ class FileRenamerApp:
         ttk.Button(frame, text="浏览", command=self.browse_target_folder).grid(
             row=2, column=2, pady=5)
         
+        # 并行复制线程数
+        ttk.Label(frame, text="复制线程数:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.copy_workers_var = tk.IntVar()
+        self.copy_workers_var.set(file_engine.DEFAULT_COPY_WORKERS)
+        ttk.Spinbox(frame, from_=1, to=64, textvariable=self.copy_workers_var, width=5).grid(
+            row=3, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        
+        # 覆盖时旧内容移到回收文件夹，在后台删除
+        self.background_clear_var = tk.BooleanVar()
+        ttk.Checkbutton(frame, text="覆盖时在后台删除旧内容（立即开始复制）",
+                        variable=self.background_clear_var).grid(
+            row=4, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        
+        # 增量同步：只复制有变化的文件，删除多余的项目
+        sync_frame = ttk.Frame(frame)
+        sync_frame.grid(row=5, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        self.sync_var = tk.BooleanVar()
+        ttk.Checkbutton(sync_frame, text="增量同步（只复制新增或修改的文件）",
+                        variable=self.sync_var).pack(side=tk.LEFT)
+        self.checksum_var = tk.BooleanVar()
+        ttk.Checkbutton(sync_frame, text="比较文件内容",
+                        variable=self.checksum_var).pack(side=tk.LEFT, padx=(10, 0))
+        
         # 执行按钮
         ttk.Button(frame, text="开始复制并清理", command=self.copy_and_clean,
-                  style="Accent.TButton").grid(row=3, column=1, pady=20)
+                  style="Accent.TButton").grid(row=6, column=1, pady=20)
+        ttk.Button(frame, text="预览", command=self.preview_copy_and_clean).grid(
+            row=6, column=2, pady=20)
         
         # 配置网格权重
         frame.columnconfigure(1, weight=1)
@@ -107,7 +223,7 @@ class FileRenamerApp:
         notebook.add(frame, text="批量重命名")
         
         # 说明
-        desc_label = ttk.Label(frame, text="功能：批量重命名文件为 品牌_文件夹名称_yyyy年MM月dd日_四位编号 格式（按修改时间排序，最早为0001）", 
+        desc_label = ttk.Label(frame, text="功能：按命名模板批量重命名文件，默认为 品牌_文件夹名称_yyyy年MM月dd日_四位编号 格式（按修改时间排序，最早为0001）", 
                               font=("Arial", 10), foreground="blue")
         desc_label.grid(row=0, column=0, columnspan=3, sticky=tk.W, pady=(0, 20))
         
@@ -130,9 +246,44 @@ class FileRenamerApp:
         ttk.Button(date_frame, text="今天", command=self.set_today_date).grid(
             row=0, column=1, padx=(5, 0))
         
+        # 品牌名称
+        ttk.Label(frame, text="品牌:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.brand_var = tk.StringVar()
+        self.brand_var.set("品牌")
+        ttk.Entry(frame, textvariable=self.brand_var, width=15).grid(
+            row=3, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        
+        # 文件名模板，不同产品线可以使用各自的命名规则
+        ttk.Label(frame, text="命名模板:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.template_var = tk.StringVar()
+        self.template_var.set(rename_template.DEFAULT_TEMPLATE)
+        ttk.Entry(frame, textvariable=self.template_var, width=50).grid(
+            row=4, column=1, sticky=(tk.W, tk.E), padx=(10, 5), pady=5)
+        ttk.Label(frame, text="可用 {parent} {exif_date}\n{counter:6} {size:kb} {ext:lower}",
+                  foreground="gray").grid(row=4, column=2, sticky=tk.W, pady=5)
+        
+        # 并行重命名线程数，每个文件夹的编号独立，可以分给不同线程处理
+        ttk.Label(frame, text="重命名线程数:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.rename_workers_var = tk.IntVar()
+        self.rename_workers_var.set(file_engine.DEFAULT_RENAME_WORKERS)
+        ttk.Spinbox(frame, from_=1, to=64, textvariable=self.rename_workers_var, width=5).grid(
+            row=5, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        
+        # 增量模式：只为上次运行之后新加入的文件编号
+        self.incremental_var = tk.BooleanVar()
+        ttk.Checkbutton(frame, text="只为新文件编号", variable=self.incremental_var).grid(
+            row=5, column=2, sticky=tk.W, pady=5)
+        
         # 执行按钮
         ttk.Button(frame, text="开始批量重命名", command=self.batch_rename,
-                  style="Accent.TButton").grid(row=3, column=1, pady=20)
+                  style="Accent.TButton").grid(row=6, column=1, pady=20)
+        ttk.Button(frame, text="预览", command=self.preview_batch_rename).grid(
+            row=6, column=2, pady=20)
+        ttk.Button(frame, text="撤销上次重命名",
+                   command=lambda: self.undo_last(("batch_rename", "incremental_rename", "watch"))).grid(
+            row=6, column=0, sticky=tk.W, pady=20)
+        ttk.Button(frame, text="监视文件夹，自动重命名新文件", command=self.watch_folder).grid(
+            row=7, column=1, pady=(0, 20))
         
         # 配置网格权重
         frame.columnconfigure(1, weight=1)
@@ -143,7 +294,7 @@ class FileRenamerApp:
         notebook.add(frame, text="清理文件名")
         
         # 说明
-        desc_label = ttk.Label(frame, text="功能：清理文件名中的'副图_1'字符串", 
+        desc_label = ttk.Label(frame, text="功能：删除或替换文件名中的字符串，多条规则一次完成", 
                               font=("Arial", 10), foreground="blue")
         desc_label.grid(row=0, column=0, columnspan=3, sticky=tk.W, pady=(0, 20))
         
@@ -155,16 +306,22 @@ class FileRenamerApp:
         ttk.Button(frame, text="浏览", command=self.browse_clean_folder).grid(
             row=1, column=2, pady=5)
         
-        # 自定义替换字符串
-        ttk.Label(frame, text="要替换的字符串:").grid(row=2, column=0, sticky=tk.W, pady=5)
-        self.replace_string_var = tk.StringVar()
-        self.replace_string_var.set("副图_1")
-        ttk.Entry(frame, textvariable=self.replace_string_var, width=30).grid(
-            row=2, column=1, sticky=tk.W, padx=(10, 5), pady=5)
+        # 替换规则，每行一条
+        ttk.Label(frame, text="替换规则:").grid(row=2, column=0, sticky=(tk.W, tk.N), pady=5)
+        self.replace_rules_text = tk.Text(frame, height=5, width=40)
+        self.replace_rules_text.insert("1.0", "副图_1")
+        self.replace_rules_text.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(10, 5), pady=5)
+        ttk.Label(frame, text="每行一条；re: 开头为正则表达式；\n用 “ => ” 指定替换内容，默认删除",
+                  foreground="gray").grid(row=2, column=2, sticky=(tk.W, tk.N), pady=5)
         
         # 执行按钮
         ttk.Button(frame, text="开始清理文件名", command=self.clean_filenames,
                   style="Accent.TButton").grid(row=3, column=1, pady=20)
+        ttk.Button(frame, text="预览", command=self.preview_clean_filenames).grid(
+            row=3, column=2, pady=20)
+        ttk.Button(frame, text="撤销上次清理",
+                   command=lambda: self.undo_last(("clean_filenames",))).grid(
+            row=3, column=0, sticky=tk.W, pady=20)
         
         # 配置网格权重
         frame.columnconfigure(1, weight=1)
@@ -198,6 +355,224 @@ class FileRenamerApp:
         """设置今天的日期"""
         self.date_var.set(datetime.now().strftime("%Y年%m月%d日"))
         
+    # 工作线程与界面通信相关方法
+    def post(self, func, *args):
+        """在主线程中执行 func(*args)，可以在任意线程中调用"""
+        self.ui_queue.put(("call", (func, args)))
+        
+    def process_ui_queue(self):
+        """定时处理工作线程投递的界面更新，同一刷新周期内的进度只显示最新的一条"""
+        latest_progress = None
+        try:
+            while True:
+                try:
+                    kind, payload = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    latest_progress = payload
+                    continue
+                # 状态消息比之前的进度更新
+                latest_progress = None
+                func, args = payload
+                # 单条更新出错不能影响之后的更新，只输出到控制台
+                try:
+                    func(*args)
+                except Exception:
+                    print(f"界面更新失败: {func}")
+                    traceback.print_exc()
+            
+            if latest_progress is not None:
+                self.show_progress(*latest_progress)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.root.after(UI_REFRESH_MS, self.process_ui_queue)
+        
+    def _progress_callback(self, label):
+        """创建进度回调：在工作线程中计算进度信息，按界面刷新频率投递到队列"""
+        def progress(result):
+            # 覆盖复制时先清空目标文件夹，此时收到的是删除操作的进度
+            text = "正在清空目标文件夹" if result.operation == "delete" else label
+            self.ui_queue.put(("progress", (text, result.progress_info())))
+        return file_engine.ThrottledProgress(progress, UI_REFRESH_MS / 1000)
+        
+    def show_progress(self, label, info):
+        """在状态栏和进度条中显示进度"""
+        self.status_var.set(file_engine.format_progress(label, info))
+        if info.total_bytes:
+            self.progress_bar.configure(mode="determinate",
+                                        value=100 * info.bytes_done / info.total_bytes)
+        elif info.total_files:
+            self.progress_bar.configure(mode="determinate",
+                                        value=100 * info.files_done / info.total_files)
+        else:
+            # 总数未知时只显示滚动的进度条
+            self.progress_bar.configure(mode="indeterminate")
+            self.progress_bar.step(5)
+            
+    def finish_task(self, status):
+        """任务结束后更新状态栏，重置进度条和暂停/取消按钮"""
+        self.status_var.set(status)
+        self.progress_bar.configure(mode="determinate", value=0)
+        self.pause_button.configure(text="暂停", state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.DISABLED)
+        
+    # 任务控制相关方法
+    def is_task_running(self):
+        """是否有任务正在执行"""
+        return self.worker_thread is not None and self.worker_thread.is_alive()
+        
+    def start_task(self, worker, args):
+        """在新线程中执行任务，避免界面冻结；工作函数的最后一个参数为取消控制"""
+        if self.is_task_running():
+            messagebox.showerror("错误", "已有任务正在执行，请等待完成或取消后再试")
+            return
+        self.cancel_token = file_engine.CancelToken()
+        self.pause_button.configure(text="暂停", state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.worker_thread = threading.Thread(target=worker, args=args + (self.cancel_token,),
+                                              daemon=True)
+        self.worker_thread.start()
+        
+    def toggle_pause(self):
+        """暂停或继续当前任务"""
+        token = self.cancel_token
+        if token is None or not self.is_task_running():
+            return
+        if token.paused:
+            token.resume()
+            self.pause_button.configure(text="暂停")
+            self.status_var.set("继续执行...")
+        else:
+            token.pause()
+            self.pause_button.configure(text="继续")
+            self.status_var.set("已暂停")
+            
+    def cancel_task(self):
+        """取消当前任务，任务会在处理完当前文件后停止"""
+        if self.cancel_token is not None and self.is_task_running():
+            self.cancel_token.cancel()
+            self.pause_button.configure(state=tk.DISABLED)
+            self.cancel_button.configure(state=tk.DISABLED)
+            self.status_var.set("正在取消...")
+            
+    def on_close(self):
+        """关闭窗口时先取消正在执行的任务，等它安全停止、后台删除完成后再退出"""
+        if self.closing:
+            return
+        if self.is_task_running():
+            if not messagebox.askyesno("确认", "任务正在执行，是否取消并退出？"):
+                return
+            self.save_settings()
+            self.cancel_task()
+        else:
+            self.save_settings()
+        self.closing = True
+        self._close_when_idle()
+            
+    def _close_when_idle(self):
+        """等待任务线程和后台删除结束后关闭窗口"""
+        if self.is_task_running():
+            self.root.after(UI_REFRESH_MS, self._close_when_idle)
+        elif file_engine.background_deletes_pending():
+            # 退出会中断后台删除，留下回收文件夹，所以等删除完成再关闭
+            self.status_var.set("正在后台删除目标文件夹的旧内容，完成后自动关闭...")
+            self.root.after(UI_REFRESH_MS, self._close_when_idle)
+        else:
+            self.root.destroy()
+        
+    # 计划预览相关方法
+    def preview_copy_and_clean(self):
+        """预览复制文件夹并清理的计划"""
+        source = self.source_folder_var.get().strip()
+        target = self.target_folder_var.get().strip()
+        
+        if not source or not target:
+            messagebox.showerror("错误", "请选择源文件夹和目标文件夹")
+            return
+            
+        if not os.path.exists(source):
+            messagebox.showerror("错误", "源文件夹不存在")
+            return
+            
+        self.start_preview(file_engine.plan_copy_and_clean(
+            source, target, self.sync_var.get() or self.checksum_var.get(),
+            self.checksum_var.get()))
+        
+    def preview_batch_rename(self):
+        """预览批量重命名的计划"""
+        folder = self.rename_folder_var.get().strip()
+        brand = self.brand_var.get().strip()
+        date_str = self.date_var.get().strip()
+        
+        if not folder or not os.path.exists(folder):
+            messagebox.showerror("错误", "请选择存在的目标文件夹")
+            return
+            
+        template = self.get_rename_template()
+        if template is None:
+            return
+            
+        if self.incremental_var.get():
+            self.start_preview(file_engine.plan_incremental_rename(
+                folder, brand, date_str, template=template))
+        else:
+            self.start_preview(file_engine.plan_batch_rename(
+                folder, brand, date_str, template=template))
+        
+    def preview_clean_filenames(self):
+        """预览清理文件名的计划"""
+        folder = self.clean_folder_var.get().strip()
+        
+        if not folder or not os.path.exists(folder):
+            messagebox.showerror("错误", "请选择存在的目标文件夹")
+            return
+            
+        replacer = self.get_replace_rules()
+        if replacer is None:
+            return
+            
+        self.start_preview(file_engine.plan_clean_filenames(folder, replacer))
+        
+    def start_preview(self, plan):
+        """在新线程中生成计划的前 PREVIEW_LIMIT 项，计划按需生成，不会展开整棵目录树"""
+        self.status_var.set("正在生成预览...")
+        threading.Thread(target=self._preview_worker, args=(plan,), daemon=True).start()
+        
+    def _preview_worker(self, plan):
+        """生成预览的工作线程"""
+        try:
+            # 多取一项用于判断计划是否被截断
+            lines = [file_engine.format_action(action)
+                     for action in islice(plan, PREVIEW_LIMIT + 1)]
+        except Exception as e:
+            self.post(self.status_var.set, "预览失败")
+            self.post(messagebox.showerror, "错误", f"生成预览失败: {str(e)}")
+            return
+        self.post(self.show_preview, lines)
+        
+    def show_preview(self, lines):
+        """在预览区显示计划"""
+        truncated = len(lines) > PREVIEW_LIMIT
+        lines = lines[:PREVIEW_LIMIT]
+        
+        if truncated:
+            status = f"预览完成，显示前 {PREVIEW_LIMIT} 项操作"
+            text = "\n".join(lines + [f"……仅显示前 {PREVIEW_LIMIT} 项"])
+        elif lines:
+            status = f"预览完成，共 {len(lines)} 项操作"
+            text = "\n".join(lines)
+        else:
+            status = "预览完成，没有需要执行的操作"
+            text = "没有需要执行的操作"
+        
+        self.preview_text.configure(state=tk.NORMAL)
+        self.preview_text.delete("1.0", tk.END)
+        self.preview_text.insert(tk.END, text)
+        self.preview_text.configure(state=tk.DISABLED)
+        self.status_var.set(status)
+        
     # 功能实现方法
     def copy_and_clean(self):
         """复制文件夹并删除子文件夹中的文件"""
@@ -212,74 +587,87 @@ class FileRenamerApp:
             messagebox.showerror("错误", "源文件夹不存在")
             return
             
+        try:
+            max_workers = max(1, int(self.copy_workers_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "复制线程数必须是正整数")
+            return
+            
+        # 如果目标路径已存在且不为空，询问是否覆盖
+        # 勾选"比较文件内容"时同时启用增量同步，与命令行的 --checksum 相同
+        sync = self.sync_var.get() or self.checksum_var.get()
+        try:
+            overwrite = file_engine.is_nonempty_dir(target)
+        except OSError as e:
+            messagebox.showerror("错误", f"无法读取目标文件夹: {str(e)}")
+            return
+        if overwrite:
+            question = (f"将把目标文件夹 {target} 同步为源文件夹的内容，源文件夹中没有的项目会被删除，是否继续？"
+                        if sync else f"目标文件夹 {target} 已存在且不为空，是否清空并覆盖？")
+            if not messagebox.askyesno("确认", question):
+                self.status_var.set("操作已取消")
+                return
+            
         # 在新线程中执行，避免界面冻结
-        threading.Thread(target=self._copy_and_clean_worker, 
-                        args=(source, target), daemon=True).start()
+        options = {"background_clear": self.background_clear_var.get(), "sync": sync,
+                   "checksum": self.checksum_var.get()}
+        self.start_task(self._copy_and_clean_worker,
+                        (source, target, overwrite, max_workers, options))
         
-    def _copy_and_clean_worker(self, source, target):
+    def _copy_and_clean_worker(self, source, target, overwrite, max_workers, options, token):
         """复制和清理的工作线程"""
         try:
-            self.status_var.set("正在复制文件夹...")
+            self.post(self.status_var.set, "正在复制文件夹...")
             
-            # 直接使用目标路径，不在其内创建子文件夹
-            target_path = target
+            # 只复制文件夹结构和根目录文件，子文件夹中的文件不再先复制后删除
+            result = file_engine.copy_and_clean(
+                source, target, overwrite, max_workers,
+                progress=self._progress_callback("正在复制文件"), token=token, **options)
             
-            # 如果目标路径已存在且不为空，询问是否覆盖
-            if os.path.exists(target_path) and os.listdir(target_path):
-                result = messagebox.askyesno("确认", f"目标文件夹 {target_path} 已存在且不为空，是否清空并覆盖？")
-                if not result:
-                    self.status_var.set("操作已取消")
-                    return
-                # 清空目标文件夹
-                for item in os.listdir(target_path):
-                    item_path = os.path.join(target_path, item)
-                    if os.path.isdir(item_path):
-                        shutil.rmtree(item_path)
-                    else:
-                        os.remove(item_path)
-            
-            # 确保目标文件夹存在
-            os.makedirs(target_path, exist_ok=True)
-            
-            # 复制源文件夹的内容到目标文件夹
-            for item in os.listdir(source):
-                source_item = os.path.join(source, item)
-                target_item = os.path.join(target_path, item)
-                
-                if os.path.isdir(source_item):
-                    shutil.copytree(source_item, target_item)
-                else:
-                    shutil.copy2(source_item, target_item)
-            
-            self.status_var.set("正在清理子文件夹中的文件...")
-            
-            # 删除子文件夹中的文件
-            deleted_count = 0
-            for root, dirs, files in os.walk(target_path):
-                # 跳过根目录
-                if root == target_path:
-                    continue
-                    
-                # 删除当前目录下的所有文件
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        os.remove(file_path)
-                        deleted_count += 1
-                    except Exception as e:
-                        print(f"删除文件失败: {file_path}, 错误: {e}")
-            
-            self.status_var.set(f"操作完成，已删除 {deleted_count} 个文件")
-            messagebox.showinfo("成功", f"文件夹复制完成！\n目标路径: {target_path}\n已删除 {deleted_count} 个子文件夹中的文件")
+            if result.cancelled:
+                self.post(self.finish_task, f"操作已取消，已复制 {result.processed} 个文件")
+                self._show_result(f"文件夹复制已取消\n目标路径: {target}", result)
+                return
+            
+            if options["sync"]:
+                self.post(self.finish_task, f"同步完成，已复制 {result.processed} 个文件，未修改 {result.skipped} 个，删除 {result.deleted} 个多余的项目")
+                self._show_result(f"文件夹同步完成！\n目标路径: {target}", result)
+                return
+            
+            self.post(self.finish_task, f"操作完成，已复制 {result.processed} 个文件（{file_engine.format_size(result.speed)}/s），跳过 {result.skipped} 个子文件夹中的文件")
+            self._show_result(f"文件夹复制完成！\n目标路径: {target}", result)
             
         except Exception as e:
-            self.status_var.set("操作失败")
-            messagebox.showerror("错误", f"操作失败: {str(e)}")
+            self.post(self.finish_task, "操作失败")
+            self.post(messagebox.showerror, "错误", f"操作失败: {str(e)}")
+            
+    def _show_result(self, title, result):
+        """显示操作结果，失败的文件输出到控制台，各阶段耗时和调用次数写入统计报告"""
+        for path, error in result.errors:
+            print(f"处理失败: {path}, 错误: {error}")
+        for path, reason in result.skipped_items:
+            print(f"已跳过: {path}, 原因: {reason}")
+        lines = [title] + file_engine.summarize_result(result)
+        try:
+            lines.append("统计报告: " + operation_stats.write_report(
+                result, operation_stats.new_report_path(result.operation)))
+            operation_stats.prune_reports()
+        except OSError as e:
+            print(f"无法保存统计报告: {e}")
+        self.post(messagebox.showinfo, "已取消" if result.cancelled else "成功", "\n".join(lines))
+            
+    def _new_journal_path(self, operation):
+        """删除多余的已结束日志后，为本次操作生成新的日志路径"""
+        try:
+            rename_journal.prune_journals()
+        except OSError as e:
+            print(f"无法清理旧的重命名日志: {e}")
+        return rename_journal.new_journal_path(operation)
             
     def batch_rename(self):
         """批量重命名文件"""
         folder = self.rename_folder_var.get().strip()
-        brand = "品牌"  # 默认品牌名称
+        brand = self.brand_var.get().strip()
         date_str = self.date_var.get().strip()
         
         if not folder:
@@ -290,127 +678,462 @@ class FileRenamerApp:
             messagebox.showerror("错误", "目标文件夹不存在")
             return
             
+        try:
+            max_workers = max(1, int(self.rename_workers_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "重命名线程数必须是正整数")
+            return
+            
+        template = self.get_rename_template()
+        if template is None:
+            return
+            
         # 在新线程中执行
-        threading.Thread(target=self._batch_rename_worker, 
-                        args=(folder, brand, date_str), daemon=True).start()
+        self.start_task(self._batch_rename_worker,
+                        (folder, brand, date_str, max_workers, self.incremental_var.get(),
+                         template))
+        
+    def get_rename_template(self):
+        """编译命名模板，模板不正确时提示并返回 None"""
+        try:
+            return rename_template.RenameTemplate(self.template_var.get().strip())
+        except ValueError as e:
+            messagebox.showerror("错误", f"命名模板不正确: {e}")
+            return None
         
-    def _batch_rename_worker(self, folder, brand, date_str):
+    def _batch_rename_worker(self, folder, brand, date_str, max_workers, incremental, template,
+                             token):
         """批量重命名的工作线程"""
         try:
-            self.status_var.set("正在批量重命名文件...")
+            self.post(self.status_var.set, "正在批量重命名文件...")
             
-            renamed_count = 0
+            progress = self._progress_callback("正在批量重命名文件")
+            if incremental:
+                result = file_engine.incremental_rename(
+                    folder, brand, date_str, max_workers=max_workers, progress=progress,
+                    token=token, journal=self._new_journal_path("incremental_rename"),
+                    template=template)
+            else:
+                result = file_engine.batch_rename(
+                    folder, brand, date_str, max_workers, progress=progress, token=token,
+                    journal=self._new_journal_path("batch_rename"), template=template)
             
-            # 遍历文件夹和子文件夹
-            for root, dirs, files in os.walk(folder):
-                if not files:  # 如果当前文件夹没有文件，跳过
-                    continue
-                    
-                # 获取当前文件夹名称
-                folder_name = os.path.basename(root)
-                
-                # 获取文件信息并按修改时间排序
-                file_info_list = []
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        # 获取文件的修改时间
-                        mtime = os.path.getmtime(file_path)
-                        file_info_list.append((file, file_path, mtime))
-                    except Exception as e:
-                        print(f"获取文件时间失败: {file}, 错误: {e}")
-                        continue
-                
-                # 按修改时间排序，最早的在前面
-                file_info_list.sort(key=lambda x: x[2])
-                
-                # 为当前文件夹中的文件编号
-                counter = 1
+            if result.cancelled:
+                self.post(self.finish_task, f"批量重命名已取消，已处理 {result.processed} 个文件")
+                self._show_result("批量重命名已取消", result)
+                return
+            
+            self.post(self.finish_task, f"批量重命名完成，共处理 {result.processed} 个文件")
+            self._show_result("批量重命名完成！", result)
+            
+        except Exception as e:
+            self.post(self.finish_task, "重命名失败")
+            self.post(messagebox.showerror, "错误", f"批量重命名失败: {str(e)}")
+            
+    def watch_folder(self):
+        """持续监视文件夹，新文件写入完成后自动重命名，点击“取消”停止"""
+        folder = self.rename_folder_var.get().strip()
+        brand = self.brand_var.get().strip()
+        date_str = self.date_var.get().strip()
+        
+        if not folder or not os.path.exists(folder):
+            messagebox.showerror("错误", "请选择存在的目标文件夹")
+            return
+            
+        template = self.get_rename_template()
+        if template is None:
+            return
+            
+        # 日期为今天时跟随当天日期，监视跨过零点后自动使用新的日期
+        if date_str == datetime.now().strftime("%Y年%m月%d日"):
+            date_str = None
+        self.start_task(self._watch_folder_worker, (folder, brand, date_str, template))
+        
+    def _watch_folder_worker(self, folder, brand, date_str, template, token):
+        """监视模式的工作线程"""
+        try:
+            self.post(self.status_var.set, f"正在监视 {folder}，点击“取消”停止")
+            totals = [0]
+            
+            def on_batch(batch):
+                totals[0] += batch.processed
+                now = datetime.now().strftime("%H:%M:%S")
+                self.post(self.status_var.set,
+                          f"正在监视 {folder}：{now} 重命名 {batch.processed} 个新文件，"
+                          f"累计 {totals[0]} 个")
                 
-                for file, file_path, mtime in file_info_list:
-                    try:
-                        # 获取文件扩展名
-                        file_ext = os.path.splitext(file)[1]
-                        
-                        # 生成新文件名
-                        new_name = f"{brand}_{folder_name}_{date_str}_{counter:04d}{file_ext}"
-                        new_path = os.path.join(root, new_name)
-                        
-                        # 如果新文件名已存在，跳过
-                        if os.path.exists(new_path):
-                            print(f"文件已存在，跳过: {new_path}")
-                            continue
-                            
-                        # 重命名文件
-                        os.rename(file_path, new_path)
-                        renamed_count += 1
-                        counter += 1
-                        
-                    except Exception as e:
-                        print(f"重命名文件失败: {file}, 错误: {e}")
-            
-            self.status_var.set(f"批量重命名完成，共处理 {renamed_count} 个文件")
-            messagebox.showinfo("成功", f"批量重命名完成！\n共重命名 {renamed_count} 个文件")
+            result = file_watch.watch_folder(
+                folder, brand, date_str, on_batch=on_batch, token=token,
+                journal=self._new_journal_path("watch"), template=template)
             
+            self.post(self.finish_task, f"监视已停止，共重命名 {result.processed} 个文件")
+            if result.failed:
+                self._show_result("监视已停止", result)
+                
         except Exception as e:
-            self.status_var.set("重命名失败")
-            messagebox.showerror("错误", f"批量重命名失败: {str(e)}")
+            self.post(self.finish_task, "监视失败")
+            self.post(messagebox.showerror, "错误", f"监视文件夹失败: {str(e)}")
             
     def clean_filenames(self):
         """清理文件名"""
         folder = self.clean_folder_var.get().strip()
-        replace_string = self.replace_string_var.get().strip()
         
         if not folder:
             messagebox.showerror("错误", "请选择目标文件夹")
             return
             
-        if not replace_string:
-            messagebox.showerror("错误", "请输入要替换的字符串")
-            return
-            
         if not os.path.exists(folder):
             messagebox.showerror("错误", "目标文件夹不存在")
             return
             
+        replacer = self.get_replace_rules()
+        if replacer is None:
+            return
+            
         # 在新线程中执行
-        threading.Thread(target=self._clean_filenames_worker, 
-                        args=(folder, replace_string), daemon=True).start()
+        self.start_task(self._clean_filenames_worker, (folder, replacer))
+        
+    def get_replace_rules(self):
+        """解析并编译替换规则，规则不正确时提示并返回 None"""
+        rules = name_replace.parse_rules(self.replace_rules_text.get("1.0", tk.END))
+        if not rules:
+            messagebox.showerror("错误", "请输入要替换的字符串")
+            return None
+        try:
+            return name_replace.NameReplacer(rules)
+        except ValueError as e:
+            messagebox.showerror("错误", f"替换规则不正确: {e}")
+            return None
         
-    def _clean_filenames_worker(self, folder, replace_string):
+    def _clean_filenames_worker(self, folder, replacer, token):
         """清理文件名的工作线程"""
         try:
-            self.status_var.set("正在清理文件名...")
-            
-            cleaned_count = 0
-            
-            # 遍历文件夹和子文件夹
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    if replace_string in file:
-                        try:
-                            old_path = os.path.join(root, file)
-                            new_name = file.replace(replace_string, "")
-                            new_path = os.path.join(root, new_name)
-                            
-                            # 如果新文件名已存在，跳过
-                            if os.path.exists(new_path):
-                                print(f"文件已存在，跳过: {new_path}")
-                                continue
-                                
-                            # 重命名文件
-                            os.rename(old_path, new_path)
-                            cleaned_count += 1
-                            
-                        except Exception as e:
-                            print(f"清理文件名失败: {file}, 错误: {e}")
-            
-            self.status_var.set(f"文件名清理完成，共处理 {cleaned_count} 个文件")
-            messagebox.showinfo("成功", f"文件名清理完成！\n共清理 {cleaned_count} 个文件")
+            self.post(self.status_var.set, "正在清理文件名...")
+            
+            result = file_engine.clean_filenames(
+                folder, replacer, progress=self._progress_callback("正在清理文件名"),
+                token=token, journal=self._new_journal_path("clean_filenames"))
+            
+            if result.cancelled:
+                self.post(self.finish_task, f"文件名清理已取消，已处理 {result.processed} 个文件")
+                self._show_result("文件名清理已取消", result)
+                return
+            
+            self.post(self.finish_task, f"文件名清理完成，共处理 {result.processed} 个文件")
+            self._show_result("文件名清理完成！", result)
+            
+        except Exception as e:
+            self.post(self.finish_task, "清理失败")
+            self.post(messagebox.showerror, "错误", f"文件名清理失败: {str(e)}")
+
+            
+    # 任务预设和界面设置相关方法
+    def refresh_preset_names(self):
+        """展开下拉列表时列出所有预设"""
+        self.preset_combo.configure(values=self.preset_store.names())
+        
+    def get_selected_preset(self):
+        """读取选中的预设，没有选中或无法读取时提示并返回 None"""
+        name = self.preset_var.get()
+        if not name:
+            messagebox.showerror("错误", "请先选择一个预设")
+            return None
+        try:
+            return self.preset_store.load(name)
+        except presets.PresetError as e:
+            messagebox.showerror("错误", str(e))
+            return None
+        
+    def apply_preset(self, preset):
+        """把预设填入对应的标签页并切换到该页"""
+        operation = preset["operation"]
+        if operation == "copy_and_clean":
+            self.source_folder_var.set(preset["source"])
+            self.target_folder_var.set(preset["target"])
+            self.copy_workers_var.set(preset["workers"])
+            self.background_clear_var.set(preset["background_clear"])
+            self.sync_var.set(preset["sync"])
+            self.checksum_var.set(preset["checksum"])
+        elif operation == "batch_rename":
+            self.rename_folder_var.set(preset["folder"])
+            self.brand_var.set(preset["brand"])
+            self.date_var.set(preset["date"] or datetime.now().strftime("%Y年%m月%d日"))
+            self.template_var.set(preset["template"])
+            self.rename_workers_var.set(preset["workers"])
+            self.incremental_var.set(preset["incremental"])
+        else:
+            self.clean_folder_var.set(preset["folder"])
+            self.replace_rules_text.delete("1.0", tk.END)
+            self.replace_rules_text.insert("1.0", name_replace.format_rules(preset["rules"]))
+        self.notebook.select(TAB_OPERATIONS.index(operation))
+        
+    def current_preset(self):
+        """把当前标签页的输入转换为预设，输入不正确时抛出 PresetError"""
+        operation = TAB_OPERATIONS[self.notebook.index(self.notebook.select())]
+        try:
+            if operation == "copy_and_clean":
+                return presets.make_preset(
+                    operation, source=self.source_folder_var.get().strip(),
+                    target=self.target_folder_var.get().strip(),
+                    workers=int(self.copy_workers_var.get()),
+                    background_clear=self.background_clear_var.get(),
+                    sync=self.sync_var.get(), checksum=self.checksum_var.get())
+            if operation == "batch_rename":
+                # 日期为今天时不保存，每次运行使用当天日期
+                date_str = self.date_var.get().strip()
+                if date_str == datetime.now().strftime("%Y年%m月%d日"):
+                    date_str = ""
+                return presets.make_preset(
+                    operation, folder=self.rename_folder_var.get().strip(),
+                    brand=self.brand_var.get().strip(), date=date_str,
+                    template=self.template_var.get().strip(),
+                    workers=int(self.rename_workers_var.get()),
+                    incremental=self.incremental_var.get())
+            rules = name_replace.parse_rules(self.replace_rules_text.get("1.0", tk.END))
+            return presets.make_preset(operation, folder=self.clean_folder_var.get().strip(),
+                                       rules=[list(rule) for rule in rules])
+        except (tk.TclError, ValueError) as e:
+            raise presets.PresetError(f"线程数必须是正整数: {e}") from None
+        
+    def load_preset(self):
+        """把选中的预设填入界面"""
+        preset = self.get_selected_preset()
+        if preset is not None:
+            self.apply_preset(preset)
+            self.status_var.set(f"已载入预设: {self.preset_var.get()}")
+            
+    def run_preset(self):
+        """载入并执行选中的预设"""
+        name = self.preset_var.get()
+        preset = self.get_selected_preset()
+        if preset is None:
+            return
+        self.apply_preset(preset)
+        
+        folder = preset.get("folder") or preset.get("source")
+        if not os.path.exists(folder):
+            messagebox.showerror("错误", f"文件夹不存在: {folder}")
+            return
+        if (preset["operation"] == "copy_and_clean" and not preset["overwrite"]
+                and not preset["sync"]):
+            try:
+                nonempty = file_engine.is_nonempty_dir(preset["target"])
+            except OSError as e:
+                messagebox.showerror("错误", f"无法读取目标文件夹: {str(e)}")
+                return
+            if nonempty:
+                if not messagebox.askyesno(
+                        "确认", f"目标文件夹 {preset['target']} 已存在且不为空，是否清空并覆盖？"):
+                    self.status_var.set("操作已取消")
+                    return
+                preset["overwrite"] = True
+                
+        self.start_task(self._preset_worker, (name, preset))
+        
+    def _preset_worker(self, name, preset, token):
+        """执行预设的工作线程"""
+        try:
+            self.post(self.status_var.set, f"正在执行预设 {name}...")
+            
+            operation = presets.journal_operation(preset)
+            result = presets.run_preset(
+                preset, progress=self._progress_callback(f"正在执行预设 {name}"), token=token,
+                journal=self._new_journal_path(operation) if operation else None)
+            
+            if result.cancelled:
+                self.post(self.finish_task, f"预设 {name} 已取消，已处理 {result.processed} 个文件")
+                self._show_result(f"预设 {name} 已取消", result)
+                return
+            
+            self.post(self.finish_task, f"预设 {name} 执行完成，共处理 {result.processed} 个文件")
+            self._show_result(f"预设 {name} 执行完成！", result)
+            
+        except Exception as e:
+            self.post(self.finish_task, "执行预设失败")
+            self.post(messagebox.showerror, "错误", f"执行预设 {name} 失败: {str(e)}")
+            
+    def save_preset(self):
+        """把当前标签页的输入保存为预设"""
+        try:
+            preset = self.current_preset()
+        except presets.PresetError as e:
+            messagebox.showerror("错误", f"无法保存预设: {e}")
+            return
+        
+        name = simpledialog.askstring("保存预设", "预设名称:", initialvalue=self.preset_var.get(),
+                                      parent=self.root)
+        if not name:
+            return
+        name = name.strip()
+        if name in self.preset_store.names():
+            if not messagebox.askyesno("确认", f"预设 {name} 已存在，是否替换？"):
+                return
+        try:
+            self.preset_store.save(name, preset)
+        except (presets.PresetError, OSError) as e:
+            messagebox.showerror("错误", f"无法保存预设: {e}")
+            return
+        self.preset_var.set(name)
+        self.status_var.set(f"已保存预设: {name}")
+        
+    def delete_preset(self):
+        """删除选中的预设"""
+        name = self.preset_var.get()
+        if not name:
+            messagebox.showerror("错误", "请先选择一个预设")
+            return
+        if not messagebox.askyesno("确认", f"确定要删除预设 {name} 吗？"):
+            return
+        try:
+            self.preset_store.delete(name)
+        except (presets.PresetError, OSError) as e:
+            messagebox.showerror("错误", str(e))
+            return
+        self.preset_var.set("")
+        self.status_var.set(f"已删除预设: {name}")
+        
+    def restore_settings(self):
+        """恢复上次关闭时的输入；日期总是从今天开始，避免误用过期的日期"""
+        settings = presets.load_settings()
+        string_vars = {
+            "source": self.source_folder_var, "target": self.target_folder_var,
+            "rename_folder": self.rename_folder_var, "brand": self.brand_var,
+            "template": self.template_var, "clean_folder": self.clean_folder_var,
+            "preset": self.preset_var,
+        }
+        for key, var in string_vars.items():
+            if isinstance(settings.get(key), str):
+                var.set(settings[key])
+        for key, var in (("copy_workers", self.copy_workers_var),
+                         ("rename_workers", self.rename_workers_var)):
+            if isinstance(settings.get(key), int) and settings[key] >= 1:
+                var.set(settings[key])
+        for key, var in (("incremental", self.incremental_var),
+                         ("background_clear", self.background_clear_var),
+                         ("sync", self.sync_var), ("checksum", self.checksum_var)):
+            if isinstance(settings.get(key), bool):
+                var.set(settings[key])
+        if isinstance(settings.get("replace_rules"), str):
+            self.replace_rules_text.delete("1.0", tk.END)
+            self.replace_rules_text.insert("1.0", settings["replace_rules"])
+        if settings.get("tab") in TAB_OPERATIONS:
+            self.notebook.select(TAB_OPERATIONS.index(settings["tab"]))
+            
+    def save_settings(self):
+        """保存当前的输入，下次启动时恢复"""
+        def number(var):
+            try:
+                return int(var.get())
+            except (tk.TclError, ValueError):
+                return None
+            
+        settings = {
+            "source": self.source_folder_var.get(),
+            "target": self.target_folder_var.get(),
+            "copy_workers": number(self.copy_workers_var),
+            "background_clear": self.background_clear_var.get(),
+            "sync": self.sync_var.get(),
+            "checksum": self.checksum_var.get(),
+            "rename_folder": self.rename_folder_var.get(),
+            "brand": self.brand_var.get(),
+            "template": self.template_var.get(),
+            "rename_workers": number(self.rename_workers_var),
+            "incremental": self.incremental_var.get(),
+            "clean_folder": self.clean_folder_var.get(),
+            "replace_rules": self.replace_rules_text.get("1.0", "end-1c"),
+            "preset": self.preset_var.get(),
+            "tab": TAB_OPERATIONS[self.notebook.index(self.notebook.select())],
+        }
+        try:
+            presets.save_settings(settings)
+        except OSError as e:
+            print(f"无法保存设置: {e}")
+            
+    # 撤销和继续相关方法
+    def check_interrupted_journal(self):
+        """启动时检查上次是否有中途退出的重命名操作，询问继续还是撤销"""
+        for path in rename_journal.list_journals():
+            try:
+                status = rename_journal.journal_status(path)
+            except OSError:
+                continue
+            if status == "interrupted":
+                break
+        else:
+            return
+            
+        # 监视文件夹等操作不能继续执行，只询问是否撤销
+        if rename_journal.journal_operation(path) not in rename_journal.RESUMABLE_OPERATIONS:
+            if messagebox.askyesno(
+                    "发现未完成的操作",
+                    f"上次的操作没有正常结束：\n{path}\n\n该操作不能继续执行，是否撤销已完成的部分？"):
+                self.start_task(self._undo_worker, (path,))
+            return
+            
+        answer = messagebox.askyesnocancel(
+            "发现未完成的操作",
+            f"上次的操作没有正常结束：\n{path}\n\n"
+            "选择“是”继续执行，选择“否”撤销已完成的部分，选择“取消”暂不处理。")
+        if answer is True:
+            self.start_task(self._resume_worker, (path,))
+        elif answer is False:
+            self.start_task(self._undo_worker, (path,))
+            
+    def undo_last(self, operations):
+        """撤销 operations 中最近的一次操作"""
+        for path in rename_journal.list_journals(operations=operations):
+            try:
+                if rename_journal.journal_status(path) != "undone":
+                    break
+            except OSError:
+                continue
+        else:
+            messagebox.showinfo("提示", "没有可以撤销的操作")
+            return
+            
+        if not messagebox.askyesno("确认", f"确定要撤销这次操作吗？\n{path}"):
+            return
+        self.start_task(self._undo_worker, (path,))
+        
+    def _undo_worker(self, path, token):
+        """撤销操作的工作线程"""
+        try:
+            self.post(self.status_var.set, "正在撤销...")
+            
+            result = file_engine.undo_journal(
+                path, progress=self._progress_callback("正在撤销"), token=token)
+            
+            if result.cancelled:
+                self.post(self.finish_task, f"撤销已取消，已恢复 {result.processed} 个文件")
+                self._show_result("撤销已取消，可以再次撤销剩余部分", result)
+                return
+            
+            self.post(self.finish_task, f"撤销完成，共恢复 {result.processed} 个文件")
+            self._show_result("撤销完成！", result)
+            
+        except Exception as e:
+            self.post(self.finish_task, "撤销失败")
+            self.post(messagebox.showerror, "错误", f"撤销失败: {str(e)}")
+            
+    def _resume_worker(self, path, token):
+        """继续执行中断操作的工作线程"""
+        try:
+            self.post(self.status_var.set, "正在继续上次的操作...")
+            
+            result = file_engine.resume_journal(
+                path, progress=self._progress_callback("正在继续上次的操作"), token=token)
+            
+            if result.cancelled:
+                self.post(self.finish_task, f"操作已取消，已处理 {result.processed} 个文件")
+                self._show_result("操作已取消", result)
+                return
+            
+            self.post(self.finish_task, f"操作完成，共处理 {result.processed} 个文件")
+            self._show_result("上次的操作已完成！", result)
             
         except Exception as e:
-            self.status_var.set("清理失败")
-            messagebox.showerror("错误", f"文件名清理失败: {str(e)}")
+            self.post(self.finish_task, "继续执行失败")
+            self.post(messagebox.showerror, "错误", f"继续执行失败: {str(e)}")
 
 
 def main():
@@ -420,4 +1143,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
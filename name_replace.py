@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名替换规则
+把多个要删除或替换的字符串和正则表达式编译为一个组合的正则表达式，
+每个文件名只扫描一次即可完成所有替换
+
+字符串规则先合并为一棵前缀树，再转换为正则表达式（类似Aho-Corasick自动机，
+有相同前缀的规则共用匹配过程），几十条规则的耗时与一条规则相近。
+所有规则在一次从左到右的扫描中替换：同一位置有多条规则匹配时，字符串规则优先于
+正则表达式，较长的字符串优先于较短的字符串；替换后的文字不会再次参与匹配。
+
+规则文本每行一条，空行和 # 开头的行被忽略：
+    副图_1              删除该字符串
+    re:_\\d+$           删除正则表达式匹配的内容
+    主图 => 封面         把 主图 替换为 封面
+"""
+
+import os
+import re
+from collections import namedtuple
+
+
+# 一条替换规则：pattern 为字符串或正则表达式，replacement 为替换内容（默认删除），
+# regex 为 True 时 pattern 为正则表达式，replacement 中可以使用 \1 等分组引用
+ReplaceRule = namedtuple("ReplaceRule", ["pattern", "replacement", "regex"],
+                         defaults=("", False))
+
+# 规则文本中正则表达式的前缀和替换内容的分隔符
+REGEX_PREFIX = "re:"
+REPLACEMENT_SEPARATOR = " => "
+
+
+def parse_rules(text):
+    """把规则文本解析为 ReplaceRule 列表"""
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, sep, replacement = line.partition(REPLACEMENT_SEPARATOR)
+        regex = pattern.startswith(REGEX_PREFIX)
+        if regex:
+            pattern = pattern[len(REGEX_PREFIX):]
+        rules.append(ReplaceRule(pattern, replacement.strip() if sep else "", regex))
+    return rules
+
+
+def format_rules(rules):
+    """把规则转换为 parse_rules 可以解析的规则文本"""
+    lines = []
+    for rule in rules:
+        rule = ReplaceRule(*rule)
+        line = REGEX_PREFIX + rule.pattern if rule.regex else rule.pattern
+        if rule.replacement:
+            line += REPLACEMENT_SEPARATOR + rule.replacement
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _trie_pattern(words):
+    """把一组字符串转换为等价的正则表达式，相同前缀只匹配一次，较长的字符串优先"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+
+    def build(node):
+        branches = [re.escape(char) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # 这里已经是一个完整的字符串，能继续匹配更长的字符串时优先匹配更长的
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def _shift_group_references(pattern, offset):
+    """
+    把正则表达式中的编号分组引用（\\1、(?(1)...)）加上 offset
+
+    规则放进组合表达式后，前面的规则和外层分组会占用编号，引用必须随之调整。
+    字符集合中的 \\1 和三位八进制转义不是分组引用，保持不变。
+    """
+    out = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            digits = re.match(r"\d*", pattern[i + 1:]).group()
+            octal = digits.startswith("0") or re.match(r"[0-7]{3}", digits)
+            if digits and not in_class and not octal:
+                number = digits[:2]
+                out.append(f"\\{int(number) + offset}")
+                i += 1 + len(number)
+                continue
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            # 紧跟在 [ 或 [^ 之后的 ] 是普通字符
+            end = i + 1
+            if pattern.startswith("^", end):
+                end += 1
+            if pattern.startswith("]", end):
+                end += 1
+            out.append(pattern[i:end])
+            i = end
+            in_class = True
+            continue
+        elif pattern.startswith("(?(", i):
+            reference = re.match(r"\(\?\((\d+)\)", pattern[i:])
+            if reference:
+                out.append(f"(?({int(reference.group(1)) + offset})")
+                i += reference.end()
+                continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+class NameReplacer:
+    """
+    编译好的一组替换规则
+
+    rules 为 ReplaceRule 或 (pattern, replacement, regex) 序列。
+    规则为空、字符串为空、替换内容包含路径分隔符或正则表达式不正确时抛出 ValueError。
+    可以在多个线程中同时使用。
+    """
+
+    def __init__(self, rules):
+        self.rules = [ReplaceRule(*rule) for rule in rules]
+        if not self.rules:
+            raise ValueError("没有替换规则")
+
+        literals = {}
+        parts = []
+        # 组合表达式中每条正则表达式规则外层分组的编号
+        self._groups = []
+        group = 0
+        for rule in self.rules:
+            if not rule.pattern:
+                raise ValueError("要替换的字符串不能为空")
+            # 正则表达式的替换内容中 \ 是转义字符，只检查 /，分组引用的结果在生成新名称后检查
+            separators = ("/",) if rule.regex else ("/", os.sep, os.altsep)
+            if any(sep and sep in rule.replacement for sep in separators):
+                raise ValueError(f"替换内容不能包含路径分隔符: {rule.replacement}")
+            if not rule.regex:
+                literals.setdefault(rule.pattern, rule.replacement)
+                continue
+            try:
+                compiled = re.compile(rule.pattern)
+            except re.error as e:
+                raise ValueError(f"正则表达式不正确: {rule.pattern}: {e}") from None
+            group += 1
+            self._groups.append((group, compiled, rule.replacement))
+            pattern = _shift_group_references(rule.pattern, group)
+            # 开头的 (?i) 等全局标志在组合表达式中只能作用于这条规则
+            flags = re.match(r"\(\?([aiLmsux]+)\)", pattern)
+            if flags:
+                pattern = f"(?{flags.group(1)}:{pattern[flags.end():]})"
+            parts.append(f"({pattern})")
+            group += compiled.groups
+
+        self._literals = literals
+        if literals:
+            parts.insert(0, _trie_pattern(literals))
+        try:
+            self._pattern = re.compile("|".join(parts))
+        except re.error as e:
+            raise ValueError(f"正则表达式不能组合使用: {e}") from None
+
+    def _substitute(self, match):
+        """返回匹配内容的替换文字"""
+        for group, compiled, replacement in self._groups:
+            if match.start(group) >= 0:
+                if not replacement:
+                    return ""
+                # 用单独编译的表达式在同一位置重新匹配，分组引用使用规则自身的编号
+                own = compiled.match(match.string, match.start())
+                return own.expand(replacement) if own else replacement
+        return self._literals[match.group()]
+
+    def replace(self, name):
+        """返回替换后的文件名，没有匹配时返回原文件名"""
+        return self._pattern.sub(self._substitute, name)
+
+    def to_json(self):
+        """返回可以写入日志的规则列表"""
+        return [list(rule) for rule in self.rules]
+
+
+def compile_rules(rules):
+    """
+    把各种形式的规则转换为 NameReplacer
+
+    rules 可以是 NameReplacer、单个要删除的字符串，或 ReplaceRule 序列。
+    """
+    if isinstance(rules, NameReplacer):
+        return rules
+    if isinstance(rules, str):
+        rules = [ReplaceRule(rules)]
+    return NameReplacer(rules)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+操作耗时和系统调用统计
+记录一次操作在各阶段（扫描、stat、排序、计划、重命名/复制、删除）花费的时间，
+stat/rename/copy/unlink 等调用的次数和传输的字节数，以及最慢的若干个文件，
+用于判断时间花在了元数据操作还是数据传输上（例如在网络共享文件夹上）
+
+各阶段的时间是所有线程累计的时间，多线程执行时总和可能超过实际耗时。
+扫描和 stat 按文件夹汇总后一次写入，不会为每个文件加锁。
+"""
+
+import heapq
+import json
+import os
+import threading
+from datetime import datetime
+
+
+# 各阶段的名称，按通常的执行顺序排列
+PHASE_LABELS = {
+    "scan": "扫描",
+    "stat": "读取文件信息",
+    "sort": "排序",
+    "plan": "计划",
+    "hash": "计算校验值",
+    "mkdir": "新建文件夹",
+    "copy": "复制",
+    "rename": "重命名",
+    "delete": "删除",
+}
+
+# 报告中保留的最慢文件数
+SLOWEST_FILES = 10
+
+# 自动保存的报告文件夹
+DEFAULT_REPORT_DIR = os.path.join(os.path.expanduser("~"), ".file_renamer", "reports")
+
+# 自动保存的报告最多保留的份数，超过时删除最旧的
+MAX_SAVED_REPORTS = 50
+
+
+class OperationStats:
+    """
+    一次操作的分阶段耗时、调用次数和最慢的文件
+
+    所有方法都是线程安全的；对象可以被pickle。
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.calls = {}
+        self.bytes_moved = 0
+        # 最慢的文件：(耗时, 路径, 操作) 的小顶堆
+        self._slowest = []
+        # 堆已满时进入堆所需的最短耗时，低于它的文件不需要加锁
+        self._slow_floor = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, calls=None, count=0, nbytes=0):
+        """
+        在阶段 phase 中累加 seconds 秒
+
+        calls 为调用名称，count 为调用次数，nbytes 为传输的字节数。
+        """
+        with self._lock:
+            total, times = self.phases.get(phase, (0.0, 0))
+            self.phases[phase] = (total + seconds, times + 1)
+            if calls is not None and count:
+                self.calls[calls] = self.calls.get(calls, 0) + count
+            self.bytes_moved += nbytes
+
+    def record_file(self, path, seconds, action):
+        """记录单个文件的耗时，只保留最慢的 SLOWEST_FILES 个"""
+        if seconds <= self._slow_floor:
+            return
+        with self._lock:
+            item = (seconds, path, action)
+            if len(self._slowest) < SLOWEST_FILES:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+            if len(self._slowest) == SLOWEST_FILES:
+                self._slow_floor = self._slowest[0][0]
+
+    def merge(self, other):
+        """把另一个统计累加到当前统计中"""
+        for phase, (seconds, times) in other.phases.items():
+            with self._lock:
+                total, count = self.phases.get(phase, (0.0, 0))
+                self.phases[phase] = (total + seconds, count + times)
+        with self._lock:
+            for name, count in other.calls.items():
+                self.calls[name] = self.calls.get(name, 0) + count
+            self.bytes_moved += other.bytes_moved
+        for seconds, path, action in other.slowest():
+            self.record_file(path, seconds, action)
+
+    def slowest(self):
+        """返回最慢的文件 [(耗时, 路径, 操作)]，最慢的在前"""
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def to_dict(self):
+        """返回可以写入JSON的统计结果"""
+        with self._lock:
+            phases = {phase: {"seconds": round(seconds, 6), "count": times}
+                      for phase, (seconds, times) in self.phases.items()}
+            calls = dict(self.calls)
+            bytes_moved = self.bytes_moved
+        return {
+            "phases": phases,
+            "calls": calls,
+            "bytes_moved": bytes_moved,
+            "slowest": [{"path": path, "action": action, "seconds": round(seconds, 6)}
+                        for seconds, path, action in self.slowest()],
+        }
+
+    def summary_lines(self):
+        """返回各阶段耗时、调用次数和最慢文件的中文摘要"""
+        lines = []
+        phases = sorted(self.phases.items(), key=lambda item: -item[1][0])
+        if phases:
+            lines.append("耗时分布: " + "，".join(
+                f"{PHASE_LABELS.get(phase, phase)} {seconds:.2f} 秒"
+                for phase, (seconds, times) in phases))
+        if self.calls:
+            lines.append("调用次数: " + "，".join(
+                f"{name} {count}" for name, count in sorted(self.calls.items())))
+        slowest = self.slowest()
+        if slowest:
+            seconds, path, action = slowest[0]
+            lines.append(f"最慢的文件: {path}（{action} {seconds:.3f} 秒）")
+        return lines
+
+
+def build_report(result):
+    """把 OperationResult 整理为结构化的报告字典"""
+    return {
+        "operation": result.operation,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "elapsed": round(result.elapsed, 6),
+        "cancelled": result.cancelled,
+        "processed": result.processed,
+        "skipped": result.skipped,
+        "failed": result.failed,
+        "deleted": result.deleted,
+        "bytes_done": result.bytes_done,
+        "strategies": dict(result.strategies),
+        **result.stats.to_dict(),
+        "errors": [{"path": path, "error": error} for path, error in result.errors],
+    }
+
+
+def write_report(result, path):
+    """把操作结果和统计写入JSON报告，返回报告路径"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(build_report(result), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return path
+
+
+def new_report_path(operation, directory=DEFAULT_REPORT_DIR):
+    """为一次操作生成新的报告文件路径"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(directory, f"{operation}_{stamp}_{os.getpid()}.json")
+
+
+def prune_reports(directory=DEFAULT_REPORT_DIR, keep=MAX_SAVED_REPORTS):
+    """只保留报告文件夹中最新的 keep 份报告，返回删除的份数"""
+    try:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if name.endswith(".json")]
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for path in sorted(paths, key=_mtime, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _mtime(path):
+    """返回文件修改时间，文件已不存在时返回0"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
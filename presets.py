@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务预设和界面设置
+预设把一次操作的全部参数（文件夹、模板、替换规则、线程数等）保存为一个名称，
+界面和命令行都可以一键重新执行
+
+预设保存在 ~/.file_renamer/presets 中，每个预设一个JSON文件，文件名即预设名称。
+列出预设只读取文件夹中的文件名，选择或运行某个预设时才读取和解析它的内容，
+有几百个预设也不影响启动速度。界面上次使用的输入保存在 ~/.file_renamer/settings.json。
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import file_engine
+from name_replace import NameReplacer, ReplaceRule
+from rename_template import DEFAULT_TEMPLATE, RenameTemplate
+
+
+# 默认的预设文件夹和界面设置文件
+DEFAULT_PRESET_DIR = os.path.join(os.path.expanduser("~"), ".file_renamer", "presets")
+DEFAULT_SETTINGS_PATH = os.path.join(os.path.expanduser("~"), ".file_renamer", "settings.json")
+
+PRESET_SUFFIX = ".json"
+
+# 各操作的参数和默认值，默认值为 None 的参数必须提供，类型为字符串；
+# 其他参数的类型必须与默认值相同；batch_rename 的 date 为空时使用运行当天的日期
+PRESET_FIELDS = {
+    "copy_and_clean": {"source": None, "target": None, "overwrite": False,
+                       "workers": file_engine.DEFAULT_COPY_WORKERS, "background_clear": False,
+                       "sync": False, "checksum": False},
+    "batch_rename": {"folder": None, "brand": "品牌", "date": "", "template": DEFAULT_TEMPLATE,
+                     "workers": file_engine.DEFAULT_RENAME_WORKERS, "incremental": False,
+                     "low_memory": False},
+    "clean_filenames": {"folder": None, "rules": [["副图_1", "", False]]},
+}
+
+
+class PresetError(Exception):
+    """预设不存在、名称不合法或内容不正确"""
+
+
+def make_preset(operation, **fields):
+    """
+    检查参数并补全默认值，返回预设字典
+
+    缺少必需的参数、有未知的参数、参数类型不正确或操作类型不正确时抛出 PresetError。
+    手工编辑的预设中 "false" 之类的字符串不会被当作布尔值。
+    """
+    if operation not in PRESET_FIELDS:
+        raise PresetError(f"未知的操作类型: {operation}")
+    defaults = PRESET_FIELDS[operation]
+    unknown = set(fields) - set(defaults)
+    if unknown:
+        raise PresetError(f"{operation} 不支持的参数: {', '.join(sorted(unknown))}")
+
+    preset = {"operation": operation}
+    for key, default in defaults.items():
+        value = fields.get(key, default)
+        if value is None:
+            raise PresetError(f"缺少参数: {key}")
+        expected = str if default is None else type(default)
+        # bool 是 int 的子类，线程数不能写成 true/false
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise PresetError(f"参数 {key} 的类型不正确，应为 {expected.__name__}: {value!r}")
+        preset[key] = value
+    try:
+        if operation == "clean_filenames":
+            preset["rules"] = [list(ReplaceRule(*rule)) for rule in preset["rules"]]
+            for pattern, replacement, regex in preset["rules"]:
+                if not (isinstance(pattern, str) and isinstance(replacement, str)
+                        and isinstance(regex, bool)):
+                    raise PresetError(f"替换规则的类型不正确: {[pattern, replacement, regex]!r}")
+            NameReplacer(preset["rules"])
+        elif operation == "batch_rename":
+            RenameTemplate(preset["template"])
+    except (TypeError, ValueError) as e:
+        raise PresetError(str(e)) from e
+    if "workers" in preset and preset["workers"] < 1:
+        raise PresetError("线程数必须是正整数")
+    return preset
+
+
+class PresetStore:
+    """
+    保存在文件夹中的预设
+
+    names() 只列出文件名；load() 读取单个预设，并按文件修改时间缓存解析结果。
+    """
+
+    def __init__(self, directory=DEFAULT_PRESET_DIR):
+        self.directory = directory
+        self._cache = {}
+
+    def path(self, name):
+        """返回预设文件的路径，名称不能作为文件名时抛出 PresetError"""
+        if (not name or name != name.strip() or name.startswith(".")
+                or any(char in name for char in '/\\:*?"<>|')):
+            raise PresetError(f"预设名称不合法: {name!r}")
+        return os.path.join(self.directory, name + PRESET_SUFFIX)
+
+    def names(self):
+        """返回所有预设名称，按名称排序"""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(PRESET_SUFFIX)] for name in files
+                      if name.endswith(PRESET_SUFFIX) and not name.startswith("."))
+
+    def load(self, name):
+        """读取预设，不存在或内容不正确时抛出 PresetError"""
+        path = self.path(name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise PresetError(f"预设不存在: {name}") from None
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == mtime_ns:
+            return dict(cached[1])
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            preset = make_preset(data.pop("operation", None), **data)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            raise PresetError(f"无法读取预设 {name}: {e}") from e
+        self._cache[name] = (mtime_ns, preset)
+        return dict(preset)
+
+    def save(self, name, preset):
+        """保存预设，同名的预设会被替换"""
+        path = self.path(name)
+        preset = make_preset(**preset)
+        _write_json(path, preset)
+        self._cache.pop(name, None)
+
+    def delete(self, name):
+        """删除预设"""
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            raise PresetError(f"预设不存在: {name}") from None
+        self._cache.pop(name, None)
+
+
+def _write_json(path, data):
+    """先写入临时文件再替换，中途退出不会留下不完整的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def _preset_date(preset):
+    """返回预设的日期，没有指定时为今天"""
+    return preset["date"] or datetime.now().strftime("%Y年%m月%d日")
+
+
+def plan_preset(preset):
+    """逐个返回执行预设的计划，不修改任何文件"""
+    operation = preset["operation"]
+    if operation == "copy_and_clean":
+        return file_engine.plan_copy_and_clean(preset["source"], preset["target"],
+                                               preset["sync"], preset["checksum"])
+    if operation == "batch_rename":
+        if preset["incremental"]:
+            return file_engine.plan_incremental_rename(
+                preset["folder"], preset["brand"], _preset_date(preset),
+                template=preset["template"])
+        return file_engine.plan_batch_rename(
+            preset["folder"], preset["brand"], _preset_date(preset),
+            low_memory=preset["low_memory"], template=preset["template"])
+    return file_engine.plan_clean_filenames(preset["folder"], preset["rules"])
+
+
+def run_preset(preset, progress=None, token=None, journal=None):
+    """
+    执行预设，返回 OperationResult
+
+    参数与对应的 file_engine 函数相同；复制文件夹的目标不为空且预设没有设置 overwrite 或 sync 时
+    抛出 file_engine.TargetNotEmptyError。journal 对复制文件夹无效。
+    """
+    operation = preset["operation"]
+    if operation == "copy_and_clean":
+        return file_engine.copy_and_clean(preset["source"], preset["target"],
+                                          preset["overwrite"], preset["workers"],
+                                          progress=progress, token=token,
+                                          background_clear=preset["background_clear"],
+                                          sync=preset["sync"], checksum=preset["checksum"])
+    if operation == "batch_rename":
+        if preset["incremental"]:
+            return file_engine.incremental_rename(
+                preset["folder"], preset["brand"], _preset_date(preset),
+                max_workers=preset["workers"], progress=progress, token=token, journal=journal,
+                template=preset["template"])
+        return file_engine.batch_rename(
+            preset["folder"], preset["brand"], _preset_date(preset), preset["workers"],
+            progress=progress, token=token, journal=journal, low_memory=preset["low_memory"],
+            template=preset["template"])
+    return file_engine.clean_filenames(preset["folder"], preset["rules"], progress=progress,
+                                       token=token, journal=journal)
+
+
+def journal_operation(preset):
+    """返回预设对应的日志操作名称，不记录日志的操作返回 None"""
+    operation = preset["operation"]
+    if operation == "batch_rename" and preset["incremental"]:
+        return "incremental_rename"
+    return None if operation == "copy_and_clean" else operation
+
+
+def load_settings(path=DEFAULT_SETTINGS_PATH):
+    """读取界面设置，文件不存在或损坏时返回空字典"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def save_settings(settings, path=DEFAULT_SETTINGS_PATH):
+    """保存界面设置"""
+    _write_json(path, settings)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量重命名索引
+用SQLite记录每个文件夹的修改时间、已分配的最大编号、子文件夹和已编号的文件，
+增量重命名时修改时间没有变化的文件夹不需要重新列出和读取文件信息
+"""
+
+import json
+import os
+import sqlite3
+from collections import namedtuple
+
+
+# 默认的索引文件
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".file_renamer", "rename_index.sqlite3")
+
+# 索引中的文件夹记录：修改时间（纳秒）、已分配的最大编号、子文件夹名列表
+FolderRecord = namedtuple("FolderRecord", ["mtime_ns", "last_number", "subdirs"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    last_number INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (folder, name)
+) WITHOUT ROWID;
+"""
+
+
+class RenameIndex:
+    """
+    增量重命名索引
+
+    文件夹以绝对路径为键。每次 update 后立即提交，中途退出时已处理的文件夹不会丢失；
+    使用WAL模式，提交不需要每次同步磁盘。只应在创建它的线程中使用。
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, folder):
+        """返回文件夹的 FolderRecord，没有记录时返回 None"""
+        row = self._conn.execute(
+            "SELECT mtime_ns, last_number, subdirs FROM folders WHERE path = ?",
+            (os.path.abspath(folder),)).fetchone()
+        if row is None:
+            return None
+        return FolderRecord(row[0], row[1], json.loads(row[2]))
+
+    def known_files(self, folder):
+        """返回文件夹中已经编号的文件名集合"""
+        rows = self._conn.execute("SELECT name FROM files WHERE folder = ?",
+                                  (os.path.abspath(folder),))
+        return {name for name, in rows}
+
+    def update(self, folder, mtime_ns, last_number, subdirs, added=(), removed=()):
+        """更新文件夹记录和已编号的文件，并提交"""
+        folder = os.path.abspath(folder)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folders (path, mtime_ns, last_number, subdirs) "
+                "VALUES (?, ?, ?, ?)",
+                (folder, mtime_ns, last_number, json.dumps(list(subdirs), ensure_ascii=False)))
+            self._conn.executemany("DELETE FROM files WHERE folder = ? AND name = ?",
+                                   ((folder, name) for name in removed))
+            self._conn.executemany("INSERT OR IGNORE INTO files (folder, name) VALUES (?, ?)",
+                                   ((folder, name) for name in added))
+
+    def forget(self, folder, recursive=True):
+        """删除文件夹的记录，recursive 为 True 时同时删除所有子文件夹的记录"""
+        folder = os.path.abspath(folder)
+        prefix = os.path.join(folder, "") if recursive else None
+        with self._conn:
+            for table, column in (("folders", "path"), ("files", "folder")):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?",
+                    (folder, len(prefix or ""), prefix))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重命名日志
+以追加方式记录批量重命名和清理文件名执行的每一次改名，用于中断后继续和整体撤销
+
+日志为UTF-8编码的JSON Lines文件，每行一条记录：
+    {"op": ..., "folder": ..., "args": {...}}   文件头，记录操作类型和参数
+    {"p": 编号, "dir": 文件夹, "ops": [[旧名, 新名], ...], "temps": [...]}
+                                                 一个文件夹的改名步骤，执行前写入
+    {"p": 编号, "at": 序号, "ops": [...], "cut": false}
+                                                 第 at 步没有按计划执行，改为执行 ops；
+                                                 cut 为 true 时其后的步骤都未执行
+    {"p": 编号, "started": true}                 第一次改名已经完成
+    {"p": 编号, "done": true}                    该文件夹已处理完成
+    {"p": 编号, "undone": true}                  该文件夹的改名已撤销
+    {"resume": 时间} / {"end": 时间, "cancelled": false} / {"undone": 时间}
+
+改名步骤总是在执行前写入文件，进程崩溃时不会丢失；为减少磁盘同步，
+文件只按 JOURNAL_SYNC_INTERVAL 定期fsync，断电时可能丢失最后一段时间的记录。
+"""
+
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，不加文件锁
+    fcntl = None
+
+
+# 日志格式版本
+JOURNAL_VERSION = 1
+
+# 两次fsync之间的最短间隔（秒）
+JOURNAL_SYNC_INTERVAL = 1.0
+
+# 缓存的完成记录超过此条数时写入文件
+JOURNAL_BUFFER_RECORDS = 256
+
+# 默认的日志文件夹
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".file_renamer", "journals")
+
+# 日志文件夹中最多保留的已结束日志份数，中断的和还能继续执行的日志不计入也不删除
+MAX_SAVED_JOURNALS = 50
+
+# 可以继续执行的操作；其他操作（如监视文件夹）的日志只能撤销
+RESUMABLE_OPERATIONS = ("batch_rename", "incremental_rename", "clean_filenames")
+
+# new_journal_path 生成的文件名：操作_日期_时间_微秒_进程号_随机后缀.jsonl
+_JOURNAL_NAME = re.compile(r"(?P<op>.+)_\d{8}_\d{6}_\d{6}_\d+_[0-9a-f]{8}\.jsonl")
+
+# 生成的日志文件名重复时最多重新生成的次数
+_JOURNAL_CREATE_ATTEMPTS = 10
+
+
+class JournalError(Exception):
+    """日志文件无法使用：格式不正确、已撤销或正在被其他进程使用"""
+
+
+class JournalPlan:
+    """
+    日志中一个文件夹的改名步骤
+
+    slots 与写入时的步骤一一对应，每个位置保存实际执行的改名列表，
+    执行中的偏差（失败、改回原名、取消）会替换对应位置。
+    """
+
+    __slots__ = ("plan_id", "root", "slots", "temps", "started", "done", "undone")
+
+    def __init__(self, plan_id, root, ops, temps=()):
+        self.plan_id = plan_id
+        self.root = root
+        self.slots = [[tuple(op)] for op in ops]
+        self.temps = set(temps)
+        self.started = False
+        self.done = False
+        self.undone = False
+
+    def replace(self, index, ops, cut=False):
+        """把第 index 步替换为 ops；cut 为 True 时丢弃其后的步骤"""
+        self.slots[index] = [tuple(op) for op in ops]
+        if cut:
+            del self.slots[index + 1:]
+
+    def operations(self):
+        """按执行顺序返回实际执行过的改名步骤 [(旧名, 新名)]"""
+        return [op for slot in self.slots for op in slot]
+
+
+class JournalState:
+    """read_journal 的结果：文件头、按写入顺序排列的改名步骤和整体状态"""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.plans = []
+        self.ended = False
+        self.cancelled = False
+        self.undone = False
+
+    @property
+    def operation(self):
+        return self.header["op"]
+
+    @property
+    def folder(self):
+        return self.header["folder"]
+
+    @property
+    def args(self):
+        return self.header.get("args", {})
+
+    @property
+    def done_dirs(self):
+        """已处理完成的文件夹"""
+        return {plan.root for plan in self.plans if plan.done and not plan.undone}
+
+
+def read_journal(path):
+    """
+    读取日志文件，返回 JournalState
+
+    写入中途崩溃导致的不完整的最后一行会被忽略。
+    """
+    state = JournalState(path)
+    plans = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError as e:
+        raise JournalError(f"无法读取日志: {path}: {e}") from e
+
+    for number, line in enumerate(lines, 1):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            if number == len(lines):
+                break
+            raise JournalError(f"日志第 {number} 行格式不正确: {path}") from None
+
+        if "op" in record:
+            state.header = record
+        elif "p" in record:
+            if "dir" in record:
+                plan = JournalPlan(record["p"], record["dir"], record["ops"],
+                                   record.get("temps", ()))
+                plans[plan.plan_id] = plan
+                state.plans.append(plan)
+            elif record["p"] in plans:
+                plan = plans[record["p"]]
+                if "at" in record:
+                    plan.replace(record["at"], record["ops"], record.get("cut", False))
+                elif record.get("undone"):
+                    plan.undone = True
+                elif record.get("started"):
+                    plan.started = True
+                elif record.get("done"):
+                    plan.done = True
+        elif "end" in record:
+            state.ended = True
+            state.cancelled = record.get("cancelled", False)
+        elif "resume" in record:
+            state.ended = False
+            state.cancelled = False
+        elif "undone" in record:
+            state.undone = True
+
+    if state.header is None:
+        raise JournalError(f"不是有效的重命名日志: {path}")
+    return state
+
+
+def journal_operation(path):
+    """从 new_journal_path 生成的日志文件名中取出操作名称，不读取文件"""
+    return os.path.basename(path).rsplit("_", 5)[0]
+
+
+def new_journal_path(operation, directory=DEFAULT_JOURNAL_DIR):
+    """
+    为一次操作生成新的日志文件路径
+
+    文件名包含微秒、进程号和随机后缀；RenameJournal.create 遇到重名时会重新生成。
+    """
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(directory,
+                        f"{operation}_{stamp}_{os.getpid()}_{secrets.token_hex(4)}.jsonl")
+
+
+def list_journals(directory=DEFAULT_JOURNAL_DIR, operations=None):
+    """返回日志文件夹中的日志路径，最新的在前；operations 为操作名称列表时只返回这些操作的日志"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(directory, name) for name in names
+             if name.endswith(".jsonl") and (operations is None or
+                                             journal_operation(name) in operations)]
+    paths.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+    return paths
+
+
+def journal_status(path):
+    """
+    只读取日志的最后一行判断状态，不解析整个文件
+
+    返回 "finished"、"cancelled"、"undone" 或 "interrupted"（中途退出或正在执行）。
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            continue
+        if "end" in record:
+            return "cancelled" if record.get("cancelled") else "finished"
+        if "undone" in record and "p" not in record:
+            return "undone"
+        return "interrupted"
+    return "interrupted"
+
+
+def prune_journals(directory=DEFAULT_JOURNAL_DIR, keep=MAX_SAVED_JOURNALS):
+    """
+    只保留日志文件夹中最新的 keep 份已结束的日志，返回删除的份数
+
+    中断的日志和已取消、还能继续执行的日志总是保留，以便继续执行或撤销。
+    """
+    ended = []
+    for path in list_journals(directory):
+        try:
+            status = journal_status(path)
+        except OSError:
+            continue
+        if status == "interrupted" or (status == "cancelled" and
+                                       journal_operation(path) in RESUMABLE_OPERATIONS):
+            continue
+        ended.append(path)
+    removed = 0
+    for path in ended[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class RenameJournal:
+    """
+    追加写入的重命名日志
+
+    改名步骤和偏差记录在调用时立即写入文件，完成记录先缓存，随下一次写入一起写出。
+    距离上次fsync超过 JOURNAL_SYNC_INTERVAL 秒时在写入后同步到磁盘，关闭时总会同步。
+    可以在多个线程中同时使用；打开期间对文件加锁，防止两个进程同时写入同一份日志。
+    """
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_sync = time.monotonic()
+        self._next_id = max((plan.plan_id for plan in state.plans), default=-1) + 1 if state else 0
+        self._done_dirs = state.done_dirs if state else set()
+        self._file = open(path, "a", encoding="utf-8")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                raise JournalError(f"日志正在被其他进程使用: {path}") from None
+
+    @classmethod
+    def create(cls, path, operation, folder, args):
+        """
+        新建日志并写入文件头
+
+        日志文件以独占方式创建，不会接着写入已有的日志；path 是 new_journal_path
+        生成的文件名时，重名会换一个新文件名重试，返回的日志的 path 属性是实际使用的路径。
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        for _ in range(_JOURNAL_CREATE_ATTEMPTS):
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                break
+            except FileExistsError:
+                match = _JOURNAL_NAME.fullmatch(os.path.basename(path))
+                if match is None:
+                    raise JournalError(f"日志已存在: {path}") from None
+                path = new_journal_path(match["op"], directory)
+        else:
+            raise JournalError(f"无法创建日志: {path}")
+        journal = cls(path)
+        journal._write({"op": operation, "folder": os.path.abspath(folder), "args": args,
+                        "version": JOURNAL_VERSION, "started": time.time()}, sync=True)
+        return journal
+
+    @classmethod
+    def reopen(cls, path):
+        """打开已有日志继续追加，返回 (日志, JournalState)"""
+        state = read_journal(path)
+        journal = cls(path, state)
+        return journal, state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, record, flush=True, sync=False):
+        """写入一条记录；flush 为 False 时先缓存"""
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._pending.append(line)
+            if not flush and len(self._pending) < JOURNAL_BUFFER_RECORDS:
+                return
+            self._file.write("".join(self._pending))
+            self._pending.clear()
+            self._file.flush()
+            now = time.monotonic()
+            if sync or now - self._last_sync >= JOURNAL_SYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+
+    def is_done(self, root):
+        """文件夹是否在之前的运行中已处理完成"""
+        return os.path.abspath(root) in self._done_dirs
+
+    def log_plan(self, root, ops, temps=()):
+        """在执行前写入一个文件夹的改名步骤，返回步骤编号"""
+        with self._lock:
+            plan_id = self._next_id
+            self._next_id += 1
+        self._write({"p": plan_id, "dir": os.path.abspath(root), "ops": ops, "temps": list(temps)})
+        return plan_id
+
+    def log_replace(self, plan_id, index, ops=(), cut=False):
+        """记录第 index 步没有按计划执行，实际执行的是 ops"""
+        self._write({"p": plan_id, "at": index, "ops": list(ops), "cut": cut})
+
+    def log_started(self, plan_id):
+        """记录文件夹中第一次改名已经完成，用于区分未执行和全部执行完"""
+        self._write({"p": plan_id, "started": True})
+
+    def log_done(self, plan_id):
+        """记录文件夹已处理完成"""
+        self._write({"p": plan_id, "done": True}, flush=False)
+
+    def log_undone(self, plan_id):
+        """记录文件夹的改名已撤销"""
+        self._write({"p": plan_id, "undone": True})
+
+    def log_resume(self):
+        """记录中断的操作重新开始执行"""
+        self._write({"resume": time.time()})
+
+    def finish(self, cancelled=False):
+        """记录操作结束"""
+        self._write({"end": time.time(), "cancelled": cancelled}, sync=True)
+
+    def finish_undo(self):
+        """记录整个操作已撤销"""
+        self._write({"undone": time.time()}, sync=True)
+
+    def close(self):
+        """写出缓存的记录，同步到磁盘并关闭文件"""
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._pending:
+                self._file.write("".join(self._pending))
+                self._pending.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
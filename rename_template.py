@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重命名模板
+用户自定义批量重命名的文件名格式，每次运行只解析一次模板
+
+模板中 {名称} 或 {名称:参数} 会被替换，其余文字原样保留，{{ 和 }} 表示花括号本身：
+    {brand}              品牌
+    {folder}             文件所在文件夹的名称
+    {parent}             上一级文件夹的名称，{parent:2} 为上两级，依此类推
+    {date}               设置的日期
+    {exif_date}          照片的拍摄日期（EXIF），没有时使用文件的修改日期；
+                         默认格式为 2024年01月15日，可以用 {exif_date:%Y%m%d} 指定格式
+    {counter}            编号，默认四位，{counter:6} 为六位
+    {size}               文件大小（字节），{size:kb}、{size:mb} 为KB、MB（向下取整）
+    {ext}                扩展名（含点），{ext:lower}、{ext:upper} 转换大小写
+模板必须包含 {counter}，否则同一文件夹中的文件会得到相同的名称。
+
+模板编译后按文件夹绑定品牌、文件夹名和日期等固定内容，得到一个格式化字符串，
+每个文件只需要一次 str.format 调用。
+"""
+
+import os
+import re
+import struct
+from datetime import datetime
+
+
+# 默认模板，与原来固定的 品牌_文件夹名称_日期_四位编号 格式相同
+DEFAULT_TEMPLATE = "{brand}_{folder}_{date}_{counter}{ext}"
+
+# {exif_date} 的默认日期格式，与界面中的日期格式相同
+DEFAULT_EXIF_DATE_FORMAT = "%Y年%m月%d日"
+
+# 读取EXIF时最多读取的文件开头字节数，EXIF数据段不超过64KB
+EXIF_READ_LIMIT = 128 * 1024
+
+_FIELD = re.compile(r"\{\{|\}\}|\{(\w+)(?::([^{}]*))?\}|[{}]")
+
+_SIZE_UNITS = {"": 1, "b": 1, "kb": 1024, "mb": 1024 * 1024}
+
+# EXIF中的拍摄时间、数字化时间和修改时间标签，按优先级排列
+_EXIF_IFD_POINTER = 0x8769
+_EXIF_DATE_TAGS = (0x9003, 0x9004)
+_TIFF_DATE_TAG = 0x0132
+
+
+class RenameTemplate:
+    """
+    编译好的重命名模板
+
+    模板格式不正确时抛出 ValueError。可以在多个线程中同时使用。
+    """
+
+    def __init__(self, text=DEFAULT_TEMPLATE):
+        self.text = text
+        # 解析结果：文字为 str，字段为 (名称, 参数)
+        self._parts = []
+        has_counter = False
+        pos = 0
+        for match in _FIELD.finditer(text):
+            if match.start() > pos:
+                self._parts.append(text[pos:match.start()])
+            pos = match.end()
+            token = match.group()
+            if token in ("{{", "}}"):
+                self._parts.append(token[0])
+                continue
+            if match.group(1) is None:
+                raise ValueError(f"模板中的花括号不成对: {text}")
+            field = (match.group(1), match.group(2) or "")
+            _validate_field(*field)
+            has_counter = has_counter or field[0] == "counter"
+            self._parts.append(field)
+        if pos < len(text):
+            self._parts.append(text[pos:])
+
+        if not has_counter:
+            raise ValueError("模板必须包含 {counter}")
+        literal = "".join(part for part in self._parts if isinstance(part, str))
+        if _has_separator(literal):
+            raise ValueError("模板中不能包含路径分隔符")
+
+    def __repr__(self):
+        return f"RenameTemplate({self.text!r})"
+
+    def bind(self, root, brand, date_str):
+        """
+        绑定文件夹 root 中固定的内容，返回为该文件夹中的文件生成名称的 BoundTemplate
+
+        模板用到的品牌或日期中有路径分隔符时抛出 ValueError。
+        """
+        ancestors = []
+        path = os.path.abspath(root)
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            ancestors.append(os.path.basename(path))
+            path = parent
+        constants = {"brand": brand, "date": date_str, "folder": os.path.basename(root)}
+
+        pieces = []
+        slots = []
+        for part in self._parts:
+            if isinstance(part, str):
+                pieces.append(_escape(part))
+                continue
+            name, spec = part
+            if name == "counter":
+                pieces.append("{0:0%dd}" % int(spec or 4))
+            elif name == "parent":
+                level = int(spec or 1)
+                pieces.append(_escape(ancestors[level] if level < len(ancestors) else ""))
+            elif name in constants:
+                if _has_separator(constants[name]):
+                    raise ValueError(f"{{{name}}} 的内容不能包含路径分隔符: {constants[name]}")
+                pieces.append(_escape(constants[name]))
+            else:
+                slots.append((name, spec))
+                pieces.append("{%d}" % len(slots))
+        return BoundTemplate(root, "".join(pieces).format, slots)
+
+
+class BoundTemplate:
+    """
+    绑定到单个文件夹的模板
+
+    values() 计算与编号无关的部分（扩展名、大小、拍摄日期），format() 只代入编号，
+    编号被占用需要尝试下一个编号时不必重新读取文件信息。
+    """
+
+    __slots__ = ("root", "_format", "_slots")
+
+    def __init__(self, root, format_func, slots):
+        self.root = root
+        self._format = format_func
+        self._slots = slots
+
+    def values(self, file, mtime, size):
+        """返回文件 file 中与编号无关的字段值"""
+        if not self._slots:
+            return ()
+        ext = os.path.splitext(file)[1]
+        shot = None
+        values = []
+        for name, spec in self._slots:
+            if name == "ext":
+                values.append(ext.lower() if spec == "lower" else
+                              ext.upper() if spec == "upper" else ext)
+            elif name == "size":
+                values.append(size // _SIZE_UNITS[spec.lower()])
+            else:
+                if shot is None:
+                    shot = (read_exif_date(os.path.join(self.root, file))
+                            or datetime.fromtimestamp(mtime))
+                values.append(shot.strftime(spec or DEFAULT_EXIF_DATE_FORMAT))
+        return tuple(values)
+
+    def format(self, counter, values):
+        """返回编号为 counter 的文件名"""
+        return self._format(counter, *values)
+
+
+def _escape(text):
+    """转义 str.format 中的花括号"""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _has_separator(text):
+    """判断文字中是否有路径分隔符"""
+    return any(sep and sep in text for sep in ("/", os.sep, os.altsep))
+
+
+def _validate_field(name, spec):
+    """检查字段名称和参数"""
+    if name in ("brand", "folder", "date"):
+        if spec:
+            raise ValueError(f"{{{name}}} 不接受参数: {spec}")
+    elif name in ("parent", "counter"):
+        if spec and not (spec.isdigit() and 1 <= int(spec) <= 12):
+            raise ValueError(f"{{{name}}} 的参数必须是1到12之间的整数: {spec}")
+    elif name == "size":
+        if spec.lower() not in _SIZE_UNITS:
+            raise ValueError(f"{{size}} 的参数只能是 kb 或 mb: {spec}")
+    elif name == "ext":
+        if spec not in ("", "lower", "upper"):
+            raise ValueError(f"{{ext}} 的参数只能是 lower 或 upper: {spec}")
+    elif name == "exif_date":
+        try:
+            sample = datetime(2000, 1, 2, 3, 4, 5).strftime(spec or DEFAULT_EXIF_DATE_FORMAT)
+        except ValueError as e:
+            raise ValueError(f"{{exif_date}} 的日期格式不正确: {spec}") from e
+        # %D、%x 等格式的结果中也可能有 /
+        if _has_separator(sample):
+            raise ValueError(f"{{exif_date}} 的日期格式不能产生路径分隔符: {spec}")
+    else:
+        raise ValueError(f"模板中有未知的字段: {{{name}}}")
+
+
+def compile_template(template):
+    """把模板文本转换为 RenameTemplate；None 表示默认模板，已编译的模板直接返回"""
+    if isinstance(template, RenameTemplate):
+        return template
+    return RenameTemplate(DEFAULT_TEMPLATE if template is None else template)
+
+
+def read_exif_date(path):
+    """
+    读取JPEG或TIFF格式（包括大多数相机RAW文件）照片的EXIF拍摄时间
+
+    依次使用拍摄时间、数字化时间和修改时间，都没有或文件无法读取时返回 None。
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(EXIF_READ_LIMIT)
+    except OSError:
+        return None
+    try:
+        if head[:2] == b"\xff\xd8":
+            tiff = _find_jpeg_exif(head)
+        elif head[:4] in (b"II*\0", b"MM\0*"):
+            tiff = head
+        else:
+            return None
+        return _parse_tiff_date(tiff) if tiff else None
+    except (struct.error, IndexError, ValueError):
+        return None
+
+
+def _find_jpeg_exif(data):
+    """返回JPEG文件中APP1段的TIFF数据，没有EXIF时返回 None"""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        if marker == 0xDA:
+            return None
+        length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        segment = data[offset + 4:offset + 2 + length]
+        if marker == 0xE1 and segment.startswith(b"Exif\0\0"):
+            return segment[6:]
+        offset += 2 + length
+    return None
+
+
+def _parse_tiff_date(data):
+    """从TIFF结构中读取日期标签"""
+    order = "<" if data[:2] == b"II" else ">"
+    ifd0 = _read_ifd(data, struct.unpack(order + "I", data[4:8])[0], order)
+    tags = []
+    if _EXIF_IFD_POINTER in ifd0:
+        exif_offset = struct.unpack(order + "I", ifd0[_EXIF_IFD_POINTER][2])[0]
+        exif = _read_ifd(data, exif_offset, order)
+        tags.extend(exif[tag] for tag in _EXIF_DATE_TAGS if tag in exif)
+    if _TIFF_DATE_TAG in ifd0:
+        tags.append(ifd0[_TIFF_DATE_TAG])
+
+    for value_type, count, raw in tags:
+        if value_type != 2:
+            continue
+        if count > 4:
+            offset = struct.unpack(order + "I", raw)[0]
+            raw = data[offset:offset + count]
+        text = raw[:count].split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        try:
+            return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def _read_ifd(data, offset, order):
+    """读取一个IFD，返回 {标签: (类型, 数量, 4字节值或偏移)}"""
+    count = struct.unpack(order + "H", data[offset:offset + 2])[0]
+    entries = {}
+    for index in range(count):
+        start = offset + 2 + index * 12
+        tag, value_type, value_count = struct.unpack(order + "HHI", data[start:start + 8])
+        entries[tag] = (value_type, value_count, data[start + 8:start + 12])
+    return entries
@@ -3,13 +3,27 @@
 """
 文件批量重命名工具测试脚本
 用于创建测试文件和文件夹结构
+
+不带参数运行时显示交互菜单；也可以直接生成指定规模的测试文件夹，例如：
+    python test_app.py generate 测试文件夹 --depth 3 --fanout 10 --total 100000 --sizes uniform:1k-64k
 """
 
+import argparse
+import math
 import os
+import random
 import shutil
+import sys
+import time
 from pathlib import Path
 
 
+# 生成的测试文件使用的扩展名
+GENERATED_EXTENSIONS = (".jpg", ".png", ".gif", ".jpeg")
+
+_SIZE_SUFFIXES = {"": 1, "k": 1024, "m": 1024 * 1024, "g": 1024 * 1024 * 1024}
+
+
 def create_test_structure():
     """创建测试文件夹结构"""
     # 创建测试根目录
@@ -67,6 +81,82 @@ def print_directory_tree(path, prefix=""):
             print_directory_tree(item, next_prefix)
 
 
+def parse_size(text):
+    """把 4096、4k、1.5m 等大小转换为字节数"""
+    text = text.strip().lower().rstrip("b")
+    suffix = text[-1:] if text[-1:] in _SIZE_SUFFIXES else ""
+    return int(float(text[:len(text) - len(suffix)]) * _SIZE_SUFFIXES[suffix])
+
+
+def size_sampler(spec, rng):
+    """
+    把文件大小分布转换为抽样函数
+
+    spec 可以是固定大小（0、4k），uniform:最小-最大（均匀分布），
+    或 lognormal:中位数（对数正态分布，少数文件远大于中位数，接近真实的图片文件夹）。
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        size = parse_size(kind)
+        return lambda: size
+    if kind == "uniform":
+        low, high = (parse_size(part) for part in args.split("-", 1))
+        return lambda: rng.randint(low, high)
+    if kind == "lognormal":
+        median = parse_size(args)
+        mu = 0.0 if median <= 0 else math.log(median)
+        return lambda: int(rng.lognormvariate(mu, 1.0))
+    raise ValueError(f"不支持的文件大小分布: {spec}")
+
+
+def generate_tree(root, depth=2, fanout=4, files_per_folder=10, total=None, sizes="0",
+                  mtime_spread=30 * 86400, marker_ratio=0.5, seed=0):
+    """
+    生成指定规模的测试文件夹，不需要交互
+
+    每个文件夹（包括 root）有 fanout 个子文件夹，共 depth 层；每个文件夹放
+    files_per_folder 个文件，指定 total 时改为把 total 个文件平均分到所有文件夹。
+    sizes 为文件大小分布（见 size_sampler），修改时间在最近 mtime_spread 秒内随机分布，
+    marker_ratio 比例的文件名包含"副图_1"。相同的 seed 生成相同的文件夹。
+    返回 {"folders": 文件夹数, "files": 文件数, "bytes": 总字节数, "markers": 包含副图_1的文件数}。
+    """
+    rng = random.Random(seed)
+    sample_size = size_sampler(sizes, rng)
+    now = time.time()
+
+    folders = [Path(root)]
+    level = [Path(root)]
+    for d in range(depth):
+        level = [parent / f"文件夹{d + 1}_{i + 1}" for parent in level for i in range(fanout)]
+        folders.extend(level)
+    if total is not None:
+        per_folder, extra = divmod(total, len(folders))
+    else:
+        per_folder, extra = files_per_folder, 0
+
+    stats = {"folders": len(folders), "files": 0, "bytes": 0, "markers": 0}
+    buffer = b""
+    for index, folder in enumerate(folders):
+        folder.mkdir(parents=True, exist_ok=True)
+        for i in range(per_folder + (index < extra)):
+            marker = rng.random() < marker_ratio
+            ext = rng.choice(GENERATED_EXTENSIONS)
+            name = f"{folder.name}_图片{'副图_1' if marker else ''}_{i + 1}{ext}"
+            path = folder / name
+            size = sample_size()
+            if size > len(buffer):
+                buffer = b"\0" * max(size, 2 * len(buffer))
+            with open(path, "wb") as f:
+                if size:
+                    f.write(memoryview(buffer)[:size])
+            mtime = now - rng.random() * mtime_spread
+            os.utime(path, (mtime, mtime))
+            stats["files"] += 1
+            stats["bytes"] += size
+            stats["markers"] += marker
+    return stats
+
+
 def create_copy_target():
     """创建复制目标文件夹"""
     target_dir = Path("copy_target")
@@ -89,8 +179,51 @@ def cleanup_test_files():
         print("已删除目标文件夹")
 
 
+def build_parser():
+    """创建非交互模式的命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="python test_app.py",
+                                     description="生成文件批量重命名工具的测试文件夹")
+    subparsers = parser.add_subparsers(dest="command", metavar="命令")
+    subparsers.required = True
+
+    generate_parser = subparsers.add_parser("generate", help="生成指定规模的测试文件夹")
+    generate_parser.add_argument("root", help="生成到的文件夹")
+    generate_parser.add_argument("--depth", type=int, default=2, help="子文件夹层数（默认 2）")
+    generate_parser.add_argument("--fanout", type=int, default=4,
+                                 help="每个文件夹的子文件夹数（默认 4）")
+    generate_parser.add_argument("--files", type=int, default=10,
+                                 help="每个文件夹的文件数（默认 10）")
+    generate_parser.add_argument("--total", type=int,
+                                 help="文件总数，平均分到所有文件夹，指定时忽略 --files")
+    generate_parser.add_argument("--sizes", default="0",
+                                 help="文件大小分布：固定大小如 4k，uniform:1k-64k，或 lognormal:200k（默认 0）")
+    generate_parser.add_argument("--mtime-days", type=float, default=30,
+                                 help="修改时间在最近多少天内随机分布（默认 30）")
+    generate_parser.add_argument("--marker", type=float, default=0.5,
+                                 help="文件名包含\"副图_1\"的比例（默认 0.5）")
+    generate_parser.add_argument("--seed", type=int, default=0, help="随机数种子（默认 0）")
+    return parser
+
+
+def run_generate(args):
+    """生成测试文件夹并打印规模"""
+    if os.path.exists(args.root) and os.listdir(args.root):
+        print(f"错误: 文件夹不为空: {args.root}", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    stats = generate_tree(args.root, args.depth, args.fanout, args.files, args.total, args.sizes,
+                          args.mtime_days * 86400, args.marker, args.seed)
+    print(f"已生成 {stats['folders']} 个文件夹、{stats['files']} 个文件"
+          f"（{stats['bytes']} 字节，{stats['markers']} 个包含副图_1），"
+          f"耗时 {time.perf_counter() - started:.1f} 秒")
+    return 0
+
+
 def main():
     """主函数"""
+    if len(sys.argv) > 1:
+        return run_generate(build_parser().parse_args())
+    
     print("文件批量重命名工具 - 测试脚本")
     print("=" * 50)
     
@@ -131,4 +264,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+file_engine 的单元测试
+用法: python -m unittest test_file_engine 或 python -m pytest
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import file_engine
+import rename_journal
+
+
+def make_tree(root, files):
+    """按 {相对路径: 内容} 创建文件，内容为 None 时创建文件夹；修改时间按顺序递增，使编号稳定"""
+    for number, (rel, data) in enumerate(sorted(files.items())):
+        path = os.path.join(root, rel)
+        if data is None:
+            os.makedirs(path, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.utime(path, (1_600_000_000 + number, 1_600_000_000 + number))
+
+
+def snapshot(root):
+    """返回文件夹的内容 {相对路径: 文件内容或 None（文件夹）}"""
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames:
+            tree[os.path.relpath(os.path.join(dirpath, name), root)] = None
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, encoding="utf-8") as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+class TempDirTest(unittest.TestCase):
+    """每个测试使用新的临时文件夹"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def folder(self, *parts):
+        """返回临时文件夹中的路径"""
+        return os.path.join(self.root, *parts)
+
+
+class KernelCopyTest(unittest.TestCase):
+    """内核复制提前结束时不能当作复制成功"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src.bin")
+        self.dst = os.path.join(self.tmp.name, "dst.bin")
+        self.data = os.urandom(64 * 1024)
+        with open(self.src, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _only(self, method):
+        """只启用指定的内核复制方式"""
+        enabled = {name: name == method for name in file_engine._KERNEL_COPY_ENABLED}
+        return mock.patch.dict(file_engine._KERNEL_COPY_ENABLED, enabled)
+
+    @unittest.skipUnless(hasattr(os, "copy_file_range"), "需要 os.copy_file_range")
+    def test_zero_bytes_falls_back_to_userspace_copy(self):
+        with self._only("copy_file_range"), \
+                mock.patch.object(os, "copy_file_range", return_value=0, create=True):
+            size, strategy = file_engine.fast_copy_file(self.src, self.dst)
+        self.assertEqual(strategy, "copyfile")
+        self.assertEqual(size, len(self.data))
+        with open(self.dst, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    @unittest.skipUnless(hasattr(os, "copy_file_range"), "需要 os.copy_file_range")
+    def test_short_copy_raises(self):
+        calls = iter([1024, 0])
+        with self._only("copy_file_range"), \
+                mock.patch.object(os, "copy_file_range", side_effect=lambda *a: next(calls),
+                                  create=True):
+            with self.assertRaises(OSError):
+                file_engine.fast_copy_file(self.src, self.dst)
+
+
+class RenameCycleTest(TempDirTest):
+    """同一批次中的循环改名和链式改名"""
+
+    def test_swap_and_chain(self):
+        make_tree(self.root, {"a": "A", "b": "B", "c": "C"})
+        names = {file_engine.name_key(name) for name in os.listdir(self.root)}
+        result = file_engine.OperationResult("test")
+        file_engine.rename_in_directory(
+            self.root, [("a", "b"), ("b", "a"), ("c", "d")], names, result)
+        self.assertEqual((result.processed, result.failed), (3, 0))
+        self.assertEqual(snapshot(self.root), {"a": "B", "b": "A", "d": "C"})
+
+    def test_three_way_cycle(self):
+        make_tree(self.root, {"a": "A", "b": "B", "c": "C"})
+        names = {file_engine.name_key(name) for name in os.listdir(self.root)}
+        result = file_engine.OperationResult("test")
+        file_engine.rename_in_directory(
+            self.root, [("a", "b"), ("b", "c"), ("c", "a")], names, result)
+        self.assertEqual(snapshot(self.root), {"a": "C", "b": "A", "c": "B"})
+
+
+class BatchRenameTest(TempDirTest):
+    """批量重命名的中断、继续、撤销和外部排序"""
+
+    FILES = {f"{sub}/img{i}.jpg": f"{sub}{i}" for sub in ("x", "y", "z") for i in range(4)}
+
+    def run_rename(self, folder, **kwargs):
+        return file_engine.batch_rename(folder, "brand", "2024年01月01日", max_workers=1,
+                                        **kwargs)
+
+    def expected(self, **kwargs):
+        """在另一个同名文件夹中完整执行一次，返回结果内容"""
+        folder = self.folder("expected", "photos")
+        make_tree(folder, self.FILES)
+        self.run_rename(folder, **kwargs)
+        return snapshot(folder)
+
+    def test_interrupted_resume_then_undo(self):
+        folder = self.folder("run", "photos")
+        make_tree(folder, self.FILES)
+        original = snapshot(folder)
+        journal = self.folder("journal.jsonl")
+        calls = []
+
+        def crash(result):
+            calls.append(result.processed)
+            if len(calls) == 6:
+                raise RuntimeError("模拟中断")
+
+        with self.assertRaises(RuntimeError):
+            self.run_rename(folder, progress=crash, journal=journal)
+        self.assertEqual(rename_journal.journal_status(journal), "interrupted")
+        self.assertNotEqual(snapshot(folder), original)
+
+        file_engine.resume_journal(journal)
+        self.assertEqual(rename_journal.journal_status(journal), "finished")
+        self.assertEqual(snapshot(folder), self.expected())
+
+        file_engine.undo_journal(journal)
+        self.assertEqual(snapshot(folder), original)
+
+    def test_low_memory_matches_default(self):
+        expected = self.expected()
+        for name, kwargs, limit in (("low_memory", {"low_memory": True}, None),
+                                    ("stream", {}, 2)):
+            with self.subTest(mode=name):
+                folder = self.folder(name, "photos")
+                make_tree(folder, self.FILES)
+                with mock.patch.object(file_engine, "STREAM_DIR_FILES",
+                                       limit or file_engine.STREAM_DIR_FILES):
+                    self.run_rename(folder, **kwargs)
+                self.assertEqual(snapshot(folder), expected)
+
+
+class SyncTest(TempDirTest):
+    """增量同步的结果与清空后重新复制相同"""
+
+    SOURCE = {"a.txt": "newer", "same.txt": "same", "dir_here/inner.txt": "skip",
+              "file_here": None, "sub/deep/x.txt": "skip"}
+    TARGET = {"a.txt": "old", "same.txt": "same", "stale.txt": "stale", "dir_here": "file",
+              "file_here/old.txt": "old", "sub/leftover.txt": "stale", "gone/y.txt": "stale"}
+
+    def test_sync_matches_fresh_copy(self):
+        source, target, fresh = self.folder("src"), self.folder("dst"), self.folder("fresh")
+        make_tree(source, self.SOURCE)
+        make_tree(target, self.TARGET)
+        os.makedirs(fresh)
+        file_engine.copy_and_clean(source, fresh)
+
+        result = file_engine.copy_and_clean(source, target, sync=True)
+        self.assertEqual(snapshot(target), snapshot(fresh))
+        self.assertEqual(result.failed, 0)
+        self.assertGreater(result.deleted, 0)
+
+        # 再次同步时没有需要复制或删除的项目
+        result = file_engine.copy_and_clean(source, target, sync=True)
+        self.assertEqual((result.processed, result.deleted), (0, 0))
+
+
+class BulkDeleteTest(TempDirTest):
+    """并行删除文件夹内容"""
+
+    def open_fds(self):
+        return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else 0
+
+    def test_deletes_tree_without_following_links(self):
+        target, outside = self.folder("target"), self.folder("outside")
+        make_tree(target, {f"d{i}/e{j}/f{k}.txt": "x"
+                           for i in range(5) for j in range(5) for k in range(3)})
+        make_tree(outside, {"keep.txt": "keep"})
+        os.symlink(outside, os.path.join(target, "d0", "link"))
+        fds = self.open_fds()
+
+        result = file_engine.bulk_delete(target, max_workers=4)
+        self.assertEqual((result.failed, result.processed), (0, 76))
+        self.assertEqual(os.listdir(target), [])
+        self.assertEqual(snapshot(outside), {"keep.txt": "keep"})
+        self.assertEqual(self.open_fds(), fds)
+
+    def test_cancel_closes_directories(self):
+        target = self.folder("target")
+        make_tree(target, {f"d{i}/e{j}/f.txt": "x" for i in range(20) for j in range(20)})
+        fds = self.open_fds()
+        token = file_engine.CancelToken()
+        calls = []
+
+        def cancel_later(result):
+            calls.append(True)
+            if len(calls) == 10:
+                token.cancel()
+
+        result = file_engine.bulk_delete(target, max_workers=4, progress=cancel_later,
+                                         token=token)
+        self.assertTrue(result.cancelled)
+        self.assertEqual(self.open_fds(), fds)
+
+
+class CleanFilenamesTest(TempDirTest):
+    """清理文件名不能把文件移出所在的文件夹"""
+
+    def test_separator_in_replacement_rejected(self):
+        with self.assertRaises(ValueError):
+            file_engine.clean_filenames(self.root, [("x", "sub/y", False)])
+
+    def test_invalid_new_name_skipped(self):
+        for name in ("ab", "x.jpg"):
+            open(os.path.join(self.root, name), "w").close()
+        result = file_engine.clean_filenames(
+            self.root, [("ab", "..", False), (r"^x\.jpg$", ".", True)])
+        self.assertEqual((result.processed, result.skipped), (0, 2))
+        self.assertEqual(sorted(os.listdir(self.root)), ["ab", "x.jpg"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+rename_template 的单元测试
+用法: python -m unittest test_rename_template 或 python -m pytest
+"""
+
+import unittest
+
+from rename_template import RenameTemplate
+
+
+class PathSeparatorTest(unittest.TestCase):
+    """模板生成的文件名中不能有路径分隔符"""
+
+    def test_literal_separator_rejected(self):
+        with self.assertRaises(ValueError):
+            RenameTemplate("{brand}/{counter}{ext}")
+
+    def test_exif_date_separator_rejected(self):
+        for spec in ("%Y/%m/%d", "%D"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                RenameTemplate(f"{{exif_date:{spec}}}_{{counter}}{{ext}}")
+
+    def test_exif_date_without_separator_accepted(self):
+        RenameTemplate("{exif_date:%Y-%m-%d}_{counter}{ext}")
+
+    def test_bound_value_separator_rejected(self):
+        template = RenameTemplate()
+        for brand, date_str in (("a/b", "2024年01月01日"), ("brand", "2024/01/01")):
+            with self.subTest(brand=brand, date=date_str), self.assertRaises(ValueError):
+                template.bind("photos", brand, date_str)
+
+    def test_unused_field_not_checked(self):
+        bound = RenameTemplate("{brand}_{counter}{ext}").bind("photos", "brand", "2024/01/01")
+        self.assertEqual(bound.format(1, bound.values("x.jpg", 0, 0)), "brand_0001.jpg")
+
+
+if __name__ == "__main__":
+    unittest.main()